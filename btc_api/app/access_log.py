@@ -0,0 +1,161 @@
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict
+
+from app import config
+from app.stats import RequestStats
+
+LOGGER_NAME = "btc_api.access"
+
+# counts of a request copied to its log record
+LOGGED_COUNTS = ("utxos_fetched", "utxos_confirmed", "inputs_selected")
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record whose message is a dict as a single line of JSON."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = {"ts": round(record.created, 6)}
+        fields.update(record.msg)
+        return json.dumps(fields, separators=(",", ":"), default=str)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Enqueues records as they are, dropping (and counting) them if full.
+
+    The stock handler formats the record before enqueueing it, on the thread
+    of the request, the formatting is left to the listener's thread instead.
+    """
+
+    def __init__(self, q: queue.Queue):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class DrainingQueueListener(QueueListener):
+    """Listener which waits for room in a full queue to be stopped."""
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+class AccessLog:
+    """Writes structured (JSON) logs of sampled requests on a background thread.
+
+    Requests are sampled with probability `sample_rate`, failed requests are
+    always logged. The request's thread only builds the record and enqueues
+    it, a listener thread formats and writes it to `handler` (stdout by
+    default). Records are dropped while the queue is full, so a slow log
+    sink never blocks requests. The listener is started by the first record
+    logged in a process, so forked workers start their own.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = config.ACCESS_LOG_ENABLED,
+        sample_rate: float = config.ACCESS_LOG_SAMPLE_RATE,
+        max_queue: int = config.ACCESS_LOG_MAX_QUEUE,
+        handler: logging.Handler = None,
+    ):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.max_queue = max_queue
+        self.handler = handler or logging.StreamHandler(sys.stdout)
+        self.handler.setFormatter(JsonFormatter())
+        self.logged = 0
+        self._dropped = 0
+        # own generator, so sampling doesn't consume the global random state
+        self._random = random.Random()
+        self._logger = logging.Logger(LOGGER_NAME)
+        self._logger.setLevel(logging.INFO)
+        self._logger.propagate = False
+        self._queue_handler = None
+        self._listener = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def dropped(self) -> int:
+        handler = self._queue_handler
+        return self._dropped + (handler.dropped if handler else 0)
+
+    def start(self):
+        """Starts the listener thread unless it's running in this process."""
+
+        with self._lock:
+            if self._listener is not None and self._pid == os.getpid():
+                return
+            if self._queue_handler is not None:
+                # inherited from the parent process, whose thread is gone
+                self._dropped += self._queue_handler.dropped
+                self._logger.removeHandler(self._queue_handler)
+            q = queue.Queue(self.max_queue)
+            self._queue_handler = DroppingQueueHandler(q)
+            self._logger.addHandler(self._queue_handler)
+            self._listener = DrainingQueueListener(q, self.handler)
+            self._pid = os.getpid()
+            self._listener.start()
+
+    def stop(self):
+        """Writes the queued records and stops the listener thread."""
+
+        with self._lock:
+            if self._listener is not None and self._pid == os.getpid():
+                self._listener.stop()
+            self._listener = None
+            self._pid = None
+
+    def should_log(self, error: str = None) -> bool:
+        """Decides if the current request should be logged."""
+
+        if not self.enabled:
+            return False
+        return error is not None or self._random.random() < self.sample_rate
+
+    def log_request(
+        self,
+        endpoint: str,
+        duration: float,
+        stats: RequestStats,
+        error: str = None,
+        **fields: Any,
+    ):
+        """Logs a request, with its counts and stage timings, if sampled."""
+
+        if not self.should_log(error):
+            return
+        if self._pid != os.getpid():
+            self.start()
+
+        record: Dict[str, Any] = {"endpoint": endpoint}
+        record.update(fields)
+        counts = stats.counts
+        for name in LOGGED_COUNTS:
+            record[name] = counts.get(name)
+        info = stats.info
+        record["fee_kb"] = info.get("fee_kb")
+        record["fee"] = info.get("fee")
+        record["offload"] = info.get("offload")
+        record["stale"] = info.get("stale", False)
+        record["duration"] = round(duration, 6)
+        record["timings"] = {
+            stage: round(elapsed, 6) for stage, elapsed in stats.timings.items()
+        }
+        record["error"] = error
+        self.logged += 1
+        self._logger.info(record)
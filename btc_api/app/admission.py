@@ -0,0 +1,146 @@
+import threading
+import time
+from collections import Counter
+from typing import Optional, Tuple
+
+from app.payment_errors import ServerOverloaded, TooManyConcurrentRequests
+
+MAX_IN_FLIGHT = 8
+MAX_QUEUE = 16
+MAX_QUEUE_WAIT_SEC = 2.0
+MAX_PER_CLIENT = 4
+MAX_PER_SOURCE = 2
+
+# bounds of the Retry-After estimate (in seconds)
+MIN_RETRY_AFTER_SEC = 1.0
+MAX_RETRY_AFTER_SEC = 30.0
+# weight of the latest request in the moving average of request durations
+DURATION_SMOOTHING = 0.1
+
+CLIENT = "client"
+SOURCE_ADDRESS = "source_address"
+
+QUEUE_FULL = "queue_full"
+QUEUE_TIMEOUT = "queue_timeout"
+
+
+class AdmissionController:
+    """Bounds the number of requests processed at once, shedding the excess.
+
+    At most `max_in_flight` requests are processed concurrently and up to
+    `max_queue` more wait for a slot, each for at most `max_queue_wait`
+    seconds (or until its deadline). Requests finding the queue full, or
+    waiting too long, are rejected with ServerOverloaded. Requests of a
+    client or source address which already has `max_per_client` (or
+    `max_per_source`) requests admitted or waiting are rejected right away
+    with TooManyConcurrentRequests. Limits of 0 are disabled.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = MAX_IN_FLIGHT,
+        max_queue: int = MAX_QUEUE,
+        max_queue_wait: float = MAX_QUEUE_WAIT_SEC,
+        max_per_client: int = MAX_PER_CLIENT,
+        max_per_source: int = MAX_PER_SOURCE,
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.max_queue_wait = max_queue_wait
+        self.limits = {CLIENT: max_per_client, SOURCE_ADDRESS: max_per_source}
+        self.admitted = 0
+        self.rejected = Counter()
+        self._in_flight = 0
+        self._queued = 0
+        self._active = Counter()
+        self._avg_duration = 0.0
+        self._cond = threading.Condition()
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    def retry_after(self) -> float:
+        """Returns the estimated time (in seconds) until the queue drains."""
+
+        slots = max(1, self.max_in_flight)
+        estimate = self._avg_duration * (self._queued + 1) / slots
+        return min(MAX_RETRY_AFTER_SEC, max(MIN_RETRY_AFTER_SEC, estimate))
+
+    def _reject(self, reason: str, error: Exception):
+        self.rejected[reason] += 1
+        raise error
+
+    def acquire(
+        self, client: str, source_address: str, deadline: Optional[float] = None
+    ) -> Tuple:
+        """Admits a request, waiting for a slot if all are taken.
+
+        Returns a ticket to be passed to release once the request is done.
+        Raises ServerOverloaded or TooManyConcurrentRequests if rejected.
+        """
+
+        keys = tuple(
+            (scope, key)
+            for scope, key in [(CLIENT, client), (SOURCE_ADDRESS, source_address)]
+            if key and self.limits[scope]
+        )
+        with self._cond:
+            for scope, key in keys:
+                limit = self.limits[scope]
+                if self._active[(scope, key)] >= limit:
+                    self._reject(
+                        scope,
+                        TooManyConcurrentRequests(scope, limit, self.retry_after()),
+                    )
+
+            if self.max_in_flight and self._in_flight >= self.max_in_flight:
+                if self._queued >= self.max_queue:
+                    self._reject(
+                        QUEUE_FULL, ServerOverloaded(QUEUE_FULL, self.retry_after())
+                    )
+                wait_until = time.monotonic() + self.max_queue_wait
+                if deadline is not None:
+                    wait_until = min(wait_until, deadline)
+
+                self._queued += 1
+                self._active.update(keys)
+                try:
+                    while self._in_flight >= self.max_in_flight:
+                        remaining = wait_until - time.monotonic()
+                        if remaining <= 0:
+                            self._forget(keys)
+                            self._reject(
+                                QUEUE_TIMEOUT,
+                                ServerOverloaded(QUEUE_TIMEOUT, self.retry_after()),
+                            )
+                        self._cond.wait(remaining)
+                finally:
+                    self._queued -= 1
+            else:
+                self._active.update(keys)
+
+            self._in_flight += 1
+            self.admitted += 1
+        return keys, time.monotonic()
+
+    def release(self, ticket: Tuple):
+        """Frees the slot of a request admitted by acquire."""
+
+        keys, started = ticket
+        duration = time.monotonic() - started
+        with self._cond:
+            self._in_flight -= 1
+            self._forget(keys)
+            self._avg_duration += DURATION_SMOOTHING * (duration - self._avg_duration)
+            self._cond.notify()
+
+    def _forget(self, keys: Tuple):
+        self._active.subtract(keys)
+        for key in keys:
+            if self._active[key] <= 0:
+                del self._active[key]
@@ -1,20 +1,102 @@
-from flask import Flask, escape, request, jsonify
+import hmac
+import math
+import time
+from flask import Flask, Response, abort, escape, request, jsonify
 from werkzeug.exceptions import HTTPException, InternalServerError
-from app.errors import InvalidUsage, ErrorResponse, BAD_REQUEST, INTERNAL_SERVER_ERROR
+from app import config
+from app.access_log import AccessLog
+from app.admission import AdmissionController
+from app.config import REQUEST_DEADLINE_SEC, METRICS_ENABLED
+from app.errors import (
+    InvalidUsage,
+    ErrorResponse,
+    BAD_REQUEST,
+    INTERNAL_SERVER_ERROR,
+    SERVICE_UNAVAILABLE,
+)
+from app.idempotency import (
+    IdempotencyStore,
+    body_fingerprint,
+    IDEMPOTENCY_HEADER,
+    REPLAYED_HEADER,
+    MAX_KEY_LENGTH,
+)
 from app.payment import (
     PaymentTxRequest,
+    PaymentTxResponse,
+    parse_payment_tx_request,
+    parse_payment_quote_request,
+    parse_consolidation_request,
     process_payment_tx_request,
-    MIN_CONFIRMATIONS,
-    MIN_RELAY_FEE,
+    process_payment_quote_request,
+    process_consolidation_request,
+    unspent_fetcher,
+    unspent_source,
+    unspent_prefetcher,
+    unspent_snapshots,
+    selection_memo,
+    fee_oracles,
+)
+from app.metrics import (
+    record_consolidation,
+    record_request,
+    record_quote,
+    record_error,
+    render_metrics,
+    register_unspent_fetcher,
+    register_unspent_cache,
+    register_prefetcher,
+    register_admission,
+    register_fee_oracles,
+    register_access_log,
 )
-from app.wallet.exceptions import InsufficientFunds
+from app.memory import ADMIN_HEADER, MemoryTracer, memory_report
+from app.payment_errors import InvalidIdempotencyKey, RequestRejected
+from app.profiling import RequestProfiler, PROFILE_HEADER
+from app.routing import (
+    REAL_IP_HEADER,
+    SOURCE_ADDRESS_HEADER,
+    check_routing_header,
+    parse_networks,
+    resolve_client_address,
+    routing_key,
+)
+from app.stats import RequestStats
+from app.wallet.exceptions import InsufficientFunds, UnspentSourceUnavailable
 
 app = Flask(__name__)
 
+request_profiler = RequestProfiler()
+
+access_log = AccessLog()
+
+memory_tracer = MemoryTracer()
+
+idempotency_store = IdempotencyStore(
+    config.IDEMPOTENCY_MAX_ENTRIES, config.IDEMPOTENCY_TTL_SEC
+)
+
+admission = AdmissionController(
+    max_in_flight=config.ADMISSION_MAX_IN_FLIGHT,
+    max_queue=config.ADMISSION_MAX_QUEUE,
+    max_queue_wait=config.ADMISSION_MAX_QUEUE_WAIT_SEC,
+    max_per_client=config.ADMISSION_MAX_PER_CLIENT,
+    max_per_source=config.ADMISSION_MAX_PER_SOURCE,
+)
+trusted_proxies = parse_networks(config.TRUSTED_PROXIES)
+
+register_unspent_fetcher(unspent_fetcher)
+register_unspent_cache(unspent_source)
+register_prefetcher(unspent_prefetcher)
+register_fee_oracles(fee_oracles)
+register_admission(admission)
+register_access_log(access_log)
+
 
 def error_to_json_response(err: ErrorResponse):
     """Maps ErrorResponse to HTTP JSON response ."""
 
+    record_error(err.name)
     response = jsonify(err.to_dict())
     response.status_code = err.status_code
     return response
@@ -28,6 +110,15 @@ def handle_user_exception(e):
     return error_to_json_response(error)
 
 
+@app.errorhandler(RequestRejected)
+def handle_rejected_exception(e):
+    """Return JSON with Retry-After for requests shed by admission control."""
+
+    response = handle_user_exception(e)
+    response.headers["Retry-After"] = str(max(1, math.ceil(e.retry_after)))
+    return response
+
+
 @app.errorhandler(InsufficientFunds)
 def handle_wallet_exception(e):
     """Return JSON instead of HTML for InsufficientFunds errors."""
@@ -41,6 +132,21 @@ def handle_wallet_exception(e):
     return error_to_json_response(error)
 
 
+@app.errorhandler(UnspentSourceUnavailable)
+def handle_unavailable_exception(e):
+    """Return JSON 503 with Retry-After while the UTXO providers are unavailable."""
+
+    error = ErrorResponse(
+        SERVICE_UNAVAILABLE,
+        e.__class__.__name__,
+        e.message,
+        {"source": e.source, "retry_after": e.retry_after},
+    )
+    response = error_to_json_response(error)
+    response.headers["Retry-After"] = str(max(1, math.ceil(e.retry_after)))
+    return response
+
+
 @app.errorhandler(InternalServerError)
 def handle_500(e):
     """Return JSON instead of HTML for InternalServerError."""
@@ -75,8 +181,8 @@ def hello():
 @app.route("/payment_transactions", methods=["POST"])
 def payment_transactions():
     """
-    This endpoint will be used to create a raw transaction that spends from a P2PKH
-    address and that supports paying to multiple addresses (either P2PKH or P2SH).
+    This endpoint will be used to create a raw transaction that spends from P2PKH
+    addresses and that supports paying to multiple addresses (either P2PKH or P2SH).
 
     The endpoint should return a transaction that spends from the source address and
     that pays to the output addresses. An extra output for change should be included
@@ -86,12 +192,30 @@ def payment_transactions():
     Method: POST
     Request body (dictionary):
         source_address (string): The address to spend from
+        source_addresses (array of strings): The addresses to spend from (instead of source_address)
+        xpub (string): The xpub/tpub whose addresses to spend from (instead of source_address)
+        gap_limit (int): Number of consecutive unused xpub addresses to stop scanning at (default 20)
+        change_address (string): The address to send change to (default next xpub change address or source address)
         outputs (dictionary): A dictionary that maps addresses to amounts (in SAT)
-        fee_kb (int): The fee per kb in SAT
-        strategy (str): One of [greedy_max_secure|greedy_max_coins|greedy_min_coins|greedy_random]
+        fee_kb (int|str): The fee per kb in SAT, or "auto" to use the current fee-rate estimate (default 1000)
+        conf_target (int): Confirmation target in blocks for "auto" fee_kb, implies "auto" (default 6)
+        strategy (str): One of [greedy_max_secure|greedy_max_coins|greedy_min_coins|greedy_random|best_fit]
+        seed (int): Seeds greedy_random, making its selection reproducible (optional)
+        change_policy (str): One of [single|split], split change into outputs of the
+            denominations the UTXO pool is short of (default BTC_API_CHANGE_POLICY)
         min_confirmations (int): Min number of confirmations required to use UTXO as input (default 6)
         testnet (int): Is this a testnet transaction (default False)
 
+    Request headers:
+        Idempotency-Key (string): Replays the stored response of an earlier request
+            with the same key and body (a retry) instead of processing it again
+        X-Source-Address (string): The source address (the first of source_addresses,
+            or the xpub) NGINX routes the request by, returned in the response
+
+    Requests are rejected with 503 (service overloaded) or 429 (too many
+    concurrent requests of the client or source address) and a Retry-After
+    header when admission control sheds load.
+
     Response body (dictionary):
         raw (string): The unsigned raw transaction
         inputs (array of dicts): The inputs used
@@ -99,28 +223,347 @@ def payment_transactions():
             vout (int): The output number
             script_pub_key (string): The script pub key
             amount (int): The amount in SAT
+            address (string): The address spent from
+            path (string): Derivation path of the address relative to the xpub (xpub only)
+        change_address (string): The change address
+        fee_kb (int): The fee per kb in SAT used
+        stale (bool): Whether a cached UTXO set was used (providers unavailable)
+        utxo_age (float): Age of the cached UTXO set in seconds (only if stale)
+    """
+    started = time.monotonic()
+    deadline = started + REQUEST_DEADLINE_SEC
+    stats = RequestStats()
+    data = None
+    error = None
+
+    try:
+        if not request.is_json:
+            raise InvalidUsage(
+                "Check if the mimetype indicates JSON data, either application/json or application/*+json.",
+                BAD_REQUEST,
+            )
+
+        idempotency_key = request.headers.get(IDEMPOTENCY_HEADER)
+        if idempotency_key is not None:
+            if not 0 < len(idempotency_key) <= MAX_KEY_LENGTH:
+                raise InvalidIdempotencyKey(MAX_KEY_LENGTH)
+            replayed = idempotency_store.begin(
+                idempotency_key, body_fingerprint(request.get_data())
+            )
+            if replayed is not None:
+                stats.info["replayed"] = True
+                routed_key, response = replayed
+                with stats.stage("encode"):
+                    response = routed_response(response.to_dict(), routed_key)
+                response.headers[REPLAYED_HEADER] = "true"
+                return response
+
+        try:
+            with stats.stage("validate"):
+                data = parse_payment_tx_request(request.get_json())
+                check_routing_header(request.headers.get(SOURCE_ADDRESS_HEADER), data)
+            with stats.stage("admit"):
+                ticket = admission.acquire(
+                    client_address(), data.source_address, deadline
+                )
+            try:
+                response = run_payment_tx_request(data, deadline, stats)
+            finally:
+                admission.release(ticket)
+        except BaseException:
+            if idempotency_key is not None:
+                idempotency_store.abort(idempotency_key)
+            raise
+        if idempotency_key is not None:
+            # the routing key is stored for the header of replayed responses
+            idempotency_store.complete(idempotency_key, (routing_key(data), response))
+
+        with stats.stage("encode"):
+            return routed_response(response.to_dict(), routing_key(data))
+    except Exception as e:
+        error = e.__class__.__name__
+        raise
+    finally:
+        duration = time.monotonic() - started
+        strategy = data.strategy if data else None
+        network = data.requested_net if data else None
+        record_request(stats, duration, strategy, network)
+        access_log.log_request(
+            "payment_transactions",
+            duration,
+            stats,
+            error,
+            strategy=strategy,
+            network=network,
+        )
+
+
+@app.route("/payment_quotes", methods=["POST"])
+def payment_quotes():
+    """
+    This endpoint quotes the fee, change and size of the transaction that
+    /payment_transactions would create, for one or more strategies at once,
+    without creating the transaction. All strategies select from a single
+    fetch of the UTXOs.
+
+    URL: /payment_quotes
+    Method: POST
+    Request body (dictionary):
+        Same as /payment_transactions, and
+        strategies (array of strings): The strategies to quote (default [strategy])
+
+    Requests are admitted like /payment_transactions requests.
+
+    Response body (dictionary):
+        quotes (array of dicts): A quote per strategy, in the requested order
+            strategy (string): The strategy
+            fee (int): The fee in SAT
+            change_amount (int): The change in SAT (0 if no change output)
+            n_inputs (int): The number of inputs
+            vsize (int): The estimated size of the transaction in bytes
+        change_address (string): The change address
+        fee_kb (int): The fee per kb in SAT used
+        stale (bool): Whether a cached UTXO set was used (providers unavailable)
+        utxo_age (float): Age of the cached UTXO set in seconds (only if stale)
+    """
+    started = time.monotonic()
+    deadline = started + REQUEST_DEADLINE_SEC
+    stats = RequestStats()
+    data = None
+    quoted = None
+    error = None
+
+    try:
+        if not request.is_json:
+            raise InvalidUsage(
+                "Check if the mimetype indicates JSON data, either application/json or application/*+json.",
+                BAD_REQUEST,
+            )
+
+        with stats.stage("validate"):
+            data = parse_payment_quote_request(request.get_json())
+            check_routing_header(request.headers.get(SOURCE_ADDRESS_HEADER), data)
+        with stats.stage("admit"):
+            ticket = admission.acquire(client_address(), data.source_address, deadline)
+        try:
+            response = process_payment_quote_request(data, stats)
+        finally:
+            admission.release(ticket)
+        quoted = data.strategies
+
+        with stats.stage("encode"):
+            return routed_response(response.to_dict(), routing_key(data))
+    except Exception as e:
+        error = e.__class__.__name__
+        raise
+    finally:
+        duration = time.monotonic() - started
+        network = data.requested_net if data else None
+        record_quote(duration, quoted, network)
+        access_log.log_request(
+            "payment_quotes",
+            duration,
+            stats,
+            error,
+            strategy=",".join(data.strategies) if data else None,
+            network=network,
+        )
+
+
+@app.route("/consolidations", methods=["POST"])
+def consolidations():
+    """
+    This endpoint plans and creates the raw unsigned transactions (sweeps)
+    consolidating the many small UTXOs of a source wallet into a few outputs.
+
+    URL: /consolidations
+    Method: POST
+    Request body (dictionary):
+        source_address, source_addresses, xpub, gap_limit, fee_kb, conf_target,
+        min_confirmations, testnet: Same as /payment_transactions
+        change_address (string): The address to sweep to (default next xpub change address or source address)
+        max_amount (int): Only sweep UTXOs of at most this amount in SAT (default all)
+        max_inputs (int): Max number of inputs per sweep (default 500)
+        n_outputs (int): Number of outputs per sweep (default 1)
+
+    UTXOs worth less than the fee of spending them are not swept, and sweeps
+    are split to stay within the standard transaction size. Requests are
+    admitted like /payment_transactions requests.
+
+    Response body (dictionary):
+        sweeps (array of dicts): The planned transactions
+            raw (string): The unsigned raw transaction
+            inputs (array of dicts): The inputs used (as in /payment_transactions)
+            outputs (array of dicts): The outputs (address, amount)
+            fee (int): The fee in SAT
+            vsize (int): The estimated size of the transaction in bytes
+        destination (string): The address swept to
+        fee_kb (int): The fee per kb in SAT used
+        utxos (int): The number of UTXOs with min_confirmations
+        eligible (int): The number of UTXOs of at most max_amount
+        uneconomical (int): The number of eligible UTXOs not worth spending
+        utxos_after (int): The number of UTXOs left once the sweeps confirm
+        stale (bool): Whether a cached UTXO set was used (providers unavailable)
+        utxo_age (float): Age of the cached UTXO set in seconds (only if stale)
     """
-    if not request.is_json:
-        raise InvalidUsage(
-            "Check if the mimetype indicates JSON data, either application/json or application/*+json.",
-            BAD_REQUEST,
+    started = time.monotonic()
+    deadline = started + REQUEST_DEADLINE_SEC
+    stats = RequestStats()
+    data = None
+    error = None
+
+    try:
+        if not request.is_json:
+            raise InvalidUsage(
+                "Check if the mimetype indicates JSON data, either application/json or application/*+json.",
+                BAD_REQUEST,
+            )
+
+        with stats.stage("validate"):
+            data = parse_consolidation_request(request.get_json())
+            check_routing_header(request.headers.get(SOURCE_ADDRESS_HEADER), data)
+        with stats.stage("admit"):
+            ticket = admission.acquire(client_address(), data.source_address, deadline)
+        try:
+            response = process_consolidation_request(data, stats)
+        finally:
+            admission.release(ticket)
+
+        with stats.stage("encode"):
+            return routed_response(response.to_dict(), routing_key(data))
+    except Exception as e:
+        error = e.__class__.__name__
+        raise
+    finally:
+        duration = time.monotonic() - started
+        network = data.requested_net if data else None
+        record_consolidation(stats, duration, network)
+        access_log.log_request(
+            "consolidations", duration, stats, error, network=network
         )
 
-    data_json = request.get_json()
-    data = PaymentTxRequest(
-        data_json.get("source_address", ""),
-        data_json.get("outputs", ""),
-        data_json.get("fee_kb", MIN_RELAY_FEE),
-        data_json.get("strategy", "greedy_random"),
-        data_json.get("min_confirmations", MIN_CONFIRMATIONS),
-        data_json.get("testnet", False),
+
+def client_address() -> str:
+    """Returns the address of the client (as seen by NGINX if proxied)."""
+
+    return resolve_client_address(
+        request.remote_addr, request.headers.get(REAL_IP_HEADER), trusted_proxies
+    )
+
+
+def routed_response(body: dict, key: str) -> Response:
+    """Returns the JSON response, with the routing header set to key."""
+
+    response = jsonify(body)
+    response.headers[SOURCE_ADDRESS_HEADER] = key
+    return response
+
+
+def run_payment_tx_request(
+    data: PaymentTxRequest, deadline: float, stats: RequestStats
+) -> PaymentTxResponse:
+    """Processes a /payment_transactions request, profiling it if sampled."""
+
+    if not request_profiler.should_profile(request.headers.get(PROFILE_HEADER)):
+        return process_payment_tx_request(data, deadline, stats)
+
+    return request_profiler.run(
+        {
+            "strategy": data.strategy,
+            "network": data.requested_net,
+            "source_address": data.source_address,
+            "n_outputs": len(data.outputs),
+        },
+        stats,
+        process_payment_tx_request,
+        data,
+        deadline,
+        stats,
+    )
+
+
+@app.route("/metrics")
+def metrics():
+    """Exposes service metrics in the Prometheus text format."""
+
+    if not METRICS_ENABLED:
+        abort(404)
+
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
+
+
+def check_admin_token():
+    """Hides admin endpoints unless the request carries the admin token."""
+
+    token = request.headers.get(ADMIN_HEADER)
+    if not config.ADMIN_TOKEN or not token:
+        abort(404)
+    if not hmac.compare_digest(config.ADMIN_TOKEN, token):
+        abort(404)
+
+
+@app.route("/admin/memory")
+def admin_memory():
+    """
+    Reports the memory used by the worker serving the request.
+
+    URL: /admin/memory?top=10&sample=100
+    Method: GET
+    Request headers:
+        X-Admin-Token (string): The admin token (BTC_API_ADMIN_TOKEN)
+
+    Response body (dictionary):
+        rss (int): Resident set size of the process in bytes
+        peak_rss (int): Peak resident set size of the process in bytes
+        structures (dictionary): Estimated usage of the caches by name
+            entries (int): The number of entries
+            sampled (int): The number of (most recently used) entries measured
+            bytes_per_entry (int): The mean size of the measured entries
+            bytes (int): The estimated size of all entries
+            utxos, largest_set, bytes_per_utxo (int): UTXO counts (unspent_cache only)
+        tracemalloc (dictionary): Traced allocations (while tracing)
+            tracing (bool): Whether allocations are traced
+            current, peak (int): Size of the traced allocations in bytes
+            top (array of dicts): The top allocators (location, size, count)
+            diff (array of dicts): The top changes since the baseline snapshot
+                (location, size, count, size_diff, count_diff)
+    """
+    check_admin_token()
+    top = min(max(request.args.get("top", 10, type=int), 1), 100)
+    sample = min(max(request.args.get("sample", 100, type=int), 1), 10000)
+    structures = {
+        "selection_memo": selection_memo,
+        "idempotency_store": idempotency_store,
+    }
+    return jsonify(
+        memory_report(memory_tracer, structures, unspent_source, top, sample)
     )
 
-    response = process_payment_tx_request(data)
-    return jsonify(response.to_dict())
+
+@app.route("/admin/memory/snapshot", methods=["POST", "DELETE"])
+def admin_memory_snapshot():
+    """
+    Starts tracing allocations and takes the baseline snapshot (POST), or
+    stops tracing (DELETE).
+
+    URL: /admin/memory/snapshot
+    Method: POST|DELETE
+    Request headers:
+        X-Admin-Token (string): The admin token (BTC_API_ADMIN_TOKEN)
+    """
+    check_admin_token()
+    if request.method == "POST":
+        memory_tracer.take_baseline()
+    else:
+        memory_tracer.stop()
+    return jsonify({"tracing": memory_tracer.tracing})
 
 
 def app_run():
+    unspent_snapshots.start()
+    for oracle in fee_oracles.values():
+        oracle.start()
     use_debugger = app.debug
     use_reloader = app.debug
     app.run(
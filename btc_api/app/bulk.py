@@ -0,0 +1,540 @@
+"""Builds unsigned payment transactions for a file of payment requests.
+
+Reads payment requests from a JSONL file (one /payment_transactions request
+body per line, with an optional "id") or a CSV file (one payout per row with
+`source_address`, `address` and `amount` columns, optional request columns
+like `fee_kb` or `strategy`, and rows with the same `id` paying from the same
+transaction), validates them, fetches the UTXOs of their sources from the
+configured providers or from a snapshot file and builds the transactions in
+a process pool. Results (or errors) are streamed to a JSONL file in
+completion order, each line carrying the id (or line number) of its request.
+
+Requests whose UTXO sets overlap (e.g. payouts from the same source address)
+are built one after another in the same task, and coins spent by one of them
+aren't available to the next ones, so no coin is spent twice in a batch.
+
+Usage (from the btc_api directory):
+
+    $ python -m app.bulk payouts.jsonl --output transactions.jsonl [--snapshot utxos.json]
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
+from dataclasses import dataclass
+from multiprocessing import get_context
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from bit.wallet import Unspent
+
+from app.errors import (
+    ErrorResponse,
+    InvalidUsage,
+    BAD_REQUEST,
+    INTERNAL_SERVER_ERROR,
+    SERVICE_UNAVAILABLE,
+)
+from app.offload import select_and_serialize
+from app.payment import (
+    PaymentTxRequest,
+    PaymentTxResponse,
+    AUTO_FEE,
+    fee_oracles,
+    fetch_source_unspents,
+    parse_payment_tx_request,
+)
+from app.strategies import coin_select_strategies
+from app.wallet.cache import CachedUnspents
+from app.wallet.compact import CompactUnspents
+from app.wallet.exceptions import (
+    EmptyUnspentTransactionOutputSet,
+    InsufficientFunds,
+    NoConfirmedTransactionsFound,
+    NoEconomicalTransactionsFound,
+    UnspentSourceUnavailable,
+)
+from app.wallet.query import ADDRESS_SEPARATOR
+from app.wallet.sources import UnspentFanout, SourceUnspents
+from app.wallet.transaction import TxContext, Output
+
+WORKERS = os.cpu_count() or 1
+FETCH_THREADS = 8
+PROGRESS_INTERVAL_SEC = 5.0
+# groups submitted to the pool per worker, bounds memory of pending results
+PENDING_PER_WORKER = 4
+
+# request columns of CSV files (next to the payout address and amount)
+CSV_INT_COLUMNS = {"min_confirmations", "conf_target", "gap_limit"}
+CSV_BOOL_COLUMNS = {"testnet"}
+CSV_STR_COLUMNS = {
+    "source_address",
+    "strategy",
+    "xpub",
+    "change_address",
+    "change_policy",
+}
+
+
+class SnapshotUnspents:
+    """Serves UTXO sets from a JSON file mapping addresses to their UTXOs.
+
+    UTXOs are objects with `amount`, `confirmations`, `script`, `txid` and
+    `txindex` keys (as in `Unspent.to_dict()`). Addresses missing from the
+    snapshot have no UTXOs.
+    """
+
+    def __init__(self, unspents: Dict[str, List[Unspent]]):
+        self.unspents = unspents
+
+    @classmethod
+    def load(cls, path: str) -> "SnapshotUnspents":
+        with open(path) as f:
+            data = json.load(f)
+        return cls(
+            {
+                address: [Unspent(**utxo) for utxo in utxos]
+                for address, utxos in data.items()
+            }
+        )
+
+    def lookup(self, address: str, testnet: bool = False) -> CachedUnspents:
+        utxos = []
+        for a in address.split(ADDRESS_SEPARATOR):
+            utxos.extend(self.unspents.get(a, ()))
+        return CachedUnspents(utxos)
+
+    def lookup_many(
+        self, addresses: List[str], testnet: bool = False
+    ) -> Dict[str, CachedUnspents]:
+        return {a: CachedUnspents(list(self.unspents.get(a, ()))) for a in addresses}
+
+    # all sets are local, so all are as good as cached
+    cached = lookup_many
+
+    def get_unspent(self, address: str, testnet: bool = False) -> List[Unspent]:
+        return self.lookup(address, testnet).utxos
+
+
+@dataclass
+class BulkItem:
+    """Class representing a validated request of a bulk run and its UTXOs."""
+
+    id: str
+    request: PaymentTxRequest
+    fee_kb: int
+    unspents: SourceUnspents
+    candidates: List[Unspent]
+
+    @property
+    def change_address(self) -> str:
+        # change goes back to the first source address unless another one is known
+        return (
+            self.request.change_address
+            or self.unspents.change_address
+            or self.request.source_address
+        )
+
+
+def read_requests(path: str) -> Iterator[Tuple[str, dict]]:
+    """Yields (id, request body) of the requests in a JSONL or CSV file."""
+
+    with open(path, newline="") as f:
+        if path.endswith(".csv"):
+            yield from _read_csv(f)
+            return
+        for n, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+            except ValueError as err:
+                yield str(n), {"_error": f"Invalid JSON: {err}"}
+                continue
+            if not isinstance(data, dict):
+                yield str(n), {"_error": "Request must be a JSON object."}
+                continue
+            yield str(data.pop("id", n)), data
+
+
+def _read_csv(f) -> Iterator[Tuple[str, dict]]:
+    request_id = data = None
+    for n, row in enumerate(csv.DictReader(f), 2):
+        row_id = row.get("id") or str(n)
+        if row_id != request_id:
+            if data is not None:
+                yield request_id, data
+            request_id, data = row_id, _csv_request(row)
+        try:
+            data["outputs"][row["address"]] = int(row["amount"])
+        except (KeyError, TypeError, ValueError):
+            data["outputs"][row.get("address")] = row.get("amount")
+    if data is not None:
+        yield request_id, data
+
+
+def _csv_request(row: Dict[str, str]) -> dict:
+    data = {"outputs": {}}
+    for column, value in row.items():
+        if value in (None, ""):
+            continue
+        if column in CSV_STR_COLUMNS:
+            data[column] = value
+        elif column in CSV_INT_COLUMNS:
+            data[column] = int(value) if value.isdigit() else value
+        elif column in CSV_BOOL_COLUMNS:
+            data[column] = value.lower() in ("1", "true", "yes")
+        elif column == "fee_kb":
+            data[column] = int(value) if value.isdigit() else value
+        elif column == "source_addresses":
+            data[column] = value.split(ADDRESS_SEPARATOR)
+    return data
+
+
+def error_result(request_id: str, err: Exception) -> dict:
+    """Returns the output line of a failed request (as the API error body)."""
+
+    name = err.__class__.__name__
+    if isinstance(err, InvalidUsage):
+        error = ErrorResponse(err.status_code, name, err.message, err.payload)
+    elif isinstance(err, InsufficientFunds):
+        error = ErrorResponse(
+            BAD_REQUEST,
+            name,
+            err.message,
+            {"address": err.address, "balance": err.balance},
+        )
+    elif isinstance(err, UnspentSourceUnavailable):
+        error = ErrorResponse(
+            SERVICE_UNAVAILABLE,
+            name,
+            err.message,
+            {"source": err.source, "retry_after": err.retry_after},
+        )
+    else:
+        error = ErrorResponse(INTERNAL_SERVER_ERROR, name, str(err))
+    return {"id": request_id, "error": error.to_dict()}
+
+
+def validate(data: dict) -> Tuple[PaymentTxRequest, int]:
+    """Validates a request body, returns the request and its fee_kb."""
+
+    if "_error" in data:
+        raise InvalidUsage(data["_error"])
+    request = parse_payment_tx_request(data)
+
+    fee_kb = request.fee_kb
+    if fee_kb == AUTO_FEE:
+        fee_kb = fee_oracles[request.testnet].fee_kb(request.conf_target)
+    return request, fee_kb
+
+
+def source_key(request: PaymentTxRequest) -> Tuple:
+    """Returns the key of the source wallet of request."""
+
+    return (
+        request.testnet,
+        request.xpub or tuple(request.source_addresses),
+        request.gap_limit,
+    )
+
+
+def spendable(request: PaymentTxRequest, unspents: SourceUnspents) -> List[Unspent]:
+    """Returns the UTXOs of unspents with enough confirmations for request."""
+
+    if not unspents.utxos:
+        raise EmptyUnspentTransactionOutputSet(request.source_address)
+    candidates = [
+        u for u in unspents.utxos if int(u.confirmations) >= request.min_confirmations
+    ]
+    if not candidates:
+        raise NoConfirmedTransactionsFound(
+            request.source_address, request.min_confirmations
+        )
+    return candidates
+
+
+def group_items(items: List[BulkItem]) -> List[List[int]]:
+    """Groups (indexes of) items whose candidate UTXOs overlap.
+
+    Items of a group are kept in input order, the largest groups come first.
+    """
+
+    parent = list(range(len(items)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    owner = {}
+    for i, item in enumerate(items):
+        for utxo in item.candidates:
+            j = owner.setdefault((utxo.txid, utxo.txindex), i)
+            if j != i:
+                parent[find(i)] = find(j)
+
+    groups = {}
+    for i in range(len(items)):
+        groups.setdefault(find(i), []).append(i)
+    return sorted(groups.values(), key=len, reverse=True)
+
+
+def pack_group(items: List[BulkItem], group: List[int]):
+    """Packs the items of a group into plain values for a pool task.
+
+    The UTXOs of the group are packed once (compact), and items refer to
+    them by their positions, items with the same candidates sharing them.
+    """
+
+    positions = {}
+    utxos = []
+    set_numbers = {}
+    candidate_sets = []
+    requests = []
+    for i in group:
+        item = items[i]
+        keys = tuple((u.txid, u.txindex) for u in item.candidates)
+        set_no = set_numbers.get(keys)
+        if set_no is None:
+            for utxo, key in zip(item.candidates, keys):
+                if key not in positions:
+                    positions[key] = len(utxos)
+                    utxos.append(utxo)
+            set_no = set_numbers[keys] = len(candidate_sets)
+            candidate_sets.append([positions[key] for key in keys])
+        requests.append(
+            (
+                i,
+                item.request.strategy,
+                set_no,
+                list(item.request.outputs.items()),
+                item.fee_kb,
+                item.request.source_address,
+                item.change_address,
+                item.request.seed,
+                item.request.change_profile,
+            )
+        )
+    return CompactUnspents.from_unspents(utxos), candidate_sets, requests, utxos
+
+
+def build_group(utxos: CompactUnspents, candidate_sets, requests):
+    """Pool task: builds the transactions of a group one after another.
+
+    Returns (item index, selected UTXO positions, raw) or (item index, error)
+    for each request. Selected UTXOs aren't available to the next requests,
+    UTXOs worth less than the fee of spending them aren't available at all.
+    """
+
+    unspents = utxos.to_unspents()
+    economical = {}
+    spent = set()
+    results = []
+    for (
+        i,
+        strategy_name,
+        set_no,
+        outputs,
+        fee_kb,
+        address,
+        change_address,
+        seed,
+        change_profile,
+    ) in requests:
+        if fee_kb not in economical:
+            economical[fee_kb] = set(utxos.economical(fee_kb))
+        unspent = [j for j in candidate_sets[set_no] if j not in spent]
+        available = [j for j in unspent if j in economical[fee_kb]]
+        if unspent and not available:
+            balance = sum(utxos.amounts[j] for j in unspent)
+            results.append((i, NoEconomicalTransactionsFound(address, balance, fee_kb)))
+            continue
+        inputs = [unspents[j] for j in available]
+        context = TxContext(
+            address,
+            inputs,
+            [Output(addr, int(amount)) for addr, amount in outputs],
+            fee_kb,
+            change_address,
+            seed,
+            change_profile,
+        )
+        try:
+            selected, raw = select_and_serialize(
+                coin_select_strategies[strategy_name], context
+            )
+        except Exception as err:
+            results.append((i, err))
+            continue
+        selected_ids = {id(utxo) for utxo in selected.inputs}
+        positions = [j for j in available if id(unspents[j]) in selected_ids]
+        spent.update(positions)
+        results.append((i, positions, raw))
+    return results
+
+
+def run(
+    path: str,
+    output,
+    fanout: Optional[UnspentFanout] = None,
+    workers: int = WORKERS,
+    fetch_threads: int = FETCH_THREADS,
+    progress=sys.stderr,
+    progress_interval: float = PROGRESS_INTERVAL_SEC,
+) -> Dict[str, int]:
+    """Builds the transactions of the requests in path, writes results to output.
+
+    Uses the configured UTXO providers unless `fanout` is given, and runs the
+    pool tasks inline if `workers` is 0. Returns counts of the requests.
+    """
+
+    started = time.monotonic()
+    counts = {"requests": 0, "built": 0, "failed": 0}
+
+    def write(result: dict):
+        output.write(json.dumps(result) + "\n")
+        counts["built" if "error" not in result else "failed"] += 1
+
+    requests = []
+    for request_id, data in read_requests(path):
+        counts["requests"] += 1
+        try:
+            requests.append((request_id,) + validate(data))
+        except Exception as err:
+            write(error_result(request_id, err))
+
+    # the UTXOs of each source wallet are fetched once, sources in parallel
+    sources = {}
+    for _, request, _ in requests:
+        sources.setdefault(source_key(request), request)
+
+    def fetch(request):
+        try:
+            return fetch_source_unspents(request, fanout)
+        except Exception as err:
+            return err
+
+    with ThreadPoolExecutor(max_workers=max(1, fetch_threads)) as executor:
+        fetched = dict(zip(sources, executor.map(fetch, sources.values())))
+
+    items = []
+    for request_id, request, fee_kb in requests:
+        unspents = fetched[source_key(request)]
+        try:
+            if isinstance(unspents, Exception):
+                raise unspents
+            candidates = spendable(request, unspents)
+        except Exception as err:
+            write(error_result(request_id, err))
+            continue
+        items.append(BulkItem(request_id, request, fee_kb, unspents, candidates))
+
+    last_report = time.monotonic()
+
+    def report(final=False):
+        nonlocal last_report
+        now = time.monotonic()
+        if not final and now - last_report < progress_interval:
+            return
+        last_report = now
+        done = counts["built"] + counts["failed"]
+        elapsed = now - started
+        print(
+            f"{done}/{counts['requests']} requests, {counts['failed']} failed, "
+            f"{done / elapsed if elapsed else 0:.1f} requests/s",
+            file=progress,
+        )
+
+    def collect(packed_utxos, results):
+        for result in results:
+            item = items[result[0]]
+            if len(result) == 2:
+                write(error_result(item.id, result[1]))
+                continue
+            _, positions, raw = result
+            inputs = [packed_utxos[j] for j in positions]
+            input_addresses = [item.unspents.owner(utxo) for utxo in inputs]
+            input_paths = None
+            if item.request.xpub is not None:
+                input_paths = [item.unspents.path(a) for a in input_addresses]
+            response = PaymentTxResponse(
+                raw,
+                inputs,
+                item.fee_kb,
+                item.unspents.stale,
+                item.unspents.age,
+                input_addresses,
+                input_paths,
+                item.change_address,
+            )
+            write(dict(response.to_dict(), id=item.id))
+        report()
+
+    groups = (pack_group(items, group) for group in group_items(items))
+    if workers <= 0:
+        for utxos, candidate_sets, tasks, packed_utxos in groups:
+            collect(packed_utxos, build_group(utxos, candidate_sets, tasks))
+    else:
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=get_context("spawn")
+        ) as pool:
+            pending = {}
+            for utxos, candidate_sets, tasks, packed_utxos in groups:
+                future = pool.submit(build_group, utxos, candidate_sets, tasks)
+                pending[future] = packed_utxos
+                if len(pending) >= workers * PENDING_PER_WORKER:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        collect(pending.pop(future), future.result())
+            for future in as_completed(list(pending)):
+                collect(pending.pop(future), future.result())
+
+    report(final=True)
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("input", help="payment requests (.jsonl or .csv)")
+    parser.add_argument("--output", default="-", help="results file (JSONL)")
+    parser.add_argument(
+        "--snapshot", help="JSON file of UTXOs by address (instead of the providers)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=WORKERS,
+        help="number of processes building transactions (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--fetch-threads",
+        type=int,
+        default=FETCH_THREADS,
+        help="number of UTXO sets fetched in parallel (default: %(default)s)",
+    )
+    args = parser.parse_args(argv)
+
+    fanout = None
+    if args.snapshot:
+        fanout = UnspentFanout(SnapshotUnspents.load(args.snapshot))
+
+    if args.output == "-":
+        counts = run(args.input, sys.stdout, fanout, args.workers, args.fetch_threads)
+    else:
+        with open(args.output, "w") as output:
+            counts = run(args.input, output, fanout, args.workers, args.fetch_threads)
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
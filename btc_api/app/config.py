@@ -0,0 +1,165 @@
+"""Service configuration.
+
+Settings are read from environment variables prefixed with ``BTC_API_`` so
+they can be tuned per deployment without code changes.
+"""
+import os
+from typing import List
+
+ENV_PREFIX = "BTC_API_"
+
+
+def env_str(name: str, default: str) -> str:
+    """Reads a string setting from the environment."""
+
+    return os.environ.get(ENV_PREFIX + name, default)
+
+
+def env_int(name: str, default: int) -> int:
+    """Reads an integer setting from the environment."""
+
+    return int(env_str(name, default))
+
+
+def env_float(name: str, default: float) -> float:
+    """Reads a float setting from the environment."""
+
+    return float(env_str(name, default))
+
+
+def env_list(name: str, default: str) -> List[str]:
+    """Reads a comma separated list setting from the environment."""
+
+    return [item.strip() for item in env_str(name, default).split(",") if item.strip()]
+
+
+def env_bool(name: str, default: bool) -> bool:
+    """Reads a boolean setting from the environment."""
+
+    value = os.environ.get(ENV_PREFIX + name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# Time budget for a single /payment_transactions request
+REQUEST_DEADLINE_SEC = env_float("REQUEST_DEADLINE_SEC", 8.0)
+
+# Base URLs of blockchain.info compatible UTXO providers (in order of preference)
+UNSPENT_URLS_MAINNET = env_list("UNSPENT_URLS_MAINNET", "https://blockchain.info")
+UNSPENT_URLS_TESTNET = env_list(
+    "UNSPENT_URLS_TESTNET", "https://testnet.blockchain.info"
+)
+UNSPENT_TIMEOUT_SEC = env_float("UNSPENT_TIMEOUT_SEC", 5.0)
+
+# Hedging of slow UTXO requests (delay is the provider's latency quantile)
+HEDGE_QUANTILE = env_float("HEDGE_QUANTILE", 0.95)
+HEDGE_MIN_DELAY_SEC = env_float("HEDGE_MIN_DELAY_SEC", 0.05)
+HEDGE_MAX_DELAY_SEC = env_float("HEDGE_MAX_DELAY_SEC", 1.0)
+
+# Addresses of multi-address and xpub source wallets are fetched in batches of
+# this size, batches in parallel (max number of addresses per request)
+UNSPENT_BATCH_SIZE = env_int("UNSPENT_BATCH_SIZE", 50)
+UNSPENT_FANOUT_THREADS = env_int("UNSPENT_FANOUT_THREADS", 8)
+MAX_SOURCE_ADDRESSES = env_int("MAX_SOURCE_ADDRESSES", 1000)
+
+# Circuit breaker around the UTXO providers
+BREAKER_FAILURE_THRESHOLD = env_int("BREAKER_FAILURE_THRESHOLD", 5)
+BREAKER_RESET_SEC = env_float("BREAKER_RESET_SEC", 30.0)
+
+# Cached UTXO sets: served without refetching while fresh, and as stale (up to
+# the max age, 0 disables it) while the providers are unavailable
+UNSPENT_FRESH_TTL_SEC = env_float("UNSPENT_FRESH_TTL_SEC", 0.0)
+UNSPENT_MAX_STALE_SEC = env_float("UNSPENT_MAX_STALE_SEC", 300.0)
+UNSPENT_CACHE_MAX_ENTRIES = env_int("UNSPENT_CACHE_MAX_ENTRIES", 10000)
+
+# Cached UTXO sets are written to this snapshot file periodically (and by
+# exiting workers) and restored from it after restarts (empty disables it)
+UNSPENT_SNAPSHOT_PATH = env_str("UNSPENT_SNAPSHOT_PATH", "")
+UNSPENT_SNAPSHOT_INTERVAL_SEC = env_float("UNSPENT_SNAPSHOT_INTERVAL_SEC", 60.0)
+
+# Refresh-ahead of the cached UTXO sets of the most looked up (sampled) source
+# addresses, within an upstream request budget (requires a fresh TTL, a budget
+# of 0 disables it)
+PREFETCH_TOP_K = env_int("PREFETCH_TOP_K", 100)
+PREFETCH_SAMPLE_RATE = env_float("PREFETCH_SAMPLE_RATE", 0.1)
+PREFETCH_AHEAD_SEC = env_float("PREFETCH_AHEAD_SEC", 5.0)
+PREFETCH_BUDGET_PER_SEC = env_float("PREFETCH_BUDGET_PER_SEC", 5.0)
+PREFETCH_INTERVAL_SEC = env_float("PREFETCH_INTERVAL_SEC", 1.0)
+PREFETCH_HALF_LIFE_SEC = env_float("PREFETCH_HALF_LIFE_SEC", 60.0)
+
+# Fee-rate estimates used for "auto" fee_kb (Esplora API base URLs, or file://
+# URLs of JSON files mapping confirmation targets to sat/kB)
+FEE_SOURCE_MAINNET = env_str("FEE_SOURCE_MAINNET", "https://blockstream.info/api")
+FEE_SOURCE_TESTNET = env_str(
+    "FEE_SOURCE_TESTNET", "https://blockstream.info/testnet/api"
+)
+FEE_REFRESH_SEC = env_float("FEE_REFRESH_SEC", 60.0)
+FEE_MAX_AGE_SEC = env_float("FEE_MAX_AGE_SEC", 900.0)
+
+# Responses replayed for retries with the same Idempotency-Key header
+IDEMPOTENCY_TTL_SEC = env_float("IDEMPOTENCY_TTL_SEC", 600.0)
+IDEMPOTENCY_MAX_ENTRIES = env_int("IDEMPOTENCY_MAX_ENTRIES", 2000)
+
+# Selections of deterministic strategies reused for identical UTXO sets and
+# transaction parameters (0 entries disables it)
+SELECTION_MEMO_TTL_SEC = env_float("SELECTION_MEMO_TTL_SEC", 300.0)
+SELECTION_MEMO_MAX_ENTRIES = env_int("SELECTION_MEMO_MAX_ENTRIES", 1000)
+
+# Admission control of /payment_transactions: requests processed at once,
+# waiting for a slot (and for how long), and processed or waiting per client
+# and per source address (0 disables a limit)
+ADMISSION_MAX_IN_FLIGHT = env_int("ADMISSION_MAX_IN_FLIGHT", 8)
+ADMISSION_MAX_QUEUE = env_int("ADMISSION_MAX_QUEUE", 16)
+ADMISSION_MAX_QUEUE_WAIT_SEC = env_float("ADMISSION_MAX_QUEUE_WAIT_SEC", 2.0)
+ADMISSION_MAX_PER_CLIENT = env_int("ADMISSION_MAX_PER_CLIENT", 4)
+ADMISSION_MAX_PER_SOURCE = env_int("ADMISSION_MAX_PER_SOURCE", 2)
+# proxies (addresses or networks) whose X-Real-IP header identifies the client
+TRUSTED_PROXIES = env_list(
+    "TRUSTED_PROXIES", "127.0.0.1,::1,10.0.0.0/8,172.16.0.0/12,192.168.0.0/16"
+)
+
+# Coin selection offloading to a process pool (0 workers disables the pool)
+OFFLOAD_MAX_WORKERS = env_int("OFFLOAD_MAX_WORKERS", 2)
+OFFLOAD_MAX_PENDING = env_int("OFFLOAD_MAX_PENDING", 8)
+OFFLOAD_UTXO_THRESHOLD = env_int("OFFLOAD_UTXO_THRESHOLD", 2000)
+OFFLOAD_FALLBACK_STRATEGY = env_str("OFFLOAD_FALLBACK_STRATEGY", "greedy_min_coins")
+
+# Prometheus metrics exported on /metrics
+METRICS_ENABLED = env_bool("METRICS_ENABLED", True)
+# directory of the metrics of all worker processes (multiprocess mode):
+# prometheus_client < 0.10 only reads the lowercase variable and newer
+# versions prefer the uppercase one, so either is accepted and both are set
+PROMETHEUS_MULTIPROC_DIR = os.environ.get(
+    "PROMETHEUS_MULTIPROC_DIR", os.environ.get("prometheus_multiproc_dir", "")
+)
+if PROMETHEUS_MULTIPROC_DIR:
+    os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", PROMETHEUS_MULTIPROC_DIR)
+    os.environ.setdefault("prometheus_multiproc_dir", PROMETHEUS_MULTIPROC_DIR)
+
+# Request profiling (sampled when enabled, or forced by the profile token header)
+PROFILE_ENABLED = env_bool("PROFILE_ENABLED", False)
+PROFILE_SAMPLE_RATE = env_float("PROFILE_SAMPLE_RATE", 0.01)
+PROFILE_DIR = env_str("PROFILE_DIR", "/tmp/btc_api_profiles")
+PROFILE_TOKEN = env_str("PROFILE_TOKEN", "")
+
+# Structured (JSON) logs of sampled requests, written to stdout by a background
+# thread (failed requests are always logged, records are dropped while the
+# queue is full)
+ACCESS_LOG_ENABLED = env_bool("ACCESS_LOG_ENABLED", False)
+ACCESS_LOG_SAMPLE_RATE = env_float("ACCESS_LOG_SAMPLE_RATE", 0.1)
+ACCESS_LOG_MAX_QUEUE = env_int("ACCESS_LOG_MAX_QUEUE", 10000)
+
+# Admin endpoints (memory instrumentation) answer requests carrying this secret
+# in the X-Admin-Token header (empty disables them), tracemalloc keeps this
+# many frames per traced allocation
+ADMIN_TOKEN = env_str("ADMIN_TOKEN", "")
+TRACEMALLOC_FRAMES = env_int("TRACEMALLOC_FRAMES", 1)
+
+# Change policy of requests not asking for one: "single" change output, or
+# "split" into outputs of the denominations the UTXO pool of the source is
+# short of (comma separated denomination:count targets in SAT), at most the
+# max number of change outputs per transaction
+CHANGE_POLICY = env_str("CHANGE_POLICY", "single")
+CHANGE_PROFILE = env_str("CHANGE_PROFILE", "10000000:4,1000000:8,100000:8")
+CHANGE_MAX_OUTPUTS = env_int("CHANGE_MAX_OUTPUTS", 5)
@@ -0,0 +1,170 @@
+"""Plans and builds the sweeps consolidating the UTXOs of source addresses.
+
+Meant to be scheduled off-peak (e.g. from cron): for every source address
+(or xpub) the UTXOs of at most --max-amount are swept into a few outputs,
+like the /consolidations endpoint does, and the unsigned sweeps (or errors)
+are written to a JSONL file, one line per source. With --max-fee-kb nothing
+is planned while the fee rate is higher, so a run during a fee spike is
+skipped.
+
+Usage (from the btc_api directory):
+
+    $ python -m app.consolidate 1Source... [xpub...] --output sweeps.jsonl \\
+        [--fee-kb auto] [--max-fee-kb 5000] [--max-amount 100000]
+"""
+import argparse
+import json
+import sys
+
+from app.bulk import error_result
+from app.payment import (
+    AUTO_FEE,
+    MIN_CONFIRMATIONS,
+    fee_oracles,
+    parse_consolidation_request,
+    process_consolidation_request,
+)
+from app.fees import DEFAULT_CONF_TARGET
+from app.wallet.consolidate import MAX_INPUTS
+from app.wallet.xpub import ExtendedPublicKey
+
+
+def is_xpub(source: str) -> bool:
+    """Returns whether source is an xpub (or tpub) rather than an address."""
+
+    try:
+        ExtendedPublicKey.from_string(source)
+    except ValueError:
+        return False
+    return True
+
+
+def fee_kb_arg(value: str):
+    """Parses --fee-kb, either "auto" or a non-negative number of SAT."""
+
+    if value == AUTO_FEE:
+        return value
+    try:
+        fee_kb = int(value)
+    except ValueError:
+        fee_kb = -1
+    if fee_kb < 0:
+        raise argparse.ArgumentTypeError(
+            f'expected "{AUTO_FEE}" or a non-negative integer, got {value!r}'
+        )
+    return fee_kb
+
+
+def consolidation_body(source: str, args) -> dict:
+    """Returns the /consolidations request body for a source address or xpub."""
+
+    body = {
+        "fee_kb": args.fee_kb,
+        "min_confirmations": args.min_confirmations,
+        "max_inputs": args.max_inputs,
+        "n_outputs": args.n_outputs,
+        "testnet": args.testnet,
+    }
+    body["xpub" if is_xpub(source) else "source_address"] = source
+    if args.fee_kb == AUTO_FEE:
+        body["conf_target"] = args.conf_target
+    if args.max_amount is not None:
+        body["max_amount"] = args.max_amount
+    if args.change_address:
+        body["change_address"] = args.change_address
+    return body
+
+
+def run(sources, output, args) -> dict:
+    """Writes the sweeps of every source to output, returns counts."""
+
+    counts = {"sources": 0, "sweeps": 0, "swept": 0, "failed": 0}
+    for source in sources:
+        counts["sources"] += 1
+        try:
+            request = parse_consolidation_request(consolidation_body(source, args))
+            response = process_consolidation_request(request)
+        except Exception as err:
+            counts["failed"] += 1
+            result = error_result(source, err)
+        else:
+            counts["sweeps"] += len(response.sweeps)
+            counts["swept"] += response.plan.swept
+            result = dict(response.to_dict(), id=source)
+        output.write(json.dumps(result) + "\n")
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("sources", nargs="+", help="source addresses or xpubs")
+    parser.add_argument("--output", default="-", help="results file (JSONL)")
+    parser.add_argument(
+        "--fee-kb",
+        type=fee_kb_arg,
+        default=AUTO_FEE,
+        help='fee per kb in SAT or "auto" (default: %(default)s)',
+    )
+    parser.add_argument(
+        "--conf-target",
+        type=int,
+        default=DEFAULT_CONF_TARGET,
+        help='confirmation target of "auto" fee_kb (default: %(default)s)',
+    )
+    parser.add_argument(
+        "--max-fee-kb",
+        type=int,
+        help="skip the run if the fee per kb in SAT is higher than this",
+    )
+    parser.add_argument(
+        "--max-amount", type=int, help="only sweep UTXOs of at most this (in SAT)"
+    )
+    parser.add_argument(
+        "--max-inputs",
+        type=int,
+        default=MAX_INPUTS,
+        help="max number of inputs per sweep (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--n-outputs",
+        type=int,
+        default=1,
+        help="number of outputs per sweep (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--min-confirmations",
+        type=int,
+        default=MIN_CONFIRMATIONS,
+        help="min confirmations of swept UTXOs (default: %(default)s)",
+    )
+    parser.add_argument("--change-address", help="address to sweep to")
+    parser.add_argument("--testnet", action="store_true", help="testnet sources")
+    args = parser.parse_args(argv)
+
+    if args.max_fee_kb is not None:
+        fee_kb = args.fee_kb
+        if fee_kb == AUTO_FEE:
+            fee_kb = fee_oracles[args.testnet].fee_kb(args.conf_target)
+        if fee_kb > args.max_fee_kb:
+            print(
+                f"fee_kb {fee_kb} is higher than {args.max_fee_kb}, skipped",
+                file=sys.stderr,
+            )
+            return 0
+        args.fee_kb = fee_kb
+
+    if args.output == "-":
+        counts = run(args.sources, sys.stdout, args)
+    else:
+        with open(args.output, "w") as output:
+            counts = run(args.sources, output, args)
+    print(
+        f"{counts['sweeps']} sweeps of {counts['swept']} UTXOs for "
+        f"{counts['sources']} sources ({counts['failed']} failed)",
+        file=sys.stderr,
+    )
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
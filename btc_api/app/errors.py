@@ -2,7 +2,11 @@ from dataclasses import dataclass, asdict
 from typing import Dict, Any
 
 BAD_REQUEST = 400
+CONFLICT = 409
+UNPROCESSABLE_ENTITY = 422
+TOO_MANY_REQUESTS = 429
 INTERNAL_SERVER_ERROR = 500
+SERVICE_UNAVAILABLE = 503
 
 
 class InvalidUsage(Exception):
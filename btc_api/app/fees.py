@@ -0,0 +1,183 @@
+"""Fee-rate estimates for confirmation targets, refreshed in the background."""
+import bisect
+import json
+import math
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+import requests
+
+from app.payment_errors import FeeEstimateUnavailable
+from app.wallet.transaction import BYTES_IN_KB
+
+# sat/kB below which nodes don't relay transactions
+MIN_RELAY_FEE = 1000
+
+DEFAULT_CONF_TARGET = 6
+MAX_CONF_TARGET = 1008
+REFRESH_INTERVAL_SEC = 60.0
+MAX_AGE_SEC = 900.0
+SOURCE_TIMEOUT_SEC = 5.0
+# how long a request waits for the very first estimate of a process
+COLD_START_TIMEOUT_SEC = 2.0
+
+
+class EsploraFeeSource:
+    """Class representing the fee estimates endpoint of an Esplora API.
+
+    Esplora reports sat/vB rates keyed by confirmation target, e.g.
+    ``{"1": 87.9, "6": 68.3, "144": 1.0}``. They're converted to fee_kb
+    rates, whose kB is 1024 bytes (as in bit and `estimate_tx_fee_kb`).
+    """
+
+    def __init__(self, url_base: str, timeout: float = SOURCE_TIMEOUT_SEC):
+        self.url_base = url_base.rstrip("/")
+        self.name = self.url_base
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def get_fee_rates(self) -> Dict[int, int]:
+        """Returns fee rates (sat/kB) keyed by confirmation target (blocks)."""
+
+        r = self.session.get(f"{self.url_base}/fee-estimates", timeout=self.timeout)
+        r.raise_for_status()
+        return {
+            int(target): math.ceil(rate * BYTES_IN_KB)
+            for target, rate in r.json().items()
+        }
+
+
+class FileFeeSource:
+    """Class representing a JSON file of fee rates (sat/kB) by confirmation target.
+
+    The file is read on every refresh, so it can be updated in place.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.name = path
+
+    def get_fee_rates(self) -> Dict[int, int]:
+        """Returns fee rates (sat/kB) keyed by confirmation target (blocks)."""
+
+        with open(self.path) as f:
+            return {int(target): int(rate) for target, rate in json.load(f).items()}
+
+
+def fee_source(url: str):
+    """Creates a fee source, `file://` URLs are read from a local file."""
+
+    if url.startswith("file://"):
+        return FileFeeSource(url[len("file://") :])
+    return EsploraFeeSource(url)
+
+
+class FeeOracle:
+    """Keeps cached fee-rate estimates of a source refreshed in the background.
+
+    Requests only read the cached estimates. The refresh thread is started
+    when the server (or a worker) starts, or else on first use (once per
+    process, safe across forks); until the first refresh completes a request
+    waits at most `cold_start_timeout`. Estimates older than `max_age` (the
+    source failing for that long) aren't used.
+    """
+
+    def __init__(
+        self,
+        source,
+        refresh_interval: float = REFRESH_INTERVAL_SEC,
+        max_age: float = MAX_AGE_SEC,
+        min_fee: int = MIN_RELAY_FEE,
+        cold_start_timeout: float = COLD_START_TIMEOUT_SEC,
+    ):
+        self.source = source
+        self.refresh_interval = refresh_interval
+        self.max_age = max_age
+        self.min_fee = min_fee
+        self.cold_start_timeout = cold_start_timeout
+        self.refreshes = 0
+        self.errors = 0
+        self._targets = ()
+        self._rates = ()
+        self._updated_at = None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._thread_pid = None
+
+    def start(self):
+        """Starts the refresh thread unless it's running in this process."""
+
+        with self._lock:
+            if self._thread is not None and self._thread_pid == os.getpid():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="fee-oracle", daemon=True
+            )
+            self._thread_pid = os.getpid()
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.refresh()
+            self._stop.wait(self.refresh_interval)
+
+    def refresh(self) -> bool:
+        """Fetches the estimates from the source, keeps the old ones on errors."""
+
+        try:
+            rates = self.source.get_fee_rates()
+        except Exception:
+            self.errors += 1
+            return False
+        if not rates:
+            self.errors += 1
+            return False
+
+        targets = sorted(rates)
+        with self._lock:
+            self._targets = tuple(targets)
+            self._rates = tuple(max(self.min_fee, rates[t]) for t in targets)
+            self._updated_at = time.monotonic()
+        self.refreshes += 1
+        self._ready.set()
+        return True
+
+    def age(self) -> Optional[float]:
+        """Returns seconds since the last successful refresh (None if never)."""
+
+        updated_at = self._updated_at
+        return None if updated_at is None else time.monotonic() - updated_at
+
+    def rates(self) -> Dict[int, int]:
+        """Returns the cached fee rates (sat/kB) keyed by confirmation target."""
+
+        with self._lock:
+            return dict(zip(self._targets, self._rates))
+
+    def fee_kb(self, conf_target: int = DEFAULT_CONF_TARGET) -> int:
+        """Returns the fee rate (sat/kB) to confirm within conf_target blocks.
+
+        Uses the estimate of the largest known target not above conf_target
+        (the smallest known target if conf_target is below all of them).
+        Raises FeeEstimateUnavailable if there's no recent estimate.
+        """
+
+        self.start()
+        if not self._ready.is_set():
+            self._ready.wait(self.cold_start_timeout)
+
+        with self._lock:
+            targets, rates, updated_at = self._targets, self._rates, self._updated_at
+        if updated_at is None or time.monotonic() - updated_at > self.max_age:
+            raise FeeEstimateUnavailable(self.source.name)
+
+        i = bisect.bisect_right(targets, conf_target) - 1
+        return rates[max(i, 0)]
@@ -0,0 +1,75 @@
+import hashlib
+import threading
+import time
+
+from app.payment_errors import IdempotencyKeyMismatch, IdempotencyKeyInUse
+from app.ttl_cache import TTLCache
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+MAX_ENTRIES = 2000
+TTL_SEC = 600.0
+
+
+def body_fingerprint(body: bytes) -> str:
+    return hashlib.sha256(body).hexdigest()
+
+
+class IdempotencyStore:
+    """Remembers responses by idempotency key to replay them on client retries.
+
+    A key is bound to the fingerprint of the request body it was first used
+    with. Only successful responses are stored, so failed requests can be
+    retried with the same key.
+    """
+
+    def __init__(
+        self, max_entries: int = MAX_ENTRIES, ttl: float = TTL_SEC, clock=time.monotonic
+    ):
+        self._responses = TTLCache(max_entries, ttl, clock)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.replays = 0
+
+    def __len__(self) -> int:
+        return len(self._responses)
+
+    def sample(self, n: int) -> list:
+        """Returns (key, (fingerprint, response)) of n recently stored responses."""
+
+        return self._responses.sample(n)
+
+    def begin(self, key: str, fingerprint: str):
+        """Returns the stored response of key, or None if the request should run.
+
+        Raises IdempotencyKeyMismatch if key was used with another request
+        body, IdempotencyKeyInUse if a request with key is still running.
+        """
+
+        with self._lock:
+            stored = self._responses.get(key)
+            if stored is not None:
+                stored_fingerprint, response = stored
+                if stored_fingerprint != fingerprint:
+                    raise IdempotencyKeyMismatch(key)
+                self.replays += 1
+                return response
+
+            if key in self._pending:
+                raise IdempotencyKeyInUse(key)
+            self._pending[key] = fingerprint
+            return None
+
+    def complete(self, key: str, response):
+        """Stores the response of a request started with begin."""
+
+        with self._lock:
+            fingerprint = self._pending.pop(key)
+            self._responses.put(key, (fingerprint, response))
+
+    def abort(self, key: str):
+        """Forgets a request started with begin that failed."""
+
+        with self._lock:
+            self._pending.pop(key, None)
@@ -0,0 +1,73 @@
+import time
+from typing import List, Optional, Tuple
+
+from bit.wallet import Unspent
+
+from app.ttl_cache import TTLCache
+from app.wallet.coin_select import SelectedCoins
+from app.wallet.transaction import TxContext
+
+MAX_ENTRIES = 1000
+TTL_SEC = 300.0
+
+
+def utxo_fingerprint(utxos: List[Unspent]) -> Tuple[int, int, int]:
+    """Returns a fingerprint of a UTXO set (including the order of UTXOs).
+
+    Hashing a tuple of the relevant fields is a few times cheaper than a
+    cryptographic digest of large sets, the count and total amount guard
+    against collisions of the 64-bit hash.
+    """
+
+    key = tuple((u.txid, u.txindex, u.amount, u.confirmations) for u in utxos)
+    return hash(key), len(utxos), sum(u.amount for u in utxos)
+
+
+class SelectionMemo:
+    """Remembers coin selections of deterministic strategies.
+
+    Random strategies are deterministic for contexts with a seed. Selections
+    are keyed by the strategy, the fingerprint of the UTXO set and
+    the rest of the transaction context, so identical requests skip coin
+    selection and serialization.
+    """
+
+    def __init__(
+        self, max_entries: int = MAX_ENTRIES, ttl: float = TTL_SEC, clock=time.monotonic
+    ):
+        self._cache = TTLCache(max_entries, ttl, clock)
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    @property
+    def enabled(self) -> bool:
+        return self._cache.max_entries > 0
+
+    @staticmethod
+    def key(strategy_name: str, context: TxContext) -> tuple:
+        return (
+            strategy_name,
+            utxo_fingerprint(context.inputs),
+            tuple(context.outputs),
+            context.fee_kb,
+            context.change_address,
+            context.seed,
+            context.change_profile,
+        )
+
+    def get(self, key: tuple) -> Optional[Tuple[SelectedCoins, str]]:
+        result = self._cache.get(key)
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    def sample(self, n: int) -> list:
+        return self._cache.sample(n)
+
+    def put(self, key: tuple, selected_coins: SelectedCoins, raw: str):
+        self._cache.put(key, (selected_coins, raw))
@@ -0,0 +1,232 @@
+import sys
+import threading
+import tracemalloc
+import types
+from array import array
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from app import config
+
+# admin request header carrying the admin token
+ADMIN_HEADER = "X-Admin-Token"
+
+# entries of a structure measured to estimate its size
+SAMPLE_SIZE = 100
+TOP_ALLOCATORS = 10
+
+# traces of tracemalloc itself are left out of snapshots
+SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+# objects never followed by deep_sizeof (shared by, not owned by, entries)
+_NOT_OWNED = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType)
+_ATOMIC = (str, bytes, int, float, bool, type(None), array)
+
+
+def deep_sizeof(obj: Any, seen: set = None) -> int:
+    """Returns the size of obj and of the objects it refers to, in bytes.
+
+    Follows containers, instance dicts and slots. Objects in `seen` (ids) are
+    not counted again, so objects shared by entries measured with the same
+    `seen` (e.g. scripts of UTXOs of the same address) are counted once.
+    """
+
+    if seen is None:
+        seen = set()
+    size = 0
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, _NOT_OWNED):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, _ATOMIC):
+            continue
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        else:
+            attrs = getattr(obj, "__dict__", None)
+            if attrs is not None:
+                stack.append(attrs)
+            for cls in type(obj).__mro__:
+                for slot in getattr(cls, "__slots__", ()):
+                    if hasattr(obj, slot):
+                        stack.append(getattr(obj, slot))
+    return size
+
+
+@dataclass
+class StructureUsage:
+    """Class representing the (estimated) memory used by a cache.
+
+    The size is extrapolated from a sample of the most recently used entries.
+    """
+
+    entries: int
+    sampled: int
+    sampled_bytes: int
+
+    @property
+    def bytes_per_entry(self) -> int:
+        return self.sampled_bytes // self.sampled if self.sampled else 0
+
+    @property
+    def bytes(self) -> int:
+        return self.bytes_per_entry * self.entries
+
+    def to_dict(self) -> Dict[str, int]:
+        return {
+            "entries": self.entries,
+            "sampled": self.sampled,
+            "bytes_per_entry": self.bytes_per_entry,
+            "bytes": self.bytes,
+        }
+
+
+def structure_usage(structure, sample_size: int = SAMPLE_SIZE) -> StructureUsage:
+    """Estimates the memory used by a structure with `__len__` and `sample(n)`."""
+
+    entries = len(structure)
+    items = structure.sample(sample_size)
+    seen = set()
+    sampled_bytes = sum(deep_sizeof(item, seen) for item in items)
+    return StructureUsage(entries, len(items), sampled_bytes)
+
+
+def unspent_cache_usage(cache, sample_size: int = SAMPLE_SIZE) -> Dict[str, Any]:
+    """Estimates the memory used by the UTXO sets of a StaleUnspentCache."""
+
+    items = cache.sample(sample_size)
+    seen = set()
+    sampled_bytes = sum(deep_sizeof(item, seen) for item in items)
+    sampled_utxos = sum(len(utxos) for _, utxos in items)
+    sizes = cache.set_sizes()
+    usage = StructureUsage(len(sizes), len(items), sampled_bytes).to_dict()
+    usage["utxos"] = sum(sizes)
+    usage["largest_set"] = max(sizes, default=0)
+    usage["bytes_per_utxo"] = sampled_bytes // sampled_utxos if sampled_utxos else 0
+    return usage
+
+
+def process_memory() -> Dict[str, Optional[int]]:
+    """Returns the resident set size of the process and its peak, in bytes."""
+
+    usage = {"rss": None, "peak_rss": None}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    usage["rss"] = int(line.split()[1]) * 1024
+                elif line.startswith("VmHWM:"):
+                    usage["peak_rss"] = int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if usage["peak_rss"] is None:
+        try:
+            import resource
+        except ImportError:
+            return usage
+        # in kilobytes on Linux, in bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        usage["peak_rss"] = peak if sys.platform == "darwin" else peak * 1024
+    return usage
+
+
+def _stat_to_dict(stat) -> Dict[str, Any]:
+    frame = stat.traceback[0]
+    result = {
+        "location": f"{frame.filename}:{frame.lineno}",
+        "size": stat.size,
+        "count": stat.count,
+    }
+    if isinstance(stat, tracemalloc.StatisticDiff):
+        result["size_diff"] = stat.size_diff
+        result["count_diff"] = stat.count_diff
+    return result
+
+
+class MemoryTracer:
+    """Reports the top allocators traced by tracemalloc.
+
+    Tracing is off unless started (or started at startup with the
+    `PYTHONTRACEMALLOC` environment variable), as it slows down every
+    allocation. A baseline snapshot taken with `take_baseline` (which starts
+    tracing) is compared with the current one in every report.
+    """
+
+    def __init__(self, frames: int = config.TRACEMALLOC_FRAMES):
+        self.frames = frames
+        self._baseline = None
+        self._lock = threading.Lock()
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    @staticmethod
+    def _snapshot() -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+
+    def take_baseline(self):
+        """Starts tracing if needed and takes the baseline snapshot."""
+
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self.frames)
+            self._baseline = self._snapshot()
+
+    def stop(self):
+        """Stops tracing and forgets the baseline snapshot."""
+
+        with self._lock:
+            self._baseline = None
+            tracemalloc.stop()
+
+    def report(self, top: int = TOP_ALLOCATORS) -> Dict[str, Any]:
+        """Returns traced memory, the top allocators and the diff to the baseline."""
+
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                return {"tracing": False}
+            snapshot = self._snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            baseline = self._baseline
+
+        report = {
+            "tracing": True,
+            "current": current,
+            "peak": peak,
+            "top": [_stat_to_dict(s) for s in snapshot.statistics("lineno")[:top]],
+        }
+        if baseline is not None:
+            diff = snapshot.compare_to(baseline, "lineno")[:top]
+            report["diff"] = [_stat_to_dict(s) for s in diff]
+        return report
+
+
+def memory_report(
+    tracer: MemoryTracer,
+    structures: Dict[str, Any],
+    unspent_cache,
+    top: int = TOP_ALLOCATORS,
+    sample_size: int = SAMPLE_SIZE,
+) -> Dict[str, Any]:
+    """Returns the memory report of the process (see /admin/memory)."""
+
+    usage = {
+        name: structure_usage(structure, sample_size).to_dict()
+        for name, structure in structures.items()
+    }
+    usage["unspent_cache"] = unspent_cache_usage(unspent_cache, sample_size)
+    report: Dict[str, Any] = process_memory()
+    report["structures"] = usage
+    report["tracemalloc"] = tracer.report(top)
+    return report
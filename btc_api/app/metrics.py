@@ -0,0 +1,456 @@
+# config sets up the multiprocess mode, which prometheus_client picks on import
+from app import config
+from prometheus_client import (
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    REGISTRY,
+    CONTENT_TYPE_LATEST,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from app.stats import RequestStats
+from app.wallet.breaker import CLOSED, OPEN, HALF_OPEN
+
+# latency buckets (in seconds) spanning sub-millisecond stages to upstream timeouts
+STAGE_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+STAGE_DURATION = Histogram(
+    "btc_api_stage_duration_seconds",
+    "Time spent in a stage of the /payment_transactions request.",
+    ["stage", "strategy", "network"],
+    buckets=STAGE_BUCKETS,
+)
+REQUEST_DURATION = Histogram(
+    "btc_api_request_duration_seconds",
+    "Total time spent handling a /payment_transactions request.",
+    ["strategy", "network"],
+    buckets=STAGE_BUCKETS,
+)
+UTXOS_FETCHED = Counter(
+    "btc_api_utxos_fetched_total",
+    "Number of UTXOs fetched for source addresses.",
+    ["strategy", "network"],
+)
+UTXOS_CONFIRMED = Counter(
+    "btc_api_utxos_confirmed_total",
+    "Number of fetched UTXOs with enough confirmations to be selected.",
+    ["strategy", "network"],
+)
+UTXOS_UNECONOMICAL = Counter(
+    "btc_api_utxos_uneconomical_total",
+    "Number of confirmed UTXOs left out for being worth less than spending them costs.",
+    ["strategy", "network"],
+)
+UNECONOMICAL_AMOUNT = Counter(
+    "btc_api_uneconomical_amount_sat_total",
+    "Amount (in SAT) of the UTXOs left out for being uneconomical.",
+    ["strategy", "network"],
+)
+INPUTS_SELECTED = Counter(
+    "btc_api_inputs_selected_total",
+    "Number of UTXOs selected as transaction inputs.",
+    ["strategy", "network"],
+)
+SELECTION_RUNS = Counter(
+    "btc_api_selection_runs_total",
+    "Number of coin selections by where they ran (inline, pool or fallback).",
+    ["mode", "strategy", "network"],
+)
+STALE_RESPONSES = Counter(
+    "btc_api_stale_responses_total",
+    "Number of responses built from a stale (cached) UTXO set.",
+    ["strategy", "network"],
+)
+IDEMPOTENT_REPLAYS = Counter(
+    "btc_api_idempotent_replays_total",
+    "Number of stored responses replayed for requests with an Idempotency-Key.",
+)
+QUOTE_DURATION = Histogram(
+    "btc_api_quote_duration_seconds",
+    "Total time spent handling a /payment_quotes request.",
+    ["network"],
+    buckets=STAGE_BUCKETS,
+)
+QUOTES = Counter(
+    "btc_api_quotes_total",
+    "Number of coin selections quoted by /payment_quotes.",
+    ["strategy", "network"],
+)
+CONSOLIDATION_DURATION = Histogram(
+    "btc_api_consolidation_duration_seconds",
+    "Total time spent handling a /consolidations request.",
+    ["network"],
+    buckets=STAGE_BUCKETS,
+)
+CONSOLIDATED_INPUTS = Counter(
+    "btc_api_consolidated_inputs_total",
+    "Number of UTXOs swept by /consolidations.",
+    ["network"],
+)
+ERRORS = Counter(
+    "btc_api_errors_total", "Number of error responses by error name.", ["name"]
+)
+
+# maps RequestStats counts to counters
+COUNTERS = {
+    "utxos_fetched": UTXOS_FETCHED,
+    "utxos_confirmed": UTXOS_CONFIRMED,
+    "utxos_uneconomical": UTXOS_UNECONOMICAL,
+    "uneconomical_amount": UNECONOMICAL_AMOUNT,
+    "inputs_selected": INPUTS_SELECTED,
+}
+
+UNKNOWN_LABEL = "unknown"
+
+
+def record_request(
+    stats: RequestStats, duration: float, strategy: str = None, network: str = None
+):
+    """Exports timings and counts collected for a request."""
+
+    if not config.METRICS_ENABLED:
+        return
+
+    if stats.info.get("replayed"):
+        IDEMPOTENT_REPLAYS.inc()
+        return
+
+    strategy = strategy or UNKNOWN_LABEL
+    network = network or UNKNOWN_LABEL
+
+    REQUEST_DURATION.labels(strategy, network).observe(duration)
+    for stage, elapsed in stats.timings.items():
+        STAGE_DURATION.labels(stage, strategy, network).observe(elapsed)
+
+    for name, value in stats.counts.items():
+        counter = COUNTERS.get(name)
+        if counter is not None:
+            counter.labels(strategy, network).inc(value)
+
+    mode = stats.info.get("offload")
+    if mode is not None:
+        SELECTION_RUNS.labels(mode, strategy, network).inc()
+
+    if stats.info.get("stale"):
+        STALE_RESPONSES.labels(strategy, network).inc()
+
+
+def record_quote(duration: float, strategies=None, network: str = None):
+    """Exports the duration and quoted strategies of a /payment_quotes request."""
+
+    if not config.METRICS_ENABLED:
+        return
+
+    network = network or UNKNOWN_LABEL
+    QUOTE_DURATION.labels(network).observe(duration)
+    for strategy in strategies or []:
+        QUOTES.labels(strategy, network).inc()
+
+
+def record_consolidation(stats: RequestStats, duration: float, network: str = None):
+    """Exports the duration and swept UTXOs of a /consolidations request."""
+
+    if not config.METRICS_ENABLED:
+        return
+
+    network = network or UNKNOWN_LABEL
+    CONSOLIDATION_DURATION.labels(network).observe(duration)
+    CONSOLIDATED_INPUTS.labels(network).inc(stats.counts.get("inputs_selected", 0))
+
+
+def record_error(name: str):
+    """Counts an error response."""
+
+    if config.METRICS_ENABLED:
+        ERRORS.labels(name).inc()
+
+
+class UnspentFetcherCollector:
+    """Exports request statistics of the UTXO providers of a fetcher."""
+
+    def __init__(self, fetcher):
+        self.fetcher = fetcher
+
+    def collect(self):
+        labels = ["network", "provider"]
+        requests = CounterMetricFamily(
+            "btc_api_unspent_provider_requests",
+            "Number of requests sent to a UTXO provider.",
+            labels=labels,
+        )
+        errors = CounterMetricFamily(
+            "btc_api_unspent_provider_errors",
+            "Number of failed requests to a UTXO provider.",
+            labels=labels,
+        )
+        latency = GaugeMetricFamily(
+            "btc_api_unspent_provider_latency_seconds",
+            "Recent latency quantiles of a UTXO provider.",
+            labels=labels + ["quantile"],
+        )
+        for (network, name), stats in self.fetcher.provider_stats().items():
+            requests.add_metric([network, name], stats["requests"])
+            errors.add_metric([network, name], stats["errors"])
+            for q, key in [("0.5", "latency_p50"), ("0.95", "latency_p95")]:
+                value = stats[key]
+                if value is not None:
+                    latency.add_metric([network, name, q], value)
+
+        hedged = CounterMetricFamily(
+            "btc_api_unspent_hedged_requests",
+            "Number of hedged requests sent to a secondary UTXO provider.",
+        )
+        hedged.add_metric([], self.fetcher.hedged)
+        failovers = CounterMetricFamily(
+            "btc_api_unspent_failovers",
+            "Number of requests failed over to another UTXO provider.",
+        )
+        failovers.add_metric([], self.fetcher.failovers)
+
+        return [requests, errors, latency, hedged, failovers]
+
+
+# collectors of the state of the worker process (as opposed to metrics which
+# are aggregated across workers in multiprocess mode)
+_worker_collectors = []
+
+
+def _register(collector):
+    REGISTRY.register(collector)
+    _worker_collectors.append(collector)
+
+
+def register_unspent_fetcher(fetcher):
+    """Exports statistics of the UTXO providers of fetcher."""
+
+    if config.METRICS_ENABLED:
+        _register(UnspentFetcherCollector(fetcher))
+
+
+class UnspentCacheCollector:
+    """Exports the circuit breaker state and statistics of a UTXO cache."""
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def collect(self):
+        breaker = self.cache.breaker
+        state = GaugeMetricFamily(
+            "btc_api_unspent_breaker_state",
+            "State of the UTXO providers circuit breaker (1 for the current state).",
+            labels=["state"],
+        )
+        current = breaker.state
+        for name in [CLOSED, OPEN, HALF_OPEN]:
+            state.add_metric([name], 1 if name == current else 0)
+
+        cache = self.cache
+        entries = GaugeMetricFamily(
+            "btc_api_unspent_cache_entries", "Number of cached UTXO sets."
+        )
+        entries.add_metric([], len(cache))
+
+        return [
+            state,
+            entries,
+            _counter(
+                "breaker_rejected", "UTXO requests failed fast.", breaker.rejected
+            ),
+            _counter(
+                "breaker_trips", "Times the circuit breaker opened.", breaker.trips
+            ),
+            _counter("cache_hits", "Fresh UTXO sets served from cache.", cache.hits),
+            _counter("stale_served", "Stale UTXO sets served.", cache.stale_served),
+            _counter("refreshes", "Background UTXO set refreshes.", cache.refreshes),
+            _counter(
+                "refresh_errors", "Failed UTXO set refreshes.", cache.refresh_errors
+            ),
+            _counter(
+                "restored", "UTXO sets restored from the snapshot.", cache.restored
+            ),
+        ]
+
+
+def _counter(name: str, documentation: str, value: float) -> CounterMetricFamily:
+    counter = CounterMetricFamily(f"btc_api_unspent_{name}", documentation)
+    counter.add_metric([], value)
+    return counter
+
+
+def register_unspent_cache(cache):
+    """Exports the circuit breaker state and statistics of cache."""
+
+    if config.METRICS_ENABLED:
+        _register(UnspentCacheCollector(cache))
+
+
+class PrefetcherCollector:
+    """Exports statistics of a refresh-ahead UTXO prefetcher."""
+
+    def __init__(self, prefetcher):
+        self.prefetcher = prefetcher
+
+    def collect(self):
+        prefetcher = self.prefetcher
+        tracked = GaugeMetricFamily(
+            "btc_api_unspent_prefetch_tracked",
+            "Number of addresses tracked by the UTXO prefetcher.",
+        )
+        tracked.add_metric([], len(prefetcher))
+        return [
+            tracked,
+            _counter("prefetches", "UTXO sets refreshed ahead.", prefetcher.prefetches),
+            _counter(
+                "prefetch_over_budget",
+                "Prefetch rounds cut short by the request budget.",
+                prefetcher.over_budget,
+            ),
+        ]
+
+
+def register_prefetcher(prefetcher):
+    """Exports statistics of prefetcher."""
+
+    if config.METRICS_ENABLED:
+        _register(PrefetcherCollector(prefetcher))
+
+
+class AdmissionCollector:
+    """Exports the state of an admission controller."""
+
+    def __init__(self, admission):
+        self.admission = admission
+
+    def collect(self):
+        admission = self.admission
+        in_flight = GaugeMetricFamily(
+            "btc_api_admission_in_flight", "Number of requests being processed."
+        )
+        in_flight.add_metric([], admission.in_flight)
+        queued = GaugeMetricFamily(
+            "btc_api_admission_queued", "Number of requests waiting to be processed."
+        )
+        queued.add_metric([], admission.queued)
+        admitted = CounterMetricFamily(
+            "btc_api_admission_admitted", "Number of admitted requests."
+        )
+        admitted.add_metric([], admission.admitted)
+        rejected = CounterMetricFamily(
+            "btc_api_admission_rejected",
+            "Number of rejected requests by reason.",
+            labels=["reason"],
+        )
+        for reason, count in admission.rejected.items():
+            rejected.add_metric([reason], count)
+        return [in_flight, queued, admitted, rejected]
+
+
+def register_admission(admission):
+    """Exports the state of admission."""
+
+    if config.METRICS_ENABLED:
+        _register(AdmissionCollector(admission))
+
+
+class FeeOracleCollector:
+    """Exports the cached fee-rate estimates of fee oracles by network."""
+
+    def __init__(self, oracles):
+        self.oracles = oracles
+
+    def collect(self):
+        rates = GaugeMetricFamily(
+            "btc_api_fee_rate_sat_per_kb",
+            "Cached fee-rate estimate by confirmation target.",
+            labels=["network", "conf_target"],
+        )
+        age = GaugeMetricFamily(
+            "btc_api_fee_estimate_age_seconds",
+            "Seconds since the fee-rate estimates were refreshed.",
+            labels=["network"],
+        )
+        errors = CounterMetricFamily(
+            "btc_api_fee_refresh_errors",
+            "Number of failed fee-rate estimate refreshes.",
+            labels=["network"],
+        )
+        for testnet, oracle in self.oracles.items():
+            network = "test" if testnet else "main"
+            for target, rate in oracle.rates().items():
+                rates.add_metric([network, str(target)], rate)
+            if oracle.age() is not None:
+                age.add_metric([network], oracle.age())
+            errors.add_metric([network], oracle.errors)
+        return [rates, age, errors]
+
+
+def register_fee_oracles(oracles):
+    """Exports the cached fee-rate estimates of oracles (keyed by testnet)."""
+
+    if config.METRICS_ENABLED:
+        _register(FeeOracleCollector(oracles))
+
+
+class AccessLogCollector:
+    """Exports the number of logged and dropped access log records."""
+
+    def __init__(self, access_log):
+        self.access_log = access_log
+
+    def collect(self):
+        logged = CounterMetricFamily(
+            "btc_api_access_log_records", "Number of requests logged."
+        )
+        logged.add_metric([], self.access_log.logged)
+        dropped = CounterMetricFamily(
+            "btc_api_access_log_dropped",
+            "Number of log records dropped while the log queue was full.",
+        )
+        dropped.add_metric([], self.access_log.dropped)
+        return [logged, dropped]
+
+
+def register_access_log(access_log):
+    """Exports the record counts of access_log."""
+
+    if config.METRICS_ENABLED:
+        _register(AccessLogCollector(access_log))
+
+
+def render_metrics():
+    """Renders all metrics in the Prometheus text format.
+
+    If `PROMETHEUS_MULTIPROC_DIR` (or `prometheus_multiproc_dir`) is set,
+    e.g. running multiple Gunicorn workers, counters and histograms are
+    aggregated across all worker processes. Gauges of the state of a worker
+    (UTXO cache, breaker, prefetcher, admission, fee estimates, access log)
+    are those of the worker serving the scrape.
+    """
+
+    registry = REGISTRY
+    if config.PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry, config.PROMETHEUS_MULTIPROC_DIR)
+        for collector in _worker_collectors:
+            registry.register(collector)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,245 @@
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from multiprocessing import get_context
+from typing import List, Tuple
+
+from app import config
+from app.stats import RequestStats
+from app.strategies import coin_select_strategies, reseed, RANDOM_SEED
+from app.wallet.change import ChangeProfile
+from app.wallet.coin_select import SelectedCoins
+from app.wallet.compact import CompactUnspents
+from app.wallet.transaction import TxContext, Output, create_unsigned
+
+# weight of the latest pool run in the moving average of pool run times
+DURATION_EWMA_ALPHA = 0.2
+# how often pool workers check that the serving process is still alive
+PARENT_CHECK_SEC = 1.0
+
+
+def _exit_with_parent(parent_pid: int):
+    """Pool worker initializer: exits the worker once its parent is gone.
+
+    Serving processes may be killed without shutting the pool down (e.g. on
+    worker restarts), which would otherwise leave orphaned pool workers.
+    """
+
+    def watch():
+        while os.getppid() == parent_pid:
+            time.sleep(PARENT_CHECK_SEC)
+        os._exit(0)
+
+    threading.Thread(target=watch, daemon=True).start()
+
+
+def _init_worker(parent_pid: int):
+    """Pool worker initializer: reseeds the random strategies, watches the parent.
+
+    Spawned workers import the strategies afresh, all seeded with the same
+    seed, so each is given its own (the pids of live workers are distinct).
+    """
+
+    reseed(RANDOM_SEED + os.getpid())
+    _exit_with_parent(parent_pid)
+
+
+def select_and_serialize(
+    strategy, context: TxContext, stats: RequestStats = None
+) -> Tuple[SelectedCoins, str]:
+    """Selects coins and serializes the unsigned transaction to hex."""
+
+    if stats is None:
+        stats = RequestStats()
+
+    with stats.stage("select"):
+        selected_coins = strategy.select(context)
+    with stats.stage("serialize"):
+        tx = create_unsigned(selected_coins.inputs, selected_coins.outputs)
+        raw = tx.to_hex()
+    return selected_coins, raw
+
+
+def _select_compact(
+    strategy_name: str,
+    utxos: CompactUnspents,
+    outputs: List[Output],
+    fee_kb: int,
+    address: str,
+    change_address: str,
+    seed: int = None,
+    change_profile: ChangeProfile = None,
+):
+    """Pool task: selects and serializes using the compact UTXO set.
+
+    Returns indexes of the selected inputs instead of the inputs themselves,
+    so only plain values cross the process boundary.
+    """
+
+    inputs = utxos.to_unspents()
+    positions = {id(utxo): i for i, utxo in enumerate(inputs)}
+    context = TxContext(
+        address, inputs, outputs, fee_kb, change_address, seed, change_profile
+    )
+
+    strategy = coin_select_strategies[strategy_name]
+    stats = RequestStats()
+    selected_coins, raw = select_and_serialize(strategy, context, stats)
+
+    return (
+        [positions[id(utxo)] for utxo in selected_coins.inputs],
+        selected_coins.outputs,
+        selected_coins.out_amount,
+        selected_coins.change_amount,
+        selected_coins.fee_amount,
+        raw,
+        stats.timings,
+    )
+
+
+class SelectionOffloader:
+    """Runs coin selection and serialization inline or in a process pool.
+
+    Small UTXO sets are handled inline. Sets with at least `utxo_threshold`
+    entries are sent to a bounded process pool so that expensive strategies
+    don't hold the GIL of the serving process. If the request deadline would
+    be missed (deadline passed, pool saturated, or the task not finishing in
+    time) the cheap `fallback_strategy` is run inline instead. A task that
+    misses the deadline while running can't be cancelled, so it keeps its
+    place among the `max_pending` tasks until it finishes.
+    """
+
+    def __init__(
+        self,
+        strategies,
+        max_workers: int = config.OFFLOAD_MAX_WORKERS,
+        max_pending: int = config.OFFLOAD_MAX_PENDING,
+        utxo_threshold: int = config.OFFLOAD_UTXO_THRESHOLD,
+        fallback_strategy: str = config.OFFLOAD_FALLBACK_STRATEGY,
+    ):
+        self.strategies = strategies
+        self.max_workers = max_workers
+        self.utxo_threshold = utxo_threshold
+        self.fallback_strategy = fallback_strategy
+        self._slots = threading.BoundedSemaphore(max(1, max_pending))
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pool_pid = None
+        self._avg_duration = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_workers > 0
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        """Lazily creates the pool (once per process, safe across forks)."""
+
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(os.getpid(),),
+                )
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def shutdown(self, wait: bool = True):
+        """Shuts down the process pool if it was started."""
+
+        with self._lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.shutdown(wait=wait)
+            self._pool = None
+
+    def run(
+        self,
+        strategy_name: str,
+        context: TxContext,
+        deadline: float = None,
+        stats: RequestStats = None,
+        utxos: CompactUnspents = None,
+    ) -> Tuple[SelectedCoins, str]:
+        """Selects coins from context and serializes the unsigned transaction.
+
+        Args:
+            strategy_name (str): Name of the coin selection strategy.
+            context (TxContext): Transaction context to select coins from.
+            deadline (float): Absolute `time.monotonic()` deadline (optional).
+            stats (RequestStats): Collects stage timings (optional).
+            utxos (CompactUnspents): context.inputs already packed (optional).
+
+        Returns:
+            Tuple of selected coins and the unsigned raw transaction (hex).
+        """
+
+        if stats is None:
+            stats = RequestStats()
+
+        if not self.enabled or len(context.inputs) < self.utxo_threshold:
+            return self._run_inline(strategy_name, context, stats)
+
+        remaining = None if deadline is None else deadline - time.monotonic()
+        if remaining is not None and remaining <= self._avg_duration:
+            return self._run_fallback(context, stats)
+
+        if not self._slots.acquire(blocking=False):
+            return self._run_fallback(context, stats)
+
+        if utxos is None:
+            utxos = CompactUnspents.from_unspents(context.inputs)
+        try:
+            started = time.monotonic()
+            future = self._get_pool().submit(
+                _select_compact,
+                strategy_name,
+                utxos,
+                context.outputs,
+                context.fee_kb,
+                context.address,
+                context.change_address,
+                context.seed,
+                context.change_profile,
+            )
+            # released once the task finished (or was cancelled while queued)
+            future.add_done_callback(lambda _: self._slots.release())
+        except Exception:
+            self._slots.release()
+            raise
+
+        try:
+            result = future.result(timeout=remaining)
+        except TimeoutError:
+            # drops the task if it's still queued, a running one isn't
+            # interrupted and holds its slot until it finishes
+            future.cancel()
+            return self._run_fallback(context, stats)
+
+        self._record_duration(time.monotonic() - started)
+        indexes, outputs, out_amount, change_amount, fee, raw, timings = result
+        stats.merge_timings(timings)
+        stats.info["offload"] = "pool"
+        selected_coins = SelectedCoins(
+            [context.inputs[i] for i in indexes],
+            outputs,
+            out_amount,
+            change_amount,
+            fee,
+        )
+        return selected_coins, raw
+
+    def _run_inline(self, strategy_name: str, context: TxContext, stats):
+        stats.info["offload"] = "inline"
+        return select_and_serialize(self.strategies[strategy_name], context, stats)
+
+    def _run_fallback(self, context: TxContext, stats):
+        result = self._run_inline(self.fallback_strategy, context, stats)
+        stats.info["offload"] = "fallback"
+        return result
+
+    def _record_duration(self, duration: float):
+        # request threads finish concurrently, so the read-modify-write is locked
+        with self._lock:
+            self._avg_duration += DURATION_EWMA_ALPHA * (duration - self._avg_duration)
@@ -1,6 +1,6 @@
-import random
 from dataclasses import dataclass
-from typing import List, Dict
+from typing import List, Dict, Tuple, Union
+from app import config
 from app.errors import InvalidUsage, BAD_REQUEST
 from app.payment_errors import (
     EmptySourceAddress,
@@ -13,40 +13,146 @@ from app.payment_errors import (
     NotSupportedOutputAddress,
     NetworkMismatchOutputAddress,
     InvalidStrategy,
+    InvalidSeed,
     InvalidFee,
+    InvalidConfTarget,
     InvalidMinConfirmations,
+    ConflictingSourceAddresses,
+    TooManySourceAddresses,
+    InvalidXpub,
+    InvalidGapLimit,
+    InvalidChangeAddress,
+    InvalidChangePolicy,
+    InvalidMaxAmount,
+    InvalidMaxInputs,
+    InvalidOutputCount,
 )
-from app.wallet.query import get_unspent
-from app.wallet.coin_select import (
-    GreedyMaxSecure,
-    GreedyMaxCoins,
-    GreedyMinCoins,
-    GreedyRandom,
-    DUST_THRESHOLD,
+from app.fees import (
+    FeeOracle,
+    fee_source,
+    MIN_RELAY_FEE,
+    DEFAULT_CONF_TARGET,
+    MAX_CONF_TARGET,
+)
+from app.memo import SelectionMemo
+from app.offload import SelectionOffloader
+from app.stats import RequestStats
+from app.wallet.breaker import CircuitBreaker
+from app.wallet.cache import StaleUnspentCache
+from app.wallet.prefetch import RefreshAheadPrefetcher
+from app.wallet.providers import HedgedUnspentFetcher
+from app.wallet.snapshot import SnapshotWriter
+from app.wallet.sources import (
+    UnspentFanout,
+    SourceUnspents,
+    GAP_LIMIT,
+    MAX_GAP_LIMIT,
+)
+from app.wallet.xpub import ExtendedPublicKey
+from app.strategies import coin_select_strategies, DEFAULT_STRATEGY, RANDOM_SEED
+from app.wallet.change import (
+    CHANGE_POLICIES,
+    SPLIT,
+    ChangeProfile,
+    parse_change_profile,
+)
+from app.wallet.coin_select import DUST_THRESHOLD, SelectedCoins
+from app.wallet.compact import CompactUnspents
+from app.wallet.consolidate import (
+    ConsolidationPlan,
+    plan_consolidation,
+    MAX_INPUTS,
+    MAX_OUTPUTS,
+)
+from app.wallet.transaction import (
+    TxContext,
+    Output,
+    address_to_output_size,
+    create_unsigned,
+    estimate_tx_size,
 )
-from app.wallet.transaction import TxContext, Output, create_unsigned
 from app.wallet.exceptions import (
     InsufficientFunds,
     EmptyUnspentTransactionOutputSet,
     NoConfirmedTransactionsFound,
+    NoEconomicalTransactionsFound,
 )
 from bit.wallet import Unspent
 from bit.format import get_version
 
 MIN_CONFIRMATIONS = 6
-MIN_RELAY_FEE = 1000
+AUTO_FEE = "auto"
+MAX_SEED = 2**64
 
-RANDOM_SEED = 1234
+split_change_profile = parse_change_profile(
+    config.CHANGE_PROFILE, config.CHANGE_MAX_OUTPUTS
+)
 
-random.seed(RANDOM_SEED)
-coin_select_strategies = {
-    "greedy_max_secure": GreedyMaxSecure(),
-    "greedy_max_coins": GreedyMaxCoins(),
-    "greedy_min_coins": GreedyMinCoins(),
-    "greedy_random": GreedyRandom(random),
-}
+selection_offloader = SelectionOffloader(coin_select_strategies)
+
+selection_memo = SelectionMemo(
+    config.SELECTION_MEMO_MAX_ENTRIES, config.SELECTION_MEMO_TTL_SEC
+)
+
+unspent_fetcher = HedgedUnspentFetcher.from_urls(
+    config.UNSPENT_URLS_MAINNET,
+    config.UNSPENT_URLS_TESTNET,
+    timeout=config.UNSPENT_TIMEOUT_SEC,
+    hedge_quantile=config.HEDGE_QUANTILE,
+    hedge_min_delay=config.HEDGE_MIN_DELAY_SEC,
+    hedge_max_delay=config.HEDGE_MAX_DELAY_SEC,
+)
+
+unspent_source = StaleUnspentCache(
+    unspent_fetcher,
+    CircuitBreaker(
+        "unspent",
+        failure_threshold=config.BREAKER_FAILURE_THRESHOLD,
+        reset_timeout=config.BREAKER_RESET_SEC,
+    ),
+    fresh_ttl=config.UNSPENT_FRESH_TTL_SEC,
+    max_stale=config.UNSPENT_MAX_STALE_SEC,
+    max_entries=config.UNSPENT_CACHE_MAX_ENTRIES,
+)
 
-DEFAULT_STRATEGY = list(coin_select_strategies.keys())[0]
+# opened by the master when preloading, so the mapping is shared by the workers
+unspent_snapshots = SnapshotWriter(
+    unspent_source,
+    config.UNSPENT_SNAPSHOT_PATH,
+    interval=config.UNSPENT_SNAPSHOT_INTERVAL_SEC,
+)
+unspent_snapshots.load()
+
+unspent_prefetcher = RefreshAheadPrefetcher(
+    unspent_source,
+    top_k=config.PREFETCH_TOP_K,
+    sample_rate=config.PREFETCH_SAMPLE_RATE,
+    refresh_ahead=config.PREFETCH_AHEAD_SEC,
+    budget=config.PREFETCH_BUDGET_PER_SEC,
+    interval=config.PREFETCH_INTERVAL_SEC,
+    half_life=config.PREFETCH_HALF_LIFE_SEC,
+)
+
+unspent_fanout = UnspentFanout(
+    unspent_prefetcher,
+    batch_size=config.UNSPENT_BATCH_SIZE,
+    threads=config.UNSPENT_FANOUT_THREADS,
+    max_addresses=config.MAX_SOURCE_ADDRESSES,
+    history=unspent_fetcher.get_tx_counts,
+)
+
+fee_oracles = {
+    testnet: FeeOracle(
+        fee_source(url),
+        refresh_interval=config.FEE_REFRESH_SEC,
+        max_age=config.FEE_MAX_AGE_SEC,
+        min_fee=MIN_RELAY_FEE,
+    )
+    for testnet, url in [
+        (False, config.FEE_SOURCE_MAINNET),
+        (True, config.FEE_SOURCE_TESTNET),
+    ]
+}
 
 P2PKH_PREFIXES = {"1"}
 P2SH_PREFIXES = {"3"}
@@ -59,44 +165,154 @@ supported_out_prefixes = supported_in_prefixes | P2SH_PREFIXES | P2SH_TESTNET_PR
 
 @dataclass
 class PaymentTxRequest:
-    """Class representing request data for the /payment_transactions endpoint."""
+    """Class representing request data for the /payment_transactions endpoint.
+
+    Exactly one of source_address, source_addresses or xpub must be given.
+    """
 
     source_address: str
     outputs: Dict[str, int]
-    fee_kb: int = MIN_RELAY_FEE
+    fee_kb: Union[int, str] = None
     strategy: str = DEFAULT_STRATEGY
     min_confirmations: int = MIN_CONFIRMATIONS
     testnet: bool = False
+    conf_target: int = None
+    source_addresses: List[str] = None
+    xpub: str = None
+    gap_limit: int = GAP_LIMIT
+    change_address: str = None
+    seed: int = None
+    change_policy: str = None
 
     def __post_init__(self):
         self.testnet = bool(self.testnet)
         self.requested_net = "test" if self.testnet else "main"
 
-        self._validate_source_address()
+        self._validate_sources()
+        self._validate_change_address()
+        self._validate_change_policy()
         self._validate_outputs()
         self._validate_fee_kb()
+        self._validate_conf_target()
         self._validate_strategy()
+        self._validate_seed()
         self._validate_min_confirmations()
 
-    def _validate_source_address(self):
-        """Validates source_address attr."""
+    def _validate_sources(self):
+        """Validates source_address, source_addresses and xpub attrs.
+
+        Sets source_addresses to [source_address] if a single address is
+        given, and source_address to the first address (or the xpub)
+        otherwise.
+        """
+
+        given = [
+            self.source_address,
+            self.source_addresses is not None,
+            self.xpub is not None,
+        ]
+        if sum(map(bool, given)) > 1:
+            raise ConflictingSourceAddresses()
+
+        if self.xpub is not None:
+            self._validate_xpub()
+        elif self.source_addresses is not None:
+            self._validate_source_addresses()
+        else:
+            self._validate_source_address(self.source_address)
+            self.source_addresses = [self.source_address]
 
-        if not self.source_address:
+    def _validate_source_address(self, source_address: str):
+        """Validates a source address."""
+
+        if not source_address:
             raise EmptySourceAddress()
 
         try:
-            self.source_net = get_version(self.source_address)
+            self.source_net = get_version(source_address)
         except ValueError as err:
-            raise InvalidSourceAddress(self.source_address, str(err))
+            raise InvalidSourceAddress(source_address, str(err))
         else:
             if self.source_net != self.requested_net:
                 raise NetworkMismatchSourceAddress(
-                    self.source_address, self.source_net, self.requested_net
+                    source_address, self.source_net, self.requested_net
                 )
 
-        if self.source_address[0] not in supported_in_prefixes:
+        if source_address[0] not in supported_in_prefixes:
             raise NotSupportedSourceAddress()
 
+    def _validate_source_addresses(self):
+        """Validates source_addresses attr."""
+
+        if not isinstance(self.source_addresses, list) or not self.source_addresses:
+            raise EmptySourceAddress()
+        if len(self.source_addresses) > config.MAX_SOURCE_ADDRESSES:
+            raise TooManySourceAddresses(
+                len(self.source_addresses), config.MAX_SOURCE_ADDRESSES
+            )
+
+        for source_address in self.source_addresses:
+            self._validate_source_address(source_address)
+        self.source_address = self.source_addresses[0]
+
+    def _validate_xpub(self):
+        """Validates xpub and gap_limit attrs."""
+
+        try:
+            self.xpub_key = ExtendedPublicKey.from_string(self.xpub)
+        except ValueError as err:
+            raise InvalidXpub(self.xpub, str(err))
+
+        self.source_net = self.xpub_key.network
+        if self.source_net != self.requested_net:
+            raise NetworkMismatchSourceAddress(
+                self.xpub, self.source_net, self.requested_net
+            )
+        self.source_address = self.xpub
+
+        try:
+            self.gap_limit = int(self.gap_limit)
+            if not 1 <= self.gap_limit <= MAX_GAP_LIMIT:
+                raise ValueError("Gap limit is out of range.")
+        except ValueError as err:
+            raise InvalidGapLimit(self.gap_limit, MAX_GAP_LIMIT, str(err))
+
+    def _validate_change_address(self):
+        """Validates change_address attr."""
+
+        if self.change_address is None:
+            return
+
+        if not self.change_address or self.change_address[0] not in (
+            supported_out_prefixes
+        ):
+            raise InvalidChangeAddress(
+                self.change_address, "Only P2PKH/P2SH change is supported."
+            )
+        try:
+            net = get_version(self.change_address)
+        except ValueError as err:
+            raise InvalidChangeAddress(self.change_address, str(err))
+        if net != self.requested_net:
+            raise InvalidChangeAddress(
+                self.change_address,
+                f"Change address is not a {self.requested_net}net address.",
+            )
+
+    def _validate_change_policy(self):
+        """Validates change_policy attr (defaults to the configured policy)."""
+
+        if self.change_policy is None:
+            self.change_policy = config.CHANGE_POLICY
+        if self.change_policy not in CHANGE_POLICIES:
+            raise InvalidChangePolicy(self.change_policy, CHANGE_POLICIES)
+
+    @property
+    def change_profile(self) -> ChangeProfile:
+        """The profile change is split by (None for a single change output)."""
+
+        return split_change_profile if self.change_policy == SPLIT else None
+
     def _validate_outputs(self):
         """Validates output addresses."""
 
@@ -130,7 +346,12 @@ class PaymentTxRequest:
                 raise InvalidOutputAmount(self.outputs[dest], DUST_THRESHOLD, str(err))
 
     def _validate_fee_kb(self):
-        """Validates fee_kb attr."""
+        """Validates fee_kb attr (defaults to "auto" if conf_target is given)."""
+
+        if self.fee_kb is None:
+            self.fee_kb = MIN_RELAY_FEE if self.conf_target is None else AUTO_FEE
+        if self.fee_kb == AUTO_FEE:
+            return
 
         try:
             self.fee_kb = int(self.fee_kb)
@@ -139,12 +360,47 @@ class PaymentTxRequest:
         except ValueError as err:
             raise InvalidFee(self.fee_kb, MIN_RELAY_FEE, str(err))
 
+    def _validate_conf_target(self):
+        """Validates conf_target attr (only used with "auto" fee_kb)."""
+
+        if self.fee_kb != AUTO_FEE:
+            if self.conf_target is not None:
+                raise InvalidConfTarget(
+                    self.conf_target,
+                    MAX_CONF_TARGET,
+                    'conf_target can only be used with fee_kb "auto".',
+                )
+            return
+
+        if self.conf_target is None:
+            self.conf_target = DEFAULT_CONF_TARGET
+        try:
+            self.conf_target = int(self.conf_target)
+            if not 1 <= self.conf_target <= MAX_CONF_TARGET:
+                raise ValueError("Confirmation target is out of range.")
+        except ValueError as err:
+            raise InvalidConfTarget(self.conf_target, MAX_CONF_TARGET, str(err))
+
     def _validate_strategy(self):
         """Validates strategy attr."""
 
         if self.strategy not in coin_select_strategies.keys():
             raise InvalidStrategy(self.strategy, coin_select_strategies.keys())
 
+    def _validate_seed(self):
+        """Validates seed attr."""
+
+        if self.seed is None:
+            return
+        try:
+            if isinstance(self.seed, bool):
+                raise ValueError("Seed must be a number.")
+            self.seed = int(self.seed)
+            if not 0 <= self.seed < MAX_SEED:
+                raise ValueError("Seed is out of range.")
+        except ValueError as err:
+            raise InvalidSeed(self.seed, MAX_SEED, str(err))
+
     def _validate_min_confirmations(self):
         """Validates min_confirmations attr."""
 
@@ -156,48 +412,528 @@ class PaymentTxRequest:
             raise InvalidMinConfirmations(self.min_confirmations, str(err))
 
 
+@dataclass
+class PaymentQuoteRequest(PaymentTxRequest):
+    """Class representing request data for the /payment_quotes endpoint.
+
+    Takes the fields of PaymentTxRequest, quoting every one of `strategies`
+    (defaults to [strategy]).
+    """
+
+    strategies: List[str] = None
+
+    def _validate_strategy(self):
+        """Validates strategies attr, dropping duplicates."""
+
+        if self.strategies is None:
+            self.strategies = [self.strategy]
+        if not isinstance(self.strategies, list) or not self.strategies:
+            raise InvalidStrategy(self.strategies, coin_select_strategies.keys())
+
+        for strategy in self.strategies:
+            if not isinstance(strategy, str) or strategy not in coin_select_strategies:
+                raise InvalidStrategy(strategy, coin_select_strategies.keys())
+        self.strategies = list(dict.fromkeys(self.strategies))
+        self.strategy = self.strategies[0]
+
+
+@dataclass
+class ConsolidationRequest(PaymentTxRequest):
+    """Class representing request data for the /consolidations endpoint.
+
+    Takes the source, fee and min_confirmations fields of PaymentTxRequest.
+    UTXOs of at most `max_amount` (all if not given) are swept to the change
+    address, `max_inputs` per transaction into `n_outputs` outputs each.
+    """
+
+    max_amount: int = None
+    max_inputs: int = MAX_INPUTS
+    n_outputs: int = 1
+
+    def __post_init__(self):
+        super().__post_init__()
+        self._validate_consolidation()
+
+    def _validate_outputs(self):
+        """Outputs are planned, not requested."""
+
+        self.outputs = {}
+
+    def _validate_strategy(self):
+        """Coins are swept, not selected."""
+
+    def _validate_consolidation(self):
+        """Validates max_amount, max_inputs and n_outputs attrs."""
+
+        if self.max_amount is not None:
+            try:
+                self.max_amount = int(self.max_amount)
+                if self.max_amount <= 0:
+                    raise ValueError("Max amount must be positive.")
+            except ValueError as err:
+                raise InvalidMaxAmount(self.max_amount, str(err))
+
+        try:
+            self.max_inputs = int(self.max_inputs)
+            if not 2 <= self.max_inputs <= MAX_INPUTS:
+                raise ValueError("Max number of inputs is out of range.")
+        except ValueError as err:
+            raise InvalidMaxInputs(self.max_inputs, MAX_INPUTS, str(err))
+
+        try:
+            self.n_outputs = int(self.n_outputs)
+            if not 1 <= self.n_outputs <= MAX_OUTPUTS:
+                raise ValueError("Number of outputs is out of range.")
+        except ValueError as err:
+            raise InvalidOutputCount(self.n_outputs, MAX_OUTPUTS, str(err))
+
+
+def _request_args(data_json: dict) -> tuple:
+    """Returns the PaymentTxRequest fields of a request body, in order."""
+
+    return (
+        data_json.get("source_address", ""),
+        data_json.get("outputs", ""),
+        data_json.get("fee_kb"),
+        data_json.get("strategy", "greedy_random"),
+        data_json.get("min_confirmations", MIN_CONFIRMATIONS),
+        data_json.get("testnet", False),
+        data_json.get("conf_target"),
+        data_json.get("source_addresses"),
+        data_json.get("xpub"),
+        data_json.get("gap_limit", GAP_LIMIT),
+        data_json.get("change_address"),
+        data_json.get("seed"),
+        data_json.get("change_policy"),
+    )
+
+
+def parse_payment_tx_request(data_json: dict) -> PaymentTxRequest:
+    """Creates the (validated) request data of /payment_transactions."""
+
+    return PaymentTxRequest(*_request_args(data_json))
+
+
+def parse_payment_quote_request(data_json: dict) -> PaymentQuoteRequest:
+    """Creates the (validated) request data of /payment_quotes."""
+
+    return PaymentQuoteRequest(*_request_args(data_json), data_json.get("strategies"))
+
+
 @dataclass
 class PaymentTxResponse:
     """Class representing response data for the /payment_transactions endpoint."""
 
     raw: str
     inputs: List[Unspent]
+    fee_kb: int = MIN_RELAY_FEE
+    stale: bool = False
+    utxo_age: float = 0.0
+    input_addresses: List[str] = None
+    input_paths: List[str] = None
+    change_address: str = None
+
+    def to_dict(self):
+        data = {
+            "raw": self.raw,
+            "inputs": _inputs_to_dicts(
+                self.inputs, self.input_addresses, self.input_paths
+            ),
+            "fee_kb": self.fee_kb,
+            "stale": self.stale,
+        }
+        if self.change_address is not None:
+            data["change_address"] = self.change_address
+        if self.stale:
+            data["utxo_age"] = round(self.utxo_age, 3)
+        return data
+
+
+def _inputs_to_dicts(
+    inputs: List[Unspent], addresses: List[str] = None, paths: List[str] = None
+) -> List[dict]:
+    items = [
+        {
+            "txid": utxo.txid,
+            "vout": utxo.txindex,
+            "script_pub_key": utxo.script,
+            "amount": utxo.amount,
+        }
+        for utxo in inputs
+    ]
+    if addresses is not None:
+        for item, address in zip(items, addresses):
+            item["address"] = address
+    if paths is not None:
+        for item, path in zip(items, paths):
+            item["path"] = path
+    return items
+
+
+@dataclass
+class SweepResponse:
+    """Class representing a planned consolidation transaction."""
+
+    raw: str
+    inputs: List[Unspent]
+    outputs: List[Output]
+    fee: int
+    vsize: int
+    input_addresses: List[str] = None
+    input_paths: List[str] = None
 
     def to_dict(self):
         return {
             "raw": self.raw,
-            "inputs": [
-                {
-                    "txid": utxo.txid,
-                    "vout": utxo.txindex,
-                    "script_pub_key": utxo.script,
-                    "amount": utxo.amount,
-                }
-                for utxo in self.inputs
+            "inputs": _inputs_to_dicts(
+                self.inputs, self.input_addresses, self.input_paths
+            ),
+            "outputs": [
+                {"address": out.address, "amount": out.amount} for out in self.outputs
             ],
+            "fee": self.fee,
+            "vsize": self.vsize,
         }
 
 
-def process_payment_tx_request(request: PaymentTxRequest) -> PaymentTxResponse:
-    """Uses request data to create a raw unsigned transaction response."""
+@dataclass
+class ConsolidationResponse:
+    """Class representing response data for the /consolidations endpoint."""
+
+    sweeps: List[SweepResponse]
+    plan: ConsolidationPlan
+    destination: str
+    fee_kb: int = MIN_RELAY_FEE
+    stale: bool = False
+    utxo_age: float = 0.0
+
+    def to_dict(self):
+        data = {
+            "sweeps": [sweep.to_dict() for sweep in self.sweeps],
+            "destination": self.destination,
+            "fee_kb": self.fee_kb,
+            "utxos": self.plan.utxos,
+            "eligible": self.plan.eligible,
+            "uneconomical": self.plan.uneconomical,
+            "utxos_after": self.plan.utxos_after,
+            "stale": self.stale,
+        }
+        if self.stale:
+            data["utxo_age"] = round(self.utxo_age, 3)
+        return data
+
+
+def parse_consolidation_request(data_json: dict) -> ConsolidationRequest:
+    """Creates the (validated) request data of /consolidations."""
+
+    return ConsolidationRequest(
+        *_request_args(data_json),
+        data_json.get("max_amount"),
+        data_json.get("max_inputs", MAX_INPUTS),
+        data_json.get("n_outputs", 1),
+    )
+
+
+@dataclass
+class PaymentQuote:
+    """Class representing the outcome of a coin selection, without the raw tx."""
+
+    strategy: str
+    fee: int
+    change_amount: int
+    n_inputs: int
+    vsize: int
+
+    @classmethod
+    def from_selection(cls, strategy: str, coins: SelectedCoins) -> "PaymentQuote":
+        in_size = sum(utxo.vsize for utxo in coins.inputs)
+        out_size = sum(address_to_output_size(out.address) for out in coins.outputs)
+        return cls(
+            strategy,
+            coins.fee_amount,
+            coins.change_amount,
+            len(coins.inputs),
+            estimate_tx_size(in_size, len(coins.inputs), out_size, len(coins.outputs)),
+        )
+
+    def to_dict(self):
+        return {
+            "strategy": self.strategy,
+            "fee": self.fee,
+            "change_amount": self.change_amount,
+            "n_inputs": self.n_inputs,
+            "vsize": self.vsize,
+        }
+
+
+@dataclass
+class PaymentQuoteResponse:
+    """Class representing response data for the /payment_quotes endpoint."""
+
+    quotes: List[PaymentQuote]
+    fee_kb: int = MIN_RELAY_FEE
+    stale: bool = False
+    utxo_age: float = 0.0
+    change_address: str = None
+
+    def to_dict(self):
+        data = {
+            "quotes": [quote.to_dict() for quote in self.quotes],
+            "fee_kb": self.fee_kb,
+            "stale": self.stale,
+            "change_address": self.change_address,
+        }
+        if self.stale:
+            data["utxo_age"] = round(self.utxo_age, 3)
+        return data
+
+
+def fetch_source_unspents(
+    request: PaymentTxRequest, fanout: UnspentFanout = None
+) -> SourceUnspents:
+    """Fetches UTXOs of the source addresses (or of the xpub) of request."""
+
+    if fanout is None:
+        fanout = unspent_fanout
+    if request.xpub is not None:
+        return fanout.discover(request.xpub_key, request.testnet, request.gap_limit)
+    return fanout.fetch(request.source_addresses, request.testnet)
+
+
+def build_tx_context(
+    request: PaymentTxRequest, stats: RequestStats
+) -> Tuple[TxContext, SourceUnspents]:
+    """Fetches and filters the UTXOs of request, returns the selection context."""
 
     address = request.source_address
-    change_address = address  # TODO: add change_address to PaymentTxRequest
 
-    utxos = list(get_unspent(address, testnet=request.testnet))
+    fee_kb = request.fee_kb
+    if fee_kb == AUTO_FEE:
+        fee_kb = fee_oracles[request.testnet].fee_kb(request.conf_target)
+    stats.info["fee_kb"] = fee_kb
+
+    with stats.stage("fetch"):
+        unspents = fetch_source_unspents(request)
+    utxos = unspents.utxos
+    if unspents.stale:
+        stats.info["stale"] = True
+    stats.count("utxos_fetched", len(utxos))
     if not utxos:
         raise EmptyUnspentTransactionOutputSet(address)
 
-    confirmed = [u for u in utxos if int(u.confirmations) >= request.min_confirmations]
+    with stats.stage("filter"):
+        confirmed = [
+            u for u in utxos if int(u.confirmations) >= request.min_confirmations
+        ]
+    stats.count("utxos_confirmed", len(confirmed))
     if not confirmed:
         raise NoConfirmedTransactionsFound(address, request.min_confirmations)
 
+    # change goes to the next unused change address of an xpub, else back to
+    # the first source address (reused) unless the request names another one
+    change_address = (
+        request.change_address or unspents.change_address or request.source_address
+    )
     outputs = [Output(addr, int(amount)) for addr, amount in request.outputs.items()]
-    context = TxContext(address, confirmed, outputs, request.fee_kb, change_address)
-
-    strategy = coin_select_strategies[request.strategy]
-    selected_coins = strategy.select(context)
-
-    tx = create_unsigned(selected_coins.inputs, selected_coins.outputs)
-
-    return PaymentTxResponse(tx.to_hex(), selected_coins.inputs)
+    context = TxContext(
+        address,
+        confirmed,
+        outputs,
+        fee_kb,
+        change_address,
+        request.seed,
+        request.change_profile,
+    )
+    return context, unspents
+
+
+def filter_uneconomical(
+    context: TxContext, stats: RequestStats
+) -> Tuple[TxContext, CompactUnspents]:
+    """Drops UTXOs worth less than the fee of spending them at context.fee_kb.
+
+    Such UTXOs can't help fund a payment, only make it more expensive, so
+    strategies don't have to walk past them. Effective values are computed
+    once on the compact UTXO set, which is returned along with the filtered
+    context so that it isn't packed again to offload the selection.
+    """
+
+    with stats.stage("economical"):
+        utxos = CompactUnspents.from_unspents(context.inputs)
+        economical = utxos.economical(context.fee_kb)
+        if len(economical) < len(utxos):
+            kept = set(economical)
+            dropped_amount = sum(
+                amount for i, amount in enumerate(utxos.amounts) if i not in kept
+            )
+            stats.count("utxos_uneconomical", len(utxos) - len(economical))
+            stats.count("uneconomical_amount", dropped_amount)
+            if not economical:
+                raise NoEconomicalTransactionsFound(
+                    context.address, dropped_amount, context.fee_kb
+                )
+            utxos = utxos.take(economical)
+            context = context.copy(inputs=[context.inputs[i] for i in economical])
+    return context, utxos
+
+
+def memoizable(strategy: str, context: TxContext) -> bool:
+    """Whether selections of strategy for context may be memoized."""
+
+    return selection_memo.enabled and (
+        coin_select_strategies[strategy].deterministic or context.seed is not None
+    )
+
+
+def process_payment_tx_request(
+    request: PaymentTxRequest, deadline: float = None, stats: RequestStats = None
+) -> PaymentTxResponse:
+    """Uses request data to create a raw unsigned transaction response.
+
+    Coin selection and serialization are offloaded to a process pool for large
+    UTXO sets, falling back to a cheap strategy if `deadline` (an absolute
+    `time.monotonic()` value) would be missed, and skipped altogether for
+    deterministic strategies if the same selection was made recently. UTXOs
+    of all source addresses (given or discovered from the xpub) are fetched
+    in batches and selected from a single pool. While the UTXO providers are
+    unavailable, the last known UTXO sets may be used and the response is
+    marked as stale. An "auto" fee_kb is read from the cached estimates of
+    the fee oracle of the network. UTXOs worth less than the fee of spending
+    them are never selected. Stage timings and counts are collected into
+    `stats` if given.
+    """
+
+    if stats is None:
+        stats = RequestStats()
+
+    context, unspents = build_tx_context(request, stats)
+    context, utxos = filter_uneconomical(context, stats)
+
+    memo_key = memoized = None
+    if memoizable(request.strategy, context):
+        with stats.stage("memo"):
+            memo_key = selection_memo.key(request.strategy, context)
+            memoized = selection_memo.get(memo_key)
+
+    if memoized is not None:
+        selected_coins, raw = memoized
+        stats.info["offload"] = "memo"
+    else:
+        selected_coins, raw = selection_offloader.run(
+            request.strategy, context, deadline, stats, utxos
+        )
+        # fallback selections were made by another strategy
+        if memo_key is not None and stats.info.get("offload") != "fallback":
+            selection_memo.put(memo_key, selected_coins, raw)
+    stats.count("inputs_selected", len(selected_coins.inputs))
+    stats.info["fee"] = selected_coins.fee_amount
+
+    input_addresses = [unspents.owner(utxo) for utxo in selected_coins.inputs]
+    input_paths = None
+    if request.xpub is not None:
+        input_paths = [unspents.path(address) for address in input_addresses]
+
+    return PaymentTxResponse(
+        raw,
+        selected_coins.inputs,
+        context.fee_kb,
+        unspents.stale,
+        unspents.age,
+        input_addresses,
+        input_paths,
+        context.change_address,
+    )
+
+
+def process_payment_quote_request(
+    request: PaymentQuoteRequest, stats: RequestStats = None
+) -> PaymentQuoteResponse:
+    """Quotes the fee, change and size of a payment for each of the strategies.
+
+    All strategies select from a single fetch of the UTXOs (less uneconomical
+    ones), and selections are not serialized. Selections of deterministic
+    strategies memoized by /payment_transactions are reused.
+    """
+
+    if stats is None:
+        stats = RequestStats()
+
+    context, unspents = build_tx_context(request, stats)
+    context, _ = filter_uneconomical(context, stats)
+
+    quotes = []
+    for strategy in request.strategies:
+        memoized = None
+        if memoizable(strategy, context):
+            with stats.stage("memo"):
+                memoized = selection_memo.get(selection_memo.key(strategy, context))
+        if memoized is not None:
+            selected_coins = memoized[0]
+        else:
+            with stats.stage("select"):
+                selected_coins = coin_select_strategies[strategy].select(context)
+        quotes.append(PaymentQuote.from_selection(strategy, selected_coins))
+
+    return PaymentQuoteResponse(
+        quotes,
+        context.fee_kb,
+        unspents.stale,
+        unspents.age,
+        context.change_address,
+    )
+
+
+def process_consolidation_request(
+    request: ConsolidationRequest, stats: RequestStats = None
+) -> ConsolidationResponse:
+    """Plans and creates the raw unsigned sweeps consolidating the UTXOs.
+
+    Sweeps pay to the change address (the change address of the request, the
+    next xpub change address or the first source address) at the fee_kb of
+    the request. Only UTXOs with min_confirmations are swept.
+    """
+
+    if stats is None:
+        stats = RequestStats()
+
+    context, unspents = build_tx_context(request, stats)
+
+    with stats.stage("plan"):
+        plan = plan_consolidation(
+            context.inputs,
+            context.change_address,
+            context.fee_kb,
+            request.max_amount,
+            request.max_inputs,
+            request.n_outputs,
+        )
+    stats.count("inputs_selected", plan.swept)
+
+    sweeps = []
+    with stats.stage("serialize"):
+        for sweep in plan.sweeps:
+            raw = create_unsigned(sweep.inputs, sweep.outputs).to_hex()
+            input_addresses = [unspents.owner(utxo) for utxo in sweep.inputs]
+            input_paths = None
+            if request.xpub is not None:
+                input_paths = [unspents.path(address) for address in input_addresses]
+            sweeps.append(
+                SweepResponse(
+                    raw,
+                    sweep.inputs,
+                    sweep.outputs,
+                    sweep.fee,
+                    sweep.vsize,
+                    input_addresses,
+                    input_paths,
+                )
+            )
+
+    return ConsolidationResponse(
+        sweeps,
+        plan,
+        context.change_address,
+        context.fee_kb,
+        unspents.stale,
+        unspents.age,
+    )
@@ -1,4 +1,11 @@
-from app.errors import InvalidUsage, BAD_REQUEST
+from app.errors import (
+    InvalidUsage,
+    BAD_REQUEST,
+    CONFLICT,
+    UNPROCESSABLE_ENTITY,
+    TOO_MANY_REQUESTS,
+    SERVICE_UNAVAILABLE,
+)
 
 # source_address errors
 
@@ -43,6 +50,72 @@ class NotSupportedSourceAddress(InvalidUsage):
         super().__init__("Only P2PKH inputs are supported", BAD_REQUEST)
 
 
+class ConflictingSourceAddresses(InvalidUsage):
+    """Error when more than one kind of source is given."""
+
+    def __init__(self):
+        super().__init__(
+            "Please specify only one of source_address, source_addresses or xpub.",
+            BAD_REQUEST,
+        )
+
+
+class TooManySourceAddresses(InvalidUsage):
+    """Error when there are too many source addresses."""
+
+    def __init__(self, count, max_count):
+        super().__init__(
+            f"Please specify at most {max_count} source addresses.",
+            BAD_REQUEST,
+            payload={"count": count},
+        )
+
+
+class InvalidXpub(InvalidUsage):
+    """Error when xpub is invalid."""
+
+    def __init__(self, xpub, description):
+        super().__init__(
+            "Please specify valid extended public key (xpub/tpub).",
+            BAD_REQUEST,
+            payload={"xpub": xpub, "description": description},
+        )
+
+
+class InvalidGapLimit(InvalidUsage):
+    """Error when gap_limit is invalid."""
+
+    def __init__(self, gap_limit, max_gap_limit, description):
+        super().__init__(
+            f"Please specify valid number in [1, {max_gap_limit}] for gap_limit.",
+            BAD_REQUEST,
+            payload={"gap_limit": gap_limit, "description": description},
+        )
+
+
+class InvalidChangeAddress(InvalidUsage):
+    """Error when change address is invalid."""
+
+    def __init__(self, change_address, description):
+        super().__init__(
+            "Please specify valid change address.",
+            BAD_REQUEST,
+            payload={"change_address": change_address, "description": description},
+        )
+
+
+class InvalidChangePolicy(InvalidUsage):
+    """Error when change policy is invalid."""
+
+    def __init__(self, change_policy, change_policies):
+        change_policies_str = "|".join(change_policies)
+        super().__init__(
+            f"Please specify one of [{change_policies_str}] for change_policy.",
+            BAD_REQUEST,
+            payload={"change_policy": change_policy},
+        )
+
+
 # outputs errors
 
 
@@ -116,6 +189,17 @@ class InvalidStrategy(InvalidUsage):
         )
 
 
+class InvalidSeed(InvalidUsage):
+    """Error when seed is invalid."""
+
+    def __init__(self, seed, max_seed, description):
+        super().__init__(
+            f"Please specify valid number in [0, {max_seed}) for seed.",
+            BAD_REQUEST,
+            payload={"seed": seed, "description": description},
+        )
+
+
 # fee_kb errors
 
 
@@ -130,6 +214,28 @@ class InvalidFee(InvalidUsage):
         )
 
 
+class InvalidConfTarget(InvalidUsage):
+    """Error when conf_target is invalid."""
+
+    def __init__(self, conf_target, max_conf_target, description):
+        super().__init__(
+            f"Please specify valid number of blocks in [1, {max_conf_target}] for conf_target.",
+            BAD_REQUEST,
+            payload={"conf_target": conf_target, "description": description},
+        )
+
+
+class FeeEstimateUnavailable(InvalidUsage):
+    """Error when there is no (recent enough) fee-rate estimate."""
+
+    def __init__(self, source: str):
+        super().__init__(
+            "No recent fee-rate estimate, please specify fee_kb.",
+            SERVICE_UNAVAILABLE,
+            payload={"source": source},
+        )
+
+
 # min_confirmations errors
 
 
@@ -145,3 +251,125 @@ class InvalidMinConfirmations(InvalidUsage):
                 "description": description,
             },
         )
+
+
+# consolidation errors
+
+
+class InvalidMaxAmount(InvalidUsage):
+    """Error when max_amount of a consolidation is invalid."""
+
+    def __init__(self, max_amount, description):
+        super().__init__(
+            "Please specify valid amount > 0 (in SAT) for max_amount.",
+            BAD_REQUEST,
+            payload={"max_amount": max_amount, "description": description},
+        )
+
+
+class InvalidMaxInputs(InvalidUsage):
+    """Error when max_inputs of a consolidation is invalid."""
+
+    def __init__(self, max_inputs, limit, description):
+        super().__init__(
+            f"Please specify valid number in [2, {limit}] for max_inputs.",
+            BAD_REQUEST,
+            payload={"max_inputs": max_inputs, "description": description},
+        )
+
+
+class InvalidOutputCount(InvalidUsage):
+    """Error when n_outputs of a consolidation is invalid."""
+
+    def __init__(self, n_outputs, limit, description):
+        super().__init__(
+            f"Please specify valid number in [1, {limit}] for n_outputs.",
+            BAD_REQUEST,
+            payload={"n_outputs": n_outputs, "description": description},
+        )
+
+
+# routing errors
+
+
+class SourceAddressHeaderMismatch(InvalidUsage):
+    """Error when the routing header doesn't match the source of the request."""
+
+    def __init__(self, header, value, source_address):
+        super().__init__(
+            f"Please specify the source address (the first of source_addresses, or the xpub) of the request in the {header} header.",
+            BAD_REQUEST,
+            payload={"header": value, "source_address": source_address},
+        )
+
+
+# idempotency errors
+
+
+class InvalidIdempotencyKey(InvalidUsage):
+    """Error when the idempotency key is invalid."""
+
+    def __init__(self, max_length):
+        super().__init__(
+            f"Please specify non-empty Idempotency-Key of at most {max_length} characters.",
+            BAD_REQUEST,
+        )
+
+
+class IdempotencyKeyMismatch(InvalidUsage):
+    """Error when the idempotency key was used with another request."""
+
+    def __init__(self, key):
+        super().__init__(
+            "Idempotency-Key was already used with another request body.",
+            UNPROCESSABLE_ENTITY,
+            payload={"idempotency_key": key},
+        )
+
+
+class IdempotencyKeyInUse(InvalidUsage):
+    """Error when a request with the idempotency key is still being processed."""
+
+    def __init__(self, key):
+        super().__init__(
+            "A request with this Idempotency-Key is still being processed.",
+            CONFLICT,
+            payload={"idempotency_key": key},
+        )
+
+
+# admission errors
+
+
+class RequestRejected(InvalidUsage):
+    """Error when a request is rejected before being processed (load shedding)."""
+
+    def __init__(self, message, status_code, retry_after: float, payload=None):
+        super().__init__(
+            message, status_code, payload=dict(payload or {}, retry_after=retry_after)
+        )
+        self.retry_after = retry_after
+
+
+class ServerOverloaded(RequestRejected):
+    """Error when the service has no capacity left for a request."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(
+            "The service is overloaded, please retry later.",
+            SERVICE_UNAVAILABLE,
+            retry_after,
+            payload={"reason": reason},
+        )
+
+
+class TooManyConcurrentRequests(RequestRejected):
+    """Error when a client or source address has too many requests in progress."""
+
+    def __init__(self, scope: str, limit: int, retry_after: float):
+        super().__init__(
+            f"Too many concurrent requests of the same {scope.replace('_', ' ')}.",
+            TOO_MANY_REQUESTS,
+            retry_after,
+            payload={"scope": scope, "limit": limit},
+        )
@@ -0,0 +1,108 @@
+import cProfile
+import hmac
+import itertools
+import json
+import logging
+import os
+import random
+import threading
+import time
+from typing import Any, Dict
+
+from app import config
+from app.stats import RequestStats
+
+# request header used to ask for a profile of a single request
+PROFILE_HEADER = "X-Profile-Token"
+
+logger = logging.getLogger(__name__)
+
+
+class RequestProfiler:
+    """Profiles sampled requests with cProfile and dumps the results to disk.
+
+    A request is profiled if profiling is enabled and the request is sampled
+    (with probability `sample_rate`), or if it carries the privileged `token`
+    in the `X-Profile-Token` header. Each profile is written as a `.pstats`
+    file next to a `.json` file holding the request's metadata (strategy,
+    UTXO counts, stage timings), ready to be turned into flamegraphs offline
+    (e.g. using `flameprof` or `gprof2dot`). Failing to write a profile is
+    logged (and counted in `dump_errors`) but never fails the request.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = config.PROFILE_ENABLED,
+        sample_rate: float = config.PROFILE_SAMPLE_RATE,
+        output_dir: str = config.PROFILE_DIR,
+        token: str = config.PROFILE_TOKEN,
+    ):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.output_dir = output_dir
+        self.token = token
+        self.dump_errors = 0
+        self._dumps = itertools.count()
+        # own generator, so sampling doesn't consume the global random state
+        self._random = random.Random()
+
+    def should_profile(self, header_token: str = None) -> bool:
+        """Decides if the current request should be profiled."""
+
+        if self.token and header_token:
+            if hmac.compare_digest(self.token, header_token):
+                return True
+        return self.enabled and self._random.random() < self.sample_rate
+
+    def run(self, metadata: Dict[str, Any], stats: RequestStats, func, *args):
+        """Calls `func(*args)` under the profiler and dumps the profile.
+
+        The profile is dumped even if `func` raises, with the error name
+        attached to the metadata.
+        """
+
+        profiler = cProfile.Profile()
+        started = time.monotonic()
+        error = None
+        try:
+            return profiler.runcall(func, *args)
+        except Exception as e:
+            error = e.__class__.__name__
+            raise
+        finally:
+            duration = time.monotonic() - started
+            metadata = dict(
+                metadata,
+                duration=duration,
+                error=error,
+                counts=stats.counts,
+                timings=stats.timings,
+                info=stats.info,
+            )
+            try:
+                self.dump(profiler, metadata)
+            except Exception:
+                self.dump_errors += 1
+                logger.exception("Failed to dump profile to %s", self.output_dir)
+
+    def dump(self, profiler: cProfile.Profile, metadata: Dict[str, Any]) -> str:
+        """Writes the profile and its metadata, returns the path prefix.
+
+        Names hold the pid, thread id and a per-profiler counter, so profiles
+        dumped by concurrent requests never collide.
+        """
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        name = "{}-{}-{}-{}-{}".format(
+            time.strftime("%Y%m%dT%H%M%S"),
+            os.getpid(),
+            threading.get_ident(),
+            next(self._dumps),
+            metadata.get("strategy", "unknown"),
+        )
+        prefix = os.path.join(self.output_dir, name)
+
+        profiler.dump_stats(f"{prefix}.pstats")
+        with open(f"{prefix}.json", "w") as f:
+            json.dump(metadata, f, indent=2, default=str)
+        return prefix
@@ -0,0 +1,65 @@
+"""Routing of requests to btc_api instances by source address.
+
+NGINX picks the instance serving a request by a consistent hash of its
+X-Source-Address header (see nginx/project.conf), so the UTXO cache,
+memoized selections, idempotency keys and admission counts of a source
+address stay on one instance, and adding or removing an instance moves only
+a share of the addresses. The body can't be hashed by NGINX, so clients send
+the source address (the first of `source_addresses`, or the `xpub`) in the
+header, and responses carry the header so clients can learn it.
+"""
+from ipaddress import ip_address, ip_network
+from typing import List, Optional
+
+from app.payment import PaymentTxRequest
+from app.payment_errors import SourceAddressHeaderMismatch
+
+SOURCE_ADDRESS_HEADER = "X-Source-Address"
+# header carrying the address of the client, set by NGINX
+REAL_IP_HEADER = "X-Real-IP"
+
+
+def routing_key(data: PaymentTxRequest) -> str:
+    """Returns the value of the routing header for a request."""
+
+    return data.source_address
+
+
+def check_routing_header(value: Optional[str], data: PaymentTxRequest):
+    """Rejects requests whose routing header names another source.
+
+    Such requests were routed by a key other than their own, so they'd miss
+    the state kept for their source address. The header is optional.
+    """
+
+    if value is not None and value != routing_key(data):
+        raise SourceAddressHeaderMismatch(
+            SOURCE_ADDRESS_HEADER, value, routing_key(data)
+        )
+
+
+def parse_networks(values: List[str]) -> list:
+    """Parses addresses and networks (e.g. `10.0.0.0/8`) of trusted proxies."""
+
+    return [ip_network(value, strict=False) for value in values]
+
+
+def resolve_client_address(
+    remote_addr: Optional[str], real_ip: Optional[str], trusted_proxies: list
+) -> Optional[str]:
+    """Returns the address of the client of a request.
+
+    The X-Real-IP header is only honoured if the request comes from one of
+    `trusted_proxies`, as any other caller could pick its own address (e.g.
+    to get around the per-client admission limit).
+    """
+
+    if not real_ip or not remote_addr:
+        return remote_addr
+    try:
+        address = ip_address(remote_addr)
+    except ValueError:
+        return remote_addr
+    if any(address in network for network in trusted_proxies):
+        return real_ip
+    return remote_addr
@@ -0,0 +1,48 @@
+from time import perf_counter
+from typing import Any, Dict
+
+
+class StageTimer:
+    """Context manager adding the elapsed time of a stage to request stats."""
+
+    __slots__ = ("timings", "name", "started")
+
+    def __init__(self, timings: Dict[str, float], name: str):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.started = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = perf_counter() - self.started
+        self.timings[self.name] = self.timings.get(self.name, 0.0) + elapsed
+        return False
+
+
+class RequestStats:
+    """Class collecting per-request stage timings, counts and attributes."""
+
+    __slots__ = ("timings", "counts", "info")
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+        self.info: Dict[str, Any] = {}
+
+    def stage(self, name: str) -> StageTimer:
+        """Times a stage of the request (usable as a context manager)."""
+
+        return StageTimer(self.timings, name)
+
+    def count(self, name: str, value: int):
+        """Records a count (e.g. size of the UTXO set) for the request."""
+
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def merge_timings(self, timings: Dict[str, float]):
+        """Adds timings measured elsewhere (e.g. in a pool process)."""
+
+        for name, elapsed in timings.items():
+            self.timings[name] = self.timings.get(name, 0.0) + elapsed
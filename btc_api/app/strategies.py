@@ -0,0 +1,74 @@
+import itertools
+import random
+import threading
+
+from app.wallet.coin_select import (
+    BestFit,
+    GreedyMaxSecure,
+    GreedyMaxCoins,
+    GreedyMinCoins,
+    GreedyRandom,
+)
+
+RANDOM_SEED = 1234
+
+
+class StrategyRandom:
+    """Generators of the random strategies, one per thread.
+
+    Threads never share generator state, so random selections neither contend
+    for it nor depend on how the requests of a threaded worker interleave.
+    The generator of a thread is seeded from the seed of the process and the
+    number of the thread (in order of first use), and reseeded lazily once
+    the seed of the process changes. Generators of the random strategies are
+    their own, so importing the app doesn't reseed the global `random`.
+    """
+
+    def __init__(self, seed: int = RANDOM_SEED):
+        self._seed = seed
+        self._generation = 0
+        self._threads = itertools.count()
+        self._local = threading.local()
+
+    def seed(self, seed: int):
+        self._seed = seed
+        self._generation += 1
+
+    def get(self) -> random.Random:
+        """Returns the generator of the current thread."""
+
+        local = self._local
+        if getattr(local, "generation", None) != self._generation:
+            if not hasattr(local, "number"):
+                local.number = next(self._threads)
+            local.random = random.Random(f"{self._seed}-{local.number}")
+            local.generation = self._generation
+        return local.random
+
+    def shuffle(self, x: list):
+        self.get().shuffle(x)
+
+
+strategy_random = StrategyRandom(RANDOM_SEED)
+
+# strategies are stateless (the random one keeps its state per thread), so
+# the registry is shared by all threads of a worker and never changes
+coin_select_strategies = {
+    "greedy_max_secure": GreedyMaxSecure(),
+    "greedy_max_coins": GreedyMaxCoins(),
+    "greedy_min_coins": GreedyMinCoins(),
+    "greedy_random": GreedyRandom(strategy_random),
+    "best_fit": BestFit(),
+}
+
+DEFAULT_STRATEGY = list(coin_select_strategies.keys())[0]
+
+
+def reseed(seed: int = RANDOM_SEED):
+    """Reseeds the generators of the random strategies (of all threads).
+
+    Workers forked from a preloading master inherit its generator state, so
+    they're reseeded (with distinct seeds) after the fork.
+    """
+
+    strategy_random.seed(seed)
@@ -0,0 +1,57 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Class representing a bounded LRU cache whose entries expire after ttl seconds."""
+
+    def __init__(self, max_entries: int, ttl: float, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        """Returns the value of key, default if missing or expired."""
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if self.clock() >= expires_at:
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, self.clock() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            return default if entry is None else entry[0]
+
+    def sample(self, n: int) -> list:
+        """Returns (key, value) of the n most recently used entries."""
+
+        with self._lock:
+            items = list(itertools.islice(reversed(self._entries.items()), n))
+        return [(key, value) for key, (value, _) in items]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,104 @@
+import threading
+import time
+
+from app.wallet.exceptions import UnspentSourceUnavailable
+
+FAILURE_THRESHOLD = 5
+RESET_TIMEOUT_SEC = 30.0
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Class failing calls fast while an upstream service is unhealthy.
+
+    The breaker opens after `failure_threshold` consecutive failures and
+    rejects calls for `reset_timeout` seconds. After that a single trial call
+    is let through (half-open): if it succeeds the breaker closes, otherwise
+    it opens again for another `reset_timeout`.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = FAILURE_THRESHOLD,
+        reset_timeout: float = RESET_TIMEOUT_SEC,
+        clock=time.monotonic,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.rejected = 0
+        self.trips = 0
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self.opened_at is None:
+            return CLOSED
+        if self.clock() - self.opened_at >= self.reset_timeout:
+            return HALF_OPEN
+        return OPEN
+
+    def retry_after(self) -> float:
+        """Returns seconds until a trial call is let through (0 if closed)."""
+
+        with self._lock:
+            if self.opened_at is None:
+                return 0.0
+            return max(0.0, self.opened_at + self.reset_timeout - self.clock())
+
+    def allow(self) -> bool:
+        """Returns whether a call may be made now, reserving the trial call."""
+
+        with self._lock:
+            state = self._state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._trial:
+                self._trial = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or (
+                self.opened_at is None and self.failures >= self.failure_threshold
+            ):
+                self.opened_at = self.clock()
+                self.trips += 1
+            self._trial = False
+
+    def call(self, func, *args, **kwargs):
+        """Calls func unless the breaker is open.
+
+        Raises UnspentSourceUnavailable if the call is rejected.
+        """
+
+        if not self.allow():
+            raise UnspentSourceUnavailable(self.name, self.retry_after())
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
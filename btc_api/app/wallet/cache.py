@@ -0,0 +1,300 @@
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from bit.transaction import address_to_scriptpubkey
+from bit.wallet import Unspent
+
+from app.wallet.breaker import CircuitBreaker, CLOSED
+from app.wallet.query import ADDRESS_SEPARATOR
+
+FRESH_TTL_SEC = 0.0
+MAX_STALE_SEC = 300.0
+MAX_ENTRIES = 10000
+REFRESH_THREADS = 2
+
+
+@dataclass
+class CachedUnspents:
+    """Class representing the UTXO set of an address and how old it is."""
+
+    utxos: List[Unspent]
+    age: float = 0.0
+    stale: bool = False
+
+
+@dataclass
+class _Entry:
+    utxos: Tuple[Unspent, ...]
+    fetched_at: float
+
+
+def split_by_address(
+    addresses: List[str], utxos: List[Unspent]
+) -> Dict[str, List[Unspent]]:
+    """Maps UTXOs of a query of several addresses back to them by script."""
+
+    if len(addresses) == 1:
+        return {addresses[0]: list(utxos)}
+    scripts = {address_to_scriptpubkey(a).hex(): a for a in addresses}
+    by_address = {address: [] for address in addresses}
+    for utxo in utxos:
+        address = scripts.get(utxo.script.lower())
+        if address is not None:
+            by_address[address].append(utxo)
+    return by_address
+
+
+class StaleUnspentCache:
+    """Serves UTXO sets from an upstream source guarded by a circuit breaker.
+
+    Sets younger than `fresh_ttl` are served without asking the upstream
+    (disabled by default). While the breaker is open, or if the upstream
+    fails, the last known set of an address is served as stale if it isn't
+    older than `max_stale` (0 disables stale serving); an open breaker also
+    schedules a background refresh, so the foreground request never waits for
+    the trial call. Without a usable set the upstream error is raised
+    (UnspentSourceUnavailable when the breaker rejected the call).
+
+    Sets not cached yet are restored (once) from `snapshot` (an
+    UnspentSnapshot written before a restart) if given: they are served like
+    cached sets, and as stale while being revalidated in the background if
+    they aren't fresh.
+
+    Sets are cached per address: `lookup_many` queries the upstream once for
+    all the addresses it has to fetch (joined by `|`) and caches the set of
+    each address on its own, so overlapping sets of addresses share entries.
+    """
+
+    def __init__(
+        self,
+        source,
+        breaker: CircuitBreaker = None,
+        fresh_ttl: float = FRESH_TTL_SEC,
+        max_stale: float = MAX_STALE_SEC,
+        max_entries: int = MAX_ENTRIES,
+        refresh_threads: int = REFRESH_THREADS,
+        clock=time.monotonic,
+        snapshot=None,
+    ):
+        self.source = source
+        self.breaker = breaker or CircuitBreaker("unspent", clock=clock)
+        self.fresh_ttl = fresh_ttl
+        self.max_stale = max_stale
+        self.max_entries = max_entries
+        self.refresh_threads = refresh_threads
+        self.clock = clock
+        self.snapshot = snapshot
+        self.hits = 0
+        self.stale_served = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self.restored = 0
+        self._entries = OrderedDict()
+        self._restored_keys = set()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._executor_pid = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _get(self, key) -> Optional[_Entry]:
+        with self._lock:
+            return self._entries.get(key)
+
+    def _put(self, key, utxos: List[Unspent]):
+        if not self.fresh_ttl and not self.max_stale:
+            return
+        with self._lock:
+            self._entries[key] = _Entry(tuple(utxos), self.clock())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _restore(self, key) -> Optional[_Entry]:
+        """Puts the set of key from the snapshot into the cache (once per key)."""
+
+        snapshot = self.snapshot
+        if snapshot is None:
+            return None
+        # checked and restored under the lock, so concurrent misses restore once
+        with self._lock:
+            if key in self._restored_keys or key not in snapshot:
+                return None
+            self._restored_keys.add(key)
+            utxos, age = snapshot.get(key)
+            if age >= max(self.fresh_ttl, self.max_stale):
+                return None
+
+            if key in self._entries:
+                return self._entries[key]
+            entry = _Entry(tuple(utxos), self.clock() - age)
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self.restored += 1
+        return entry
+
+    def entries(self) -> List[Tuple[bool, str, List[Unspent], float]]:
+        """Returns (testnet, address, utxos, age) of all cached UTXO sets."""
+
+        with self._lock:
+            items = list(self._entries.items())
+        now = self.clock()
+        return [
+            (testnet, address, list(entry.utxos), now - entry.fetched_at)
+            for (testnet, address), entry in items
+        ]
+
+    def sample(self, n: int) -> List[Tuple[tuple, Tuple[Unspent, ...]]]:
+        """Returns (key, utxos) of the n most recently cached UTXO sets."""
+
+        with self._lock:
+            items = list(itertools.islice(reversed(self._entries.items()), n))
+        return [(key, entry.utxos) for key, entry in items]
+
+    def set_sizes(self) -> List[int]:
+        """Returns the number of UTXOs of every cached UTXO set."""
+
+        with self._lock:
+            return [len(entry.utxos) for entry in self._entries.values()]
+
+    def _fetch(self, testnet: bool, addresses: List[str]) -> Dict[str, List[Unspent]]:
+        query = ADDRESS_SEPARATOR.join(addresses)
+        utxos = list(self.breaker.call(self.source.get_unspent, query, testnet))
+        by_address = split_by_address(addresses, utxos)
+        for address, address_utxos in by_address.items():
+            self._put((testnet, address), address_utxos)
+        return by_address
+
+    def _stale(self, entry: Optional[_Entry]) -> Optional[CachedUnspents]:
+        if entry is None:
+            return None
+        age = self.clock() - entry.fetched_at
+        if age > self.max_stale:
+            return None
+        return CachedUnspents(list(entry.utxos), age, stale=True)
+
+    def cached(
+        self, addresses: List[str], testnet: bool = False
+    ) -> Dict[str, CachedUnspents]:
+        """Returns the fresh cached UTXO sets among those of addresses."""
+
+        now = self.clock()
+        results = {}
+        for address in addresses:
+            entry = self._get((bool(testnet), address))
+            if entry is not None and now - entry.fetched_at < self.fresh_ttl:
+                self.hits += 1
+                results[address] = CachedUnspents(
+                    list(entry.utxos), now - entry.fetched_at
+                )
+        return results
+
+    def lookup_many(
+        self, addresses: List[str], testnet: bool = False
+    ) -> Dict[str, CachedUnspents]:
+        """Returns the UTXO sets of addresses, possibly stale ones.
+
+        The sets which have to be fetched are fetched in a single upstream
+        query.
+        """
+
+        testnet = bool(testnet)
+        results = {}
+        missing = []
+        for address in addresses:
+            key = (testnet, address)
+            entry = self._get(key)
+            restored = False
+            if entry is None:
+                entry = self._restore(key)
+                restored = entry is not None
+            if entry is not None:
+                age = self.clock() - entry.fetched_at
+                if age < self.fresh_ttl:
+                    self.hits += 1
+                    results[address] = CachedUnspents(list(entry.utxos), age)
+                    continue
+
+            # restored sets are revalidated in the background, like while open
+            if restored or self.breaker.state != CLOSED:
+                cached = self._stale(entry)
+                if cached is not None:
+                    self.stale_served += 1
+                    self.refresh(address, testnet)
+                    results[address] = cached
+                    continue
+            missing.append((address, entry))
+
+        if not missing:
+            return results
+
+        try:
+            fetched = self._fetch(testnet, [address for address, _ in missing])
+        except Exception:
+            stale = {address: self._stale(entry) for address, entry in missing}
+            if any(cached is None for cached in stale.values()):
+                raise
+            self.stale_served += len(stale)
+            results.update(stale)
+            return results
+        for address, utxos in fetched.items():
+            results[address] = CachedUnspents(utxos)
+        return results
+
+    def lookup(self, address: str, testnet: bool = False) -> CachedUnspents:
+        """Returns the UTXO set of address, possibly a stale one."""
+
+        return self.lookup_many([address], testnet)[address]
+
+    def age(self, address: str, testnet: bool = False) -> Optional[float]:
+        """Returns the age of the cached UTXO set of address (None if not cached)."""
+
+        entry = self._get((bool(testnet), address))
+        return None if entry is None else self.clock() - entry.fetched_at
+
+    def get_unspent(self, address: str, testnet: bool = False) -> List[Unspent]:
+        """Fetches all unspent transactions for a bitcoin address."""
+
+        return self.lookup(address, testnet).utxos
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Lazily creates the executor (once per process, safe across forks)."""
+
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.refresh_threads)
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def refresh(self, address: str, testnet: bool = False):
+        """Refreshes the UTXO set of address in the background.
+
+        Returns the future of the refresh, None if one is already running.
+        """
+
+        key = (bool(testnet), address)
+        with self._lock:
+            if key in self._refreshing:
+                return None
+            self._refreshing.add(key)
+        return self._get_executor().submit(self._refresh, key)
+
+    def _refresh(self, key):
+        testnet, address = key
+        try:
+            self._fetch(testnet, [address])
+            self.refreshes += 1
+        except Exception:
+            self.refresh_errors += 1
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
@@ -0,0 +1,67 @@
+from bisect import bisect_right
+from typing import Iterable, List, NamedTuple, Tuple
+
+SINGLE = "single"
+SPLIT = "split"
+CHANGE_POLICIES = (SINGLE, SPLIT)
+
+MAX_CHANGE_OUTPUTS = 5
+
+
+class ChangeProfile(NamedTuple):
+    """Class representing the UTXO pool the split change policy keeps up.
+
+    `targets` holds (denomination, count) pairs, largest denomination first:
+    the pool should hold `count` UTXOs able to pay `denomination` by
+    themselves. Change is split into outputs of the denominations short of
+    their count, at most `max_outputs` change outputs per transaction.
+    """
+
+    targets: Tuple[Tuple[int, int], ...]
+    max_outputs: int = MAX_CHANGE_OUTPUTS
+
+
+def parse_change_profile(
+    value: str, max_outputs: int = MAX_CHANGE_OUTPUTS
+) -> ChangeProfile:
+    """Parses a profile of comma separated `denomination:count` pairs (in SAT).
+
+    Raises ValueError if the profile is malformed.
+    """
+
+    targets = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        denomination, _, count = item.partition(":")
+        denomination, count = int(denomination), int(count)
+        if denomination <= 0 or count < 0:
+            raise ValueError(f"Invalid change profile target {item.strip()!r}.")
+        targets[denomination] = count
+    if max_outputs < 1:
+        raise ValueError("Max number of change outputs must be positive.")
+    return ChangeProfile(tuple(sorted(targets.items(), reverse=True)), max_outputs)
+
+
+def pool_deficits(
+    profile: ChangeProfile, amounts: Iterable[int]
+) -> List[Tuple[int, int]]:
+    """Returns (denomination, missing count) of the denominations short of target.
+
+    A UTXO of `amounts` counts towards the largest denomination it can pay.
+    Largest denomination first.
+    """
+
+    denominations = sorted(denomination for denomination, _ in profile.targets)
+    counts = [0] * len(denominations)
+    for amount in amounts:
+        i = bisect_right(denominations, amount)
+        if i:
+            counts[i - 1] += 1
+
+    have = dict(zip(denominations, counts))
+    return [
+        (denomination, count - have[denomination])
+        for denomination, count in profile.targets
+        if have[denomination] < count
+    ]
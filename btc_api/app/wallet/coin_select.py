@@ -1,8 +1,9 @@
 import math
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
-from typing import Dict, List, Tuple
+from typing import Dict, List, NamedTuple, Tuple
 from functools import partial
+from operator import attrgetter
+from random import Random
 
 from bit.wallet import Unspent
 
@@ -12,13 +13,14 @@ from app.wallet.transaction import (
     address_to_output_size,
     estimate_tx_fee_kb,
 )
+from app.wallet.change import pool_deficits
 from app.wallet.exceptions import InsufficientFunds
+from app.wallet.index import AmountIndex
 
 DUST_THRESHOLD = 5430
 
 
-@dataclass(frozen=True)
-class SelectedCoins:
+class SelectedCoins(NamedTuple):
     """Class represents result of a successfull coin selection."""
 
     inputs: List[Unspent]
@@ -37,6 +39,9 @@ class UnspentCoinSelector(ABC):
     Strategies.
     """
 
+    # whether the same context always results in the same selection
+    deterministic = True
+
     @abstractmethod
     def select(self, context: TxContext) -> SelectedCoins:
         """
@@ -47,6 +52,64 @@ class UnspentCoinSelector(ABC):
         pass
 
 
+def outputs_target(context: TxContext, in_size: int, n_in: int) -> int:
+    """Returns the input amount paying outputs and fee (without change)."""
+
+    out_amount = sum(out.amount for out in context.outputs)
+    out_size = sum(address_to_output_size(out.address) for out in context.outputs)
+    fee = estimate_tx_fee_kb(
+        in_size, n_in, out_size, len(context.outputs), context.fee_kb
+    )
+    return out_amount + fee
+
+
+def split_change(
+    context: TxContext,
+    selected: List[Unspent],
+    in_size: int,
+    out_size: int,
+    n_out: int,
+    fee: int,
+    change_amount: int,
+) -> Tuple[List[int], int]:
+    """Splits change into outputs of the denominations the pool is short of.
+
+    The pool is the UTXOs of the context left after the selection. Outputs
+    of the missing denominations (largest first) are carved out of the change
+    as long as the rest, less the fee of the extra outputs, isn't dust. Sizes
+    include the single change output. Returns the change amounts (the rest
+    last) and the fee.
+    """
+
+    profile = context.change_profile
+    selected_ids = {id(utxo) for utxo in selected}
+    pool = (utxo.amount for utxo in context.inputs if id(utxo) not in selected_ids)
+    change_out_size = address_to_output_size(context.change_address)
+
+    amounts = []
+    for denomination, missing in pool_deficits(profile, pool):
+        if denomination < DUST_THRESHOLD:
+            continue
+        for _ in range(missing):
+            if len(amounts) + 1 >= profile.max_outputs:
+                break
+            n_split = len(amounts) + 1
+            split_fee = estimate_tx_fee_kb(
+                in_size,
+                len(selected),
+                out_size + n_split * change_out_size,
+                n_out + n_split,
+                context.fee_kb,
+            )
+            rest = change_amount + fee - split_fee - denomination
+            if rest < DUST_THRESHOLD:
+                break
+            amounts.append(denomination)
+            change_amount, fee = rest, split_fee
+    amounts.append(change_amount)
+    return amounts, fee
+
+
 class Greedy(UnspentCoinSelector):
     def select(self, context: TxContext) -> SelectedCoins:
         """
@@ -56,10 +119,22 @@ class Greedy(UnspentCoinSelector):
         Returns a result of a successfull coin selection.
         """
 
-        if not context.inputs:
+        return self.select_from(context, context.inputs)
+
+    def select_from(self, context: TxContext, inputs: List[Unspent]) -> SelectedCoins:
+        """
+        Selects coins from inputs (instead of context.inputs), in their order.
+
+        Subclasses pass their ordering of the inputs here, so the context is
+        never copied. The outputs of the context are shared with the result
+        unless change outputs are added (more than one if the context has a
+        change profile).
+        """
+
+        if not inputs:
             raise InsufficientFunds(context.address, 0)
 
-        outputs = context.outputs[:]
+        outputs = context.outputs
         estimate_tx_fee = partial(estimate_tx_fee_kb, fee_kb=context.fee_kb)
 
         n_out = len(outputs)
@@ -74,7 +149,7 @@ class Greedy(UnspentCoinSelector):
         in_amount = 0
         change_amount = 0
 
-        for n_in, utxo in enumerate(context.inputs, 1):
+        for n_in, utxo in enumerate(inputs, 1):
             in_size += utxo.vsize
             fee = estimate_tx_fee(in_size, n_in, out_size, n_out)
 
@@ -103,15 +178,29 @@ class Greedy(UnspentCoinSelector):
                 assert change_amount == 0 or change_amount >= DUST_THRESHOLD
                 assert in_amount - (out_amount + fee + change_amount) == 0
                 break
-            elif n_in == len(context.inputs):
+            elif n_in == len(inputs):
                 raise InsufficientFunds.forAmount(
                     context.address, in_amount, out_amount, fee
                 )
 
-        selected_inputs = context.inputs[:n_in]
+        selected_inputs = inputs[:n_in]
 
         if change_amount:
-            outputs.append(Output(context.change_address, change_amount))
+            change_amounts = [change_amount]
+            if context.change_profile is not None:
+                change_amounts, fee = split_change(
+                    context,
+                    selected_inputs,
+                    in_size,
+                    out_size,
+                    n_out,
+                    fee,
+                    change_amount,
+                )
+                change_amount = sum(change_amounts)
+            outputs = outputs + [
+                Output(context.change_address, amount) for amount in change_amounts
+            ]
 
         return SelectedCoins(selected_inputs, outputs, out_amount, change_amount, fee)
 
@@ -125,7 +214,7 @@ class GreedyMaxSecure(Greedy):
         """
 
         sorted_inputs = sorted(context.inputs, key=lambda utxo: -utxo.confirmations)
-        return super().select(context.copy(inputs=sorted_inputs))
+        return self.select_from(context, sorted_inputs)
 
 
 class GreedyMaxCoins(Greedy):
@@ -138,7 +227,7 @@ class GreedyMaxCoins(Greedy):
         """
 
         sorted_inputs = sorted(context.inputs, key=lambda utxo: utxo.amount)
-        return super().select(context.copy(inputs=sorted_inputs))
+        return self.select_from(context, sorted_inputs)
 
 
 class GreedyMinCoins(Greedy):
@@ -147,24 +236,74 @@ class GreedyMinCoins(Greedy):
         Selects coins from unspent inputs using coins with max amount first.
         Try to spend MIN number of coins.
 
+        If the largest coin covers the outputs and fee by itself, it's found
+        by a linear scan (O(n)) and the sort (O(n log n)) is skipped.
+
         Returns a result of a successfull coin selection.
         """
 
+        # the largest coin comes first and often covers the outputs by itself
+        largest = max(context.inputs, key=attrgetter("amount"), default=None)
+        if largest is not None and largest.amount >= outputs_target(
+            context, largest.vsize, 1
+        ):
+            return self.select_from(context, [largest])
+
         sorted_inputs = sorted(context.inputs, key=lambda utxo: -utxo.amount)
-        return super().select(context.copy(inputs=sorted_inputs))
+        return self.select_from(context, sorted_inputs)
 
 
 class GreedyRandom(Greedy):
+    deterministic = False
+
     def __init__(self, random):
         self.random = random
 
     def select(self, context: TxContext) -> SelectedCoins:
         """
-        Selects coins from unspent inputs on random.
+        Selects coins from unspent inputs on random, using a generator of its
+        own for contexts with a seed.
 
         Returns a result of a successfull coin selection.
         """
 
         shuffled_copy = context.inputs[:]
-        self.random.shuffle(shuffled_copy)
-        return super().select(context.copy(inputs=shuffled_copy))
+        if context.seed is None:
+            self.random.shuffle(shuffled_copy)
+        else:
+            Random(context.seed).shuffle(shuffled_copy)
+        return self.select_from(context, shuffled_copy)
+
+
+class BestFit(Greedy):
+    def select(self, context: TxContext) -> SelectedCoins:
+        """
+        Selects the smallest coin covering the outputs and fee. If no coin
+        does, takes the largest coin and looks for the smallest one covering
+        the rest, and so on. Coins are looked up in an AmountIndex built for
+        every call: each pick takes O(log n), but the selection as a whole
+        costs a sort of the coins (O(n log n)), as the UTXO set is filtered
+        anew for every request.
+
+        Returns a result of a successfull coin selection.
+        """
+
+        index = AmountIndex(context.inputs)
+        selected = []
+        selected_amount = 0
+        hi = len(index)
+        while hi:
+            n_in = len(selected) + 1
+            missing = (
+                outputs_target(context, n_in * index.max_vsize, n_in) - selected_amount
+            )
+            i = index.covering(missing, hi)
+            if i is not None:
+                selected.append(index.utxos[i])
+                break
+            hi = index.largest_below(missing, hi)
+            selected.append(index.utxos[hi])
+            selected_amount += index.amounts[hi]
+
+        # sizes the change and fee (or raises InsufficientFunds)
+        return self.select_from(context, selected)
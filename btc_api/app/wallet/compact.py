@@ -0,0 +1,133 @@
+from __future__ import annotations
+from array import array
+from typing import Iterable, List, Sequence
+from bit.wallet import Unspent
+
+from app.wallet.transaction import input_fee
+
+
+class CompactUnspents:
+    """Class representing a UTXO set in a compact, columnar form.
+
+    Amounts, confirmations, output indexes and input sizes are kept in typed
+    arrays while txids and scripts are kept in plain lists (with scripts
+    shared between UTXOs of the same address), so the set is cheap to scan
+    and to pickle across process boundaries.
+    """
+
+    __slots__ = (
+        "amounts",
+        "confirmations",
+        "txindexes",
+        "txids",
+        "scripts",
+        "vsizes",
+    )
+
+    def __init__(
+        self,
+        amounts: array,
+        confirmations: array,
+        txindexes: array,
+        txids: List[str],
+        scripts: List[str],
+        vsizes: array,
+    ):
+        self.amounts = amounts
+        self.confirmations = confirmations
+        self.txindexes = txindexes
+        self.txids = txids
+        self.scripts = scripts
+        self.vsizes = vsizes
+
+    @classmethod
+    def from_unspents(cls, utxos: Iterable[Unspent]) -> CompactUnspents:
+        """Packs unspent transaction outputs."""
+
+        amounts = array("q")
+        confirmations = array("I")
+        txindexes = array("I")
+        txids = []
+        scripts = []
+        vsizes = array("I")
+        shared_scripts = {}
+
+        for utxo in utxos:
+            amounts.append(int(utxo.amount))
+            confirmations.append(int(utxo.confirmations))
+            txindexes.append(int(utxo.txindex))
+            txids.append(utxo.txid)
+            scripts.append(shared_scripts.setdefault(utxo.script, utxo.script))
+            vsizes.append(utxo.vsize)
+
+        return cls(amounts, confirmations, txindexes, txids, scripts, vsizes)
+
+    def __len__(self) -> int:
+        return len(self.amounts)
+
+    def __getstate__(self):
+        return (
+            self.amounts,
+            self.confirmations,
+            self.txindexes,
+            self.txids,
+            self.scripts,
+            self.vsizes,
+        )
+
+    def __setstate__(self, state):
+        (
+            self.amounts,
+            self.confirmations,
+            self.txindexes,
+            self.txids,
+            self.scripts,
+            self.vsizes,
+        ) = state
+
+    def unspent(self, i: int) -> Unspent:
+        """Unpacks a single unspent transaction output."""
+
+        return Unspent(
+            amount=self.amounts[i],
+            confirmations=self.confirmations[i],
+            script=self.scripts[i],
+            txid=self.txids[i],
+            txindex=self.txindexes[i],
+            vsize=self.vsizes[i],
+        )
+
+    def to_unspents(self, indexes: Sequence[int] = None) -> List[Unspent]:
+        """Unpacks all (or only indexed) unspent transaction outputs."""
+
+        if indexes is None:
+            indexes = range(len(self))
+        return [self.unspent(i) for i in indexes]
+
+    def take(self, indexes: Sequence[int]) -> CompactUnspents:
+        """Returns a new compact set holding only indexed entries."""
+
+        return CompactUnspents(
+            array("q", (self.amounts[i] for i in indexes)),
+            array("I", (self.confirmations[i] for i in indexes)),
+            array("I", (self.txindexes[i] for i in indexes)),
+            [self.txids[i] for i in indexes],
+            [self.scripts[i] for i in indexes],
+            array("I", (self.vsizes[i] for i in indexes)),
+        )
+
+    def effective_values(self, fee_kb: int) -> array:
+        """Returns the amounts less the fee of spending them at fee_kb."""
+
+        return array(
+            "q",
+            (
+                amount - input_fee(vsize, fee_kb)
+                for amount, vsize in zip(self.amounts, self.vsizes)
+            ),
+        )
+
+    def economical(self, fee_kb: int) -> List[int]:
+        """Returns indexes of the UTXOs worth more than spending them costs."""
+
+        return [i for i, value in enumerate(self.effective_values(fee_kb)) if value > 0]
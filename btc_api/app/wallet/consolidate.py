@@ -0,0 +1,140 @@
+from dataclasses import dataclass, field
+from operator import attrgetter
+from typing import List
+
+from bit.wallet import Unspent
+
+from app.wallet.coin_select import DUST_THRESHOLD
+from app.wallet.transaction import (
+    Output,
+    address_to_output_size,
+    estimate_tx_fee_kb,
+    estimate_tx_size,
+    input_fee,
+)
+
+# max size of a standard transaction (400k weight units) in bytes
+MAX_TX_SIZE = 100000
+MAX_INPUTS = 500
+MAX_OUTPUTS = 10
+
+
+@dataclass
+class Sweep:
+    """Class representing a transaction spending many UTXOs into a few outputs."""
+
+    inputs: List[Unspent]
+    outputs: List[Output]
+    fee: int
+    vsize: int
+
+
+@dataclass
+class ConsolidationPlan:
+    """Class representing the sweeps planned for a UTXO set.
+
+    Attributes:
+        sweeps: the planned transactions
+        utxos: number of UTXOs analyzed
+        eligible: number of UTXOs small enough to be swept
+        uneconomical: number of eligible UTXOs worth less than spending them costs
+    """
+
+    sweeps: List[Sweep] = field(default_factory=list)
+    utxos: int = 0
+    eligible: int = 0
+    uneconomical: int = 0
+
+    @property
+    def swept(self) -> int:
+        return sum(len(sweep.inputs) for sweep in self.sweeps)
+
+    @property
+    def utxos_after(self) -> int:
+        """Number of UTXOs left once all sweeps are confirmed."""
+
+        return self.utxos - self.swept + sum(len(s.outputs) for s in self.sweeps)
+
+
+def plan_consolidation(
+    utxos: List[Unspent],
+    destination: str,
+    fee_kb: int,
+    max_amount: int = None,
+    max_inputs: int = MAX_INPUTS,
+    n_outputs: int = 1,
+    max_tx_size: int = MAX_TX_SIZE,
+) -> ConsolidationPlan:
+    """Plans sweeps of the UTXOs of at most max_amount into n_outputs each.
+
+    UTXOs worth less than the fee of spending them are left alone. The rest
+    are swept smallest first, at most `max_inputs` per transaction and within
+    `max_tx_size`, each sweep paying its value (less the fee) to destination
+    split into `n_outputs` outputs of at least the dust threshold. Sweeps
+    which wouldn't reduce the number of UTXOs are dropped.
+    """
+
+    eligible = [
+        utxo for utxo in utxos if max_amount is None or utxo.amount <= max_amount
+    ]
+    economical = sorted(
+        (utxo for utxo in eligible if utxo.amount > input_fee(utxo.vsize, fee_kb)),
+        key=attrgetter("amount"),
+    )
+    plan = ConsolidationPlan(
+        utxos=len(utxos),
+        eligible=len(eligible),
+        uneconomical=len(eligible) - len(economical),
+    )
+
+    out_size = address_to_output_size(destination) * n_outputs
+    chunk: List[Unspent] = []
+    in_size = 0
+    for utxo in economical:
+        size = estimate_tx_size(
+            in_size + utxo.vsize, len(chunk) + 1, out_size, n_outputs
+        )
+        if chunk and (len(chunk) == max_inputs or size > max_tx_size):
+            _add_sweep(plan, chunk, destination, fee_kb, n_outputs)
+            chunk, in_size = [], 0
+        chunk.append(utxo)
+        in_size += utxo.vsize
+    if chunk:
+        _add_sweep(plan, chunk, destination, fee_kb, n_outputs)
+    return plan
+
+
+def _add_sweep(
+    plan: ConsolidationPlan,
+    inputs: List[Unspent],
+    destination: str,
+    fee_kb: int,
+    n_outputs: int,
+):
+    in_amount = sum(utxo.amount for utxo in inputs)
+    in_size = sum(utxo.vsize for utxo in inputs)
+    output_size = address_to_output_size(destination)
+
+    # fewer outputs if the value can't be split into non-dust outputs
+    while n_outputs:
+        fee = estimate_tx_fee_kb(
+            in_size, len(inputs), output_size * n_outputs, n_outputs, fee_kb
+        )
+        value = in_amount - fee
+        if value >= DUST_THRESHOLD * n_outputs:
+            break
+        n_outputs -= 1
+    if n_outputs == 0 or len(inputs) <= n_outputs:
+        return
+
+    share = value // n_outputs
+    amounts = [share] * n_outputs
+    amounts[0] += value - share * n_outputs
+    plan.sweeps.append(
+        Sweep(
+            inputs,
+            [Output(destination, amount) for amount in amounts],
+            fee,
+            estimate_tx_size(in_size, len(inputs), output_size * n_outputs, n_outputs),
+        )
+    )
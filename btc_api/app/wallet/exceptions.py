@@ -1,7 +1,17 @@
+def _restore_error(cls, state):
+    """Recreates a pickled wallet error from its state."""
+
+    error = cls.__new__(cls)
+    error.__dict__.update(state)
+    return error
+
+
 class WalletError(Exception):
     """Base Exception raised for all wallet errors."""
 
-    pass
+    def __reduce__(self):
+        # subclasses take custom constructor args, so pickle by state instead
+        return (_restore_error, (self.__class__, self.__dict__))
 
 
 class InsufficientFunds(WalletError):
@@ -56,3 +66,38 @@ class NoConfirmedTransactionsFound(InsufficientFunds):
     def __init__(self, address, min_confirmations):
         super().__init__(address)
         self.message = f"No confirmed unspent transactions were found for address {address} (asking for min: {min_confirmations})"
+
+
+class NoEconomicalTransactionsFound(InsufficientFunds):
+    """Error raised when address has no confirmed unspent transactions worth spending.
+
+    Attributes:
+        address: input address for which the error occurred
+        balance: current balance (of confirmed UTXOs) for the address
+        message: explanation of the error
+    """
+
+    def __init__(self, address, balance, fee_kb):
+        super().__init__(address, balance)
+        self.message = f"All confirmed unspent transactions of address {address} are worth less than the fee of spending them (fee_kb: {fee_kb})"
+
+
+class UnspentSourceUnavailable(WalletError):
+    """Error raised when unspent transactions can't be fetched right now.
+
+    Attributes:
+        source: name of the unavailable UTXO source
+        retry_after: seconds until the source is tried again
+        message: explanation of the error
+    """
+
+    def __init__(self, source, retry_after=0.0):
+        super().__init__()
+        self.source = source
+        self.retry_after = retry_after
+        self.message = (
+            f"UTXO source {source} is unavailable, retry in {retry_after:.0f}s"
+        )
+
+    def __str__(self):
+        return self.message
@@ -0,0 +1,43 @@
+from bisect import bisect_left
+from operator import attrgetter
+from typing import List, Optional
+
+from bit.wallet import Unspent
+
+
+class AmountIndex:
+    """Class representing a UTXO set sorted by amount.
+
+    Building the index sorts the set (O(n log n)), after which the smallest
+    UTXO covering an amount, or the largest one below it, is found by
+    bisection in O(log n). Only these lookups are logarithmic: the index
+    isn't kept between selections, so each one pays for the sort. Queries can
+    be limited to the `hi` smallest UTXOs, so coins already taken from the
+    top of the index are skipped without removing them.
+    """
+
+    __slots__ = ("utxos", "amounts", "max_vsize")
+
+    def __init__(self, utxos: List[Unspent]):
+        self.utxos = sorted(utxos, key=attrgetter("amount"))
+        self.amounts = list(map(attrgetter("amount"), self.utxos))
+        self.max_vsize = max(map(attrgetter("vsize"), self.utxos), default=0)
+
+    def __len__(self) -> int:
+        return len(self.utxos)
+
+    def covering(self, amount: int, hi: int = None) -> Optional[int]:
+        """Returns the position of the smallest UTXO of at least amount."""
+
+        if hi is None:
+            hi = len(self.amounts)
+        i = bisect_left(self.amounts, amount, 0, hi)
+        return i if i < hi else None
+
+    def largest_below(self, amount: int, hi: int = None) -> Optional[int]:
+        """Returns the position of the largest UTXO of less than amount."""
+
+        if hi is None:
+            hi = len(self.amounts)
+        i = bisect_left(self.amounts, amount, 0, hi)
+        return i - 1 if i > 0 else None
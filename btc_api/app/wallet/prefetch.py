@@ -0,0 +1,223 @@
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, Hashable, List, Tuple
+
+from app.wallet.breaker import CLOSED
+from app.wallet.cache import CachedUnspents, StaleUnspentCache
+
+TOP_K = 100
+CAPACITY_FACTOR = 4
+SAMPLE_RATE = 0.1
+REFRESH_AHEAD_SEC = 5.0
+BUDGET_PER_SEC = 5.0
+INTERVAL_SEC = 1.0
+# counts halve every half-life, so hotness follows the traffic, and keys are
+# forgotten once counted less than MIN_COUNT (a single counted lookup after
+# ~3 half-lives)
+HALF_LIFE_SEC = 60.0
+MIN_COUNT = 0.1
+
+
+class SpaceSaving:
+    """Approximately counts the most frequent of a stream of keys (Space-Saving).
+
+    At most `capacity` keys are tracked. A new key replaces the least counted
+    one and inherits its count, so the counts of frequent keys are
+    overestimated by at most the smallest count, and every key more frequent
+    than 1/capacity of the stream is tracked.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._counts: Dict[Hashable, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def offer(self, key: Hashable, count: float = 1.0):
+        counts = self._counts
+        if key in counts:
+            counts[key] += count
+        elif len(counts) < self.capacity:
+            counts[key] = count
+        else:
+            least = min(counts, key=counts.get)
+            counts[key] = counts.pop(least) + count
+
+    def top(self, k: int) -> List[Tuple[Hashable, float]]:
+        """Returns the k most counted keys with their counts, most counted first."""
+
+        return sorted(self._counts.items(), key=lambda item: -item[1])[:k]
+
+    def decay(self, factor: float, min_count: float = 1.0):
+        """Multiplies all counts by factor, dropping keys counted less than min_count."""
+
+        self._counts = {
+            key: count * factor
+            for key, count in self._counts.items()
+            if count * factor >= min_count
+        }
+
+
+class RefreshAheadPrefetcher:
+    """Refreshes the cached UTXO sets of hot addresses before they expire.
+
+    Lookups are passed to `cache` (a StaleUnspentCache) and a `sample_rate`
+    share of them is counted (Space-Saving, bounded memory). Every `interval`
+    a background thread refreshes the sets of the `top_k` most looked up
+    addresses that expire within `refresh_ahead` seconds (or aren't cached),
+    spending at most `budget` upstream requests per second. Counts halve
+    every `half_life` seconds, so an address looked up about once per
+    half-life stays tracked. Prefetching is disabled if the cache has no
+    fresh TTL, or top_k or budget is 0.
+    """
+
+    def __init__(
+        self,
+        cache: StaleUnspentCache,
+        top_k: int = TOP_K,
+        sample_rate: float = SAMPLE_RATE,
+        refresh_ahead: float = REFRESH_AHEAD_SEC,
+        budget: float = BUDGET_PER_SEC,
+        interval: float = INTERVAL_SEC,
+        half_life: float = HALF_LIFE_SEC,
+        clock=time.monotonic,
+        rng: random.Random = None,
+    ):
+        self.cache = cache
+        self.top_k = top_k
+        self.sample_rate = sample_rate
+        self.refresh_ahead = refresh_ahead
+        self.budget = budget
+        self.interval = interval
+        self.half_life = half_life
+        self.clock = clock
+        self.prefetches = 0
+        self.over_budget = 0
+        self._rng = rng or random.Random()
+        self._counter = SpaceSaving(max(1, top_k * CAPACITY_FACTOR))
+        self._tokens = self._max_tokens
+        self._tokens_at = clock()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._thread_pid = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.cache.fresh_ttl > 0 and self.top_k > 0 and self.budget > 0
+
+    @property
+    def decay(self) -> float:
+        """Factor the counts are multiplied by every interval."""
+
+        return 0.5 ** (self.interval / self.half_life)
+
+    @property
+    def _max_tokens(self) -> float:
+        return max(1.0, self.budget * self.interval)
+
+    def __len__(self) -> int:
+        return len(self._counter)
+
+    def _count(self, addresses: List[str], testnet: bool):
+        if not self.enabled:
+            return
+        sampled = [a for a in addresses if self._rng.random() < self.sample_rate]
+        if not sampled:
+            return
+        with self._lock:
+            for address in sampled:
+                self._counter.offer((bool(testnet), address))
+        self.start()
+
+    def lookup(self, address: str, testnet: bool = False) -> CachedUnspents:
+        """Returns the UTXO set of address from the cache, counting the lookup."""
+
+        self._count([address], testnet)
+        return self.cache.lookup(address, testnet)
+
+    def cached(
+        self, addresses: List[str], testnet: bool = False
+    ) -> Dict[str, CachedUnspents]:
+        """Returns the fresh cached sets of addresses, counting all lookups."""
+
+        self._count(addresses, testnet)
+        return self.cache.cached(addresses, testnet)
+
+    def lookup_many(
+        self, addresses: List[str], testnet: bool = False
+    ) -> Dict[str, CachedUnspents]:
+        """Returns the UTXO sets of addresses (not counted, see `cached`)."""
+
+        return self.cache.lookup_many(addresses, testnet)
+
+    def get_unspent(self, address: str, testnet: bool = False):
+        """Fetches all unspent transactions for a bitcoin address."""
+
+        return self.lookup(address, testnet).utxos
+
+    def start(self):
+        """Starts the prefetch thread unless it's running in this process."""
+
+        with self._lock:
+            if self._thread is not None and self._thread_pid == os.getpid():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="unspent-prefetch", daemon=True
+            )
+            self._thread_pid = os.getpid()
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.prefetch()
+
+    def _take_token(self) -> bool:
+        now = self.clock()
+        self._tokens = min(
+            self._max_tokens, self._tokens + (now - self._tokens_at) * self.budget
+        )
+        self._tokens_at = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def prefetch(self) -> List[Future]:
+        """Refreshes the hot UTXO sets about to expire.
+
+        Returns the futures of the started refreshes.
+        """
+
+        with self._lock:
+            hot = [key for key, _ in self._counter.top(self.top_k)]
+            self._counter.decay(self.decay, MIN_COUNT)
+
+        # refreshes would be rejected while the breaker isn't closed
+        if not self.enabled or self.cache.breaker.state != CLOSED:
+            return []
+
+        due_age = max(0.0, self.cache.fresh_ttl - self.refresh_ahead)
+        started = []
+        for testnet, address in hot:
+            age = self.cache.age(address, testnet)
+            if age is not None and age < due_age:
+                continue
+            if not self._take_token():
+                self.over_budget += 1
+                break
+            future = self.cache.refresh(address, testnet)
+            if future is not None:
+                started.append(future)
+            else:
+                self._tokens += 1  # already being refreshed
+        self.prefetches += len(started)
+        return started
@@ -0,0 +1,238 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+from bit.wallet import Unspent
+
+from app.wallet.query import get_tx_counts, get_unspent, PARAM_TIMEOUT_SEC
+
+LATENCY_WINDOW = 200
+HEDGE_QUANTILE = 0.95
+HEDGE_MIN_DELAY_SEC = 0.05
+HEDGE_MAX_DELAY_SEC = 1.0
+FETCH_THREADS = 8
+
+
+class LatencyStats:
+    """Class keeping a sliding window of recent latencies (in seconds)."""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self._samples = deque(maxlen=window)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def record(self, latency: float):
+        self._samples.append(latency)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Returns the q-quantile of the window, None if there are no samples."""
+
+        samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+class UnspentProvider:
+    """Class representing a blockchain.info compatible UTXO provider.
+
+    Keeps a session (reusing connections) and statistics of the requests
+    made, which are used to decide when to hedge requests to the provider.
+    """
+
+    def __init__(
+        self,
+        url_base: str,
+        timeout: float = PARAM_TIMEOUT_SEC,
+        window: int = LATENCY_WINDOW,
+    ):
+        self.url_base = url_base
+        self.name = urlparse(url_base).netloc or url_base
+        self.timeout = timeout
+        self.latency = LatencyStats(window)
+        self.requests = 0
+        self.errors = 0
+        self._local = threading.local()
+
+    @property
+    def session(self) -> requests.Session:
+        """Returns a session of the current thread."""
+
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def get_unspent(self, address: str, testnet: bool = False) -> List[Unspent]:
+        """Fetches all unspent transactions of address from the provider."""
+
+        self.requests += 1
+        started = time.monotonic()
+        try:
+            utxos = self._fetch(address, testnet)
+        except Exception:
+            self.errors += 1
+            raise
+        self.latency.record(time.monotonic() - started)
+        return utxos
+
+    def _fetch(self, address: str, testnet: bool) -> List[Unspent]:
+        return list(
+            get_unspent(address, testnet, self.url_base, self.session, self.timeout)
+        )
+
+    def get_tx_counts(self, address: str, testnet: bool = False) -> Dict[str, int]:
+        """Fetches the number of transactions of addresses from the provider."""
+
+        return get_tx_counts(
+            address, testnet, self.url_base, self.session, self.timeout
+        )
+
+
+class HedgedUnspentFetcher:
+    """Fetches UTXOs from several providers, hedging slow and failed requests.
+
+    Providers are tried in order. If the current provider doesn't answer
+    within its recent `hedge_quantile` latency (clamped between the min and
+    max hedge delay), a hedged request is sent to the next provider and the
+    first valid answer wins. If a provider fails, the request fails over to
+    the next provider right away. Only if all providers fail is the last
+    error raised.
+    """
+
+    def __init__(
+        self,
+        mainnet: List[UnspentProvider],
+        testnet: List[UnspentProvider],
+        hedge_quantile: float = HEDGE_QUANTILE,
+        hedge_min_delay: float = HEDGE_MIN_DELAY_SEC,
+        hedge_max_delay: float = HEDGE_MAX_DELAY_SEC,
+        threads: int = FETCH_THREADS,
+    ):
+        self.providers = {False: mainnet, True: testnet}
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_max_delay = hedge_max_delay
+        self.threads = threads
+        self.hedged = 0
+        self.failovers = 0
+        self._lock = threading.Lock()
+        self._executor = None
+        self._executor_pid = None
+
+    @classmethod
+    def from_urls(
+        cls,
+        mainnet_urls: List[str],
+        testnet_urls: List[str],
+        timeout: float = PARAM_TIMEOUT_SEC,
+        **kwargs,
+    ):
+        """Creates a fetcher using providers at the given base URLs."""
+
+        return cls(
+            [UnspentProvider(url, timeout) for url in mainnet_urls],
+            [UnspentProvider(url, timeout) for url in testnet_urls],
+            **kwargs,
+        )
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Lazily creates the executor (once per process, safe across forks)."""
+
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.threads)
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def hedge_delay(self, provider: UnspentProvider) -> float:
+        """Returns how long to wait for provider before hedging."""
+
+        latency = provider.latency.quantile(self.hedge_quantile)
+        if latency is None:
+            return self.hedge_max_delay
+        return min(max(latency, self.hedge_min_delay), self.hedge_max_delay)
+
+    def get_unspent(self, address: str, testnet: bool = False) -> List[Unspent]:
+        """Fetches all unspent transactions for a bitcoin address.
+
+        Raises the error of the last provider tried if all of them failed.
+        """
+
+        providers = self.providers[bool(testnet)]
+        if len(providers) == 1:
+            return providers[0].get_unspent(address, testnet)
+
+        executor = self._get_executor()
+        pending = {}
+        remaining = iter(providers)
+        error = None
+
+        def submit_next() -> bool:
+            provider = next(remaining, None)
+            if provider is None:
+                return False
+            future = executor.submit(provider.get_unspent, address, testnet)
+            pending[future] = provider
+            return True
+
+        submit_next()
+        while pending:
+            # hedge against the most recently started request
+            latest = list(pending.values())[-1]
+            done, _ = wait(
+                pending, timeout=self.hedge_delay(latest), return_when=FIRST_COMPLETED
+            )
+            if not done:
+                if submit_next():
+                    self.hedged += 1
+                continue
+
+            for future in done:
+                del pending[future]
+                try:
+                    return future.result()
+                except Exception as e:
+                    error = e
+                    if submit_next():
+                        self.failovers += 1
+
+        raise error
+
+    def get_tx_counts(self, address: str, testnet: bool = False) -> Dict[str, int]:
+        """Fetches the number of transactions of addresses.
+
+        Providers are tried in order, without hedging. Raises the error of
+        the last provider tried if all of them failed.
+        """
+
+        error = None
+        for n, provider in enumerate(self.providers[bool(testnet)]):
+            if n:
+                self.failovers += 1
+            try:
+                return provider.get_tx_counts(address, testnet)
+            except Exception as e:
+                error = e
+        raise error
+
+    def provider_stats(self) -> Dict[Tuple[str, str], Dict[str, float]]:
+        """Returns per-provider statistics keyed by network and provider name."""
+
+        return {
+            (network, provider.name): {
+                "requests": provider.requests,
+                "errors": provider.errors,
+                "latency_p50": provider.latency.quantile(0.5),
+                "latency_p95": provider.latency.quantile(0.95),
+            }
+            for testnet, providers in self.providers.items()
+            for network in ["test" if testnet else "main"]
+            for provider in providers
+        }
@@ -8,25 +8,44 @@ PARAM_TIMEOUT_SEC = 5
 URL_MAINNET = "https://blockchain.info"
 URL_TESTNET = "https://testnet.blockchain.info"
 
+# separates addresses queried in a single request (e.g. active=a|b|c)
+ADDRESS_SEPARATOR = "|"
 
-def get_unspent(address: str, testnet: bool = False) -> List[Unspent]:
+# error message returned for addresses without any unspent outputs
+NO_FREE_OUTPUTS = "No free outputs to spend"
+
+
+def get_unspent(
+    address: str,
+    testnet: bool = False,
+    url_base: str = None,
+    session: requests.Session = None,
+    timeout: float = PARAM_TIMEOUT_SEC,
+) -> List[Unspent]:
     """Find all unspent transactions for a bitcoin address.
 
     This function uses a public service (e.g. blockchain.info)
     to fetch a list of unspent transactions.
 
     Args:
-        address (str): Bitcoin address.
+        address (str): Bitcoin address (or addresses joined by ADDRESS_SEPARATOR).
         testnet (bool): Is this a testnet network request.
+        url_base (str): Base URL of the service (defaults to blockchain.info).
+        session (requests.Session): Session reusing connections (optional).
+        timeout (float): Timeout of the request in seconds.
 
     Returns:
         List of unspent transactions that were found. Empty if
         none were found.
     """
     payload = {"active": address}
-    url_base = URL_TESTNET if testnet else URL_MAINNET
+    if url_base is None:
+        url_base = URL_TESTNET if testnet else URL_MAINNET
     endpoint = f"{url_base}/unspent"
-    r = requests.get(endpoint, params=payload, timeout=PARAM_TIMEOUT_SEC)
+    r = (session or requests).get(endpoint, params=payload, timeout=timeout)
+    if r.status_code == 500 and NO_FREE_OUTPUTS in r.text:
+        # blockchain.info answers with an error if there are no UTXOs
+        return
     r.raise_for_status()
     data = r.json()
 
@@ -40,3 +59,34 @@ def get_unspent(address: str, testnet: bool = False) -> List[Unspent]:
         )
 
     yield from (to_unspent(utxo) for utxo in data["unspent_outputs"])
+
+
+def get_tx_counts(
+    address: str,
+    testnet: bool = False,
+    url_base: str = None,
+    session: requests.Session = None,
+    timeout: float = PARAM_TIMEOUT_SEC,
+) -> Dict[str, int]:
+    """Count the transactions of bitcoin addresses (spent ones included).
+
+    This function uses the multiaddr endpoint of a public service
+    (e.g. blockchain.info), without fetching the transactions themselves.
+
+    Args:
+        address (str): Bitcoin address (or addresses joined by ADDRESS_SEPARATOR).
+        testnet (bool): Is this a testnet network request.
+        url_base (str): Base URL of the service (defaults to blockchain.info).
+        session (requests.Session): Session reusing connections (optional).
+        timeout (float): Timeout of the request in seconds.
+
+    Returns:
+        Number of transactions keyed by address.
+    """
+    payload = {"active": address, "n": 0}
+    if url_base is None:
+        url_base = URL_TESTNET if testnet else URL_MAINNET
+    endpoint = f"{url_base}/multiaddr"
+    r = (session or requests).get(endpoint, params=payload, timeout=timeout)
+    r.raise_for_status()
+    return {entry["address"]: entry["n_tx"] for entry in r.json()["addresses"]}
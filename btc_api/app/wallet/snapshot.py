@@ -0,0 +1,296 @@
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from bit.wallet import Unspent
+
+INTERVAL_SEC = 60.0
+
+MAGIC = b"BTCUTXO1"
+# magic, number of entries, records and strings, size of the strings, written at
+HEADER = struct.Struct("<8sIIIId")
+# testnet, address (string number), first record, number of records, age
+ENTRY = struct.Struct("<?3xIIId")
+# amount, confirmations, txindex, txid, script (string number)
+RECORD = struct.Struct("<qII32sI")
+# offset and length of a string
+STRING = struct.Struct("<II")
+
+TXID_SIZE = 32
+
+Key = Tuple[bool, str]
+
+
+def write_snapshot(
+    path: str,
+    entries: Iterable[Tuple[bool, str, List[Unspent], float]],
+    written_at: float = None,
+) -> int:
+    """Writes UTXO sets (testnet, address, utxos, age) to a snapshot file.
+
+    The file is replaced atomically. Sets with UTXOs that don't fit the fixed
+    width records (e.g. malformed txids) are left out. Returns the number of
+    sets written.
+    """
+
+    if written_at is None:
+        written_at = time.time()
+
+    strings: Dict[str, int] = {}
+    entries_buf = bytearray()
+    records_buf = bytearray()
+    n_entries = n_records = 0
+    for testnet, address, utxos, age in entries:
+        try:
+            records = [
+                RECORD.pack(
+                    int(utxo.amount),
+                    int(utxo.confirmations),
+                    int(utxo.txindex),
+                    _txid_bytes(utxo.txid),
+                    strings.setdefault(utxo.script, len(strings)),
+                )
+                for utxo in utxos
+            ]
+        except (ValueError, struct.error):
+            continue
+        entries_buf += ENTRY.pack(
+            bool(testnet),
+            strings.setdefault(address, len(strings)),
+            n_records,
+            len(records),
+            age,
+        )
+        records_buf += b"".join(records)
+        n_entries += 1
+        n_records += len(records)
+
+    table = bytearray()
+    blob = bytearray()
+    for string in strings:
+        encoded = string.encode()
+        table += STRING.pack(len(blob), len(encoded))
+        blob += encoded
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(
+            HEADER.pack(
+                MAGIC, n_entries, n_records, len(strings), len(blob), written_at
+            )
+        )
+        f.write(entries_buf)
+        f.write(records_buf)
+        f.write(table)
+        f.write(blob)
+    os.replace(tmp_path, path)
+    return n_entries
+
+
+def _txid_bytes(txid: str) -> bytes:
+    raw = bytes.fromhex(txid)
+    if len(raw) != TXID_SIZE:
+        raise ValueError("Unexpected txid size.")
+    return raw
+
+
+class UnspentSnapshot:
+    """Class representing a snapshot file of UTXO sets, memory-mapped.
+
+    Only the index of the sets is read when opening the file, the fixed width
+    records of a set are decoded when it's looked up. The mapping is shared by
+    processes forked after opening it. Ages are those at writing time plus
+    the time since.
+    """
+
+    def __init__(self, path: str, wall_clock=time.time):
+        self.path = path
+        self.wall_clock = wall_clock
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._read_index()
+        except (ValueError, struct.error):
+            self.close()
+            raise
+
+    @classmethod
+    def open(cls, path: str, wall_clock=time.time) -> Optional["UnspentSnapshot"]:
+        """Opens the snapshot at path, None if missing or unreadable."""
+
+        try:
+            return cls(path, wall_clock)
+        except (OSError, ValueError, struct.error):
+            return None
+
+    def _read_index(self):
+        (
+            magic,
+            n_entries,
+            n_records,
+            n_strings,
+            blob_size,
+            written_at,
+        ) = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"Not a UTXO snapshot: {self.path}")
+        self.written_at = written_at
+        self._entries_at = HEADER.size
+        self._records_at = self._entries_at + n_entries * ENTRY.size
+        self._strings_at = self._records_at + n_records * RECORD.size
+        self._blob_at = self._strings_at + n_strings * STRING.size
+        if len(self._map) != self._blob_at + blob_size:
+            raise ValueError(f"Truncated UTXO snapshot: {self.path}")
+
+        self._scripts: Dict[int, str] = {}
+        self._index: Dict[Key, int] = {}
+        for i in range(n_entries):
+            testnet, address, _, _, _ = ENTRY.unpack_from(
+                self._map, self._entries_at + i * ENTRY.size
+            )
+            self._index[(testnet, self._string(address))] = i
+
+    def _string(self, i: int) -> str:
+        offset, length = STRING.unpack_from(
+            self._map, self._strings_at + i * STRING.size
+        )
+        start = self._blob_at + offset
+        return self._map[start : start + length].decode()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, key: Key) -> bool:
+        return key in self._index
+
+    def keys(self) -> List[Key]:
+        return list(self._index)
+
+    def get(self, key: Key) -> Optional[Tuple[List[Unspent], float]]:
+        """Returns the UTXO set of (testnet, address) and its age, if stored."""
+
+        i = self._index.get(key)
+        if i is None:
+            return None
+        _, _, first, n, age = ENTRY.unpack_from(
+            self._map, self._entries_at + i * ENTRY.size
+        )
+        utxos = []
+        for offset in range(
+            self._records_at + first * RECORD.size,
+            self._records_at + (first + n) * RECORD.size,
+            RECORD.size,
+        ):
+            amount, confirmations, txindex, txid, script = RECORD.unpack_from(
+                self._map, offset
+            )
+            if script not in self._scripts:
+                self._scripts[script] = self._string(script)
+            utxos.append(
+                Unspent(
+                    amount, confirmations, self._scripts[script], txid.hex(), txindex
+                )
+            )
+        return utxos, age + max(0.0, self.wall_clock() - self.written_at)
+
+    def close(self):
+        self._map.close()
+
+
+class SnapshotWriter:
+    """Periodically writes the UTXO sets of a StaleUnspentCache to a snapshot.
+
+    Every `interval` a background thread merges the cached sets into the
+    snapshot at `path`, keeping sets of the file (e.g. written by other
+    workers) that aren't cached and aren't too old to be served, and writes
+    it back under a file lock. `load` opens the snapshot for the cache to
+    restore sets from. An empty path disables snapshots.
+    """
+
+    def __init__(
+        self, cache, path: str, interval: float = INTERVAL_SEC, wall_clock=time.time
+    ):
+        self.cache = cache
+        self.path = path
+        self.interval = interval
+        self.wall_clock = wall_clock
+        self.saves = 0
+        self.save_errors = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._thread_pid = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def load(self) -> bool:
+        """Opens the snapshot for the cache to restore UTXO sets from."""
+
+        if not self.enabled:
+            return False
+        self.cache.snapshot = UnspentSnapshot.open(self.path, self.wall_clock)
+        return self.cache.snapshot is not None
+
+    def save(self) -> int:
+        """Merges the cached UTXO sets into the snapshot, returns its size."""
+
+        max_age = max(self.cache.fresh_ttl, self.cache.max_stale)
+        entries = {
+            (testnet, address): (utxos, age)
+            for testnet, address, utxos, age in self.cache.entries()
+        }
+
+        with open(f"{self.path}.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            current = UnspentSnapshot.open(self.path, self.wall_clock)
+            if current is not None:
+                try:
+                    for key in current.keys():
+                        if key not in entries:
+                            utxos, age = current.get(key)
+                            if age <= max_age:
+                                entries[key] = (utxos, age)
+                finally:
+                    current.close()
+
+            if not entries:
+                return 0
+            youngest = sorted(entries.items(), key=lambda item: item[1][1])
+            del youngest[self.cache.max_entries :]
+            return write_snapshot(
+                self.path,
+                [(key[0], key[1], utxos, age) for key, (utxos, age) in youngest],
+                self.wall_clock(),
+            )
+
+    def start(self):
+        """Starts the writer thread unless it's running in this process."""
+
+        if not self.enabled or self.interval <= 0:
+            return
+        with self._lock:
+            if self._thread is not None and self._thread_pid == os.getpid():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="unspent-snapshot", daemon=True
+            )
+            self._thread_pid = os.getpid()
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.save()
+                self.saves += 1
+            except OSError:
+                self.save_errors += 1
@@ -0,0 +1,229 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from bit.wallet import Unspent
+
+from app.wallet.query import ADDRESS_SEPARATOR
+from app.wallet.xpub import ExtendedPublicKey, EXTERNAL_CHAIN, INTERNAL_CHAIN
+
+BATCH_SIZE = 50
+FANOUT_THREADS = 8
+GAP_LIMIT = 20
+MAX_GAP_LIMIT = 100
+MAX_ADDRESSES = 1000
+DERIVED_ADDRESSES_CACHE_SIZE = 2**16
+
+
+@lru_cache(maxsize=DERIVED_ADDRESSES_CACHE_SIZE)
+def derive_address(xpub: ExtendedPublicKey, chain: int, index: int) -> str:
+    """Returns the P2PKH address at xpub/chain/index."""
+
+    return _chain_key(xpub, chain).child(index).address()
+
+
+@lru_cache(maxsize=1024)
+def _chain_key(xpub: ExtendedPublicKey, chain: int) -> ExtendedPublicKey:
+    return xpub.child(chain)
+
+
+@dataclass
+class SourceUnspents:
+    """Class representing UTXOs fetched for the addresses of a source wallet.
+
+    Attributes:
+        utxos: UTXOs of all the addresses
+        owners: address of each UTXO keyed by (txid, txindex)
+        paths: derivation path of each address (xpub wallets only)
+        change_address: next unused change address (xpub wallets only)
+        stale: whether any of the UTXO sets is stale
+        age: age of the oldest UTXO set in seconds
+    """
+
+    utxos: List[Unspent]
+    owners: Dict[Tuple[str, int], str]
+    paths: Dict[str, str] = field(default_factory=dict)
+    change_address: str = None
+    stale: bool = False
+    age: float = 0.0
+
+    def owner(self, utxo: Unspent) -> str:
+        return self.owners[(utxo.txid, utxo.txindex)]
+
+    def path(self, address: str) -> Optional[str]:
+        return self.paths.get(address)
+
+
+class UnspentFanout:
+    """Fetches UTXOs of many addresses in batched requests run in parallel.
+
+    UTXO sets are read from `source` (a StaleUnspentCache, or a
+    RefreshAheadPrefetcher in front of one) per address: the fresh cached
+    sets are taken first, and the remaining addresses are looked up
+    `batch_size` at a time (blockchain.info accepts addresses joined by `|`),
+    batches being looked up in parallel.
+
+    `history` (e.g. HedgedUnspentFetcher.get_tx_counts) returns the number of
+    transactions of addresses joined by `|`. It's used to skip change
+    addresses of an xpub that were spent from completely; without it, change
+    addresses are chosen by their UTXOs only.
+    """
+
+    def __init__(
+        self,
+        source,
+        batch_size: int = BATCH_SIZE,
+        threads: int = FANOUT_THREADS,
+        max_addresses: int = MAX_ADDRESSES,
+        history=None,
+    ):
+        self.source = source
+        self.history = history
+        self.batch_size = batch_size
+        self.threads = threads
+        self.max_addresses = max_addresses
+        self._lock = threading.Lock()
+        self._executor = None
+        self._executor_pid = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Lazily creates the executor (once per process, safe across forks)."""
+
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.threads)
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _lookup_batches(self, addresses: List[str], testnet: bool):
+        """Returns UTXOs keyed by address, whether any are stale and the max age."""
+
+        results = self.source.cached(addresses, testnet)
+        missing = [address for address in addresses if address not in results]
+        batches = [
+            missing[i : i + self.batch_size]
+            for i in range(0, len(missing), self.batch_size)
+        ]
+        if len(batches) == 1:
+            results.update(self.source.lookup_many(batches[0], testnet))
+        elif batches:
+            executor = self._get_executor()
+            for found in executor.map(
+                lambda batch: self.source.lookup_many(batch, testnet), batches
+            ):
+                results.update(found)
+
+        by_address = {address: results[address].utxos for address in addresses}
+        stale = any(result.stale for result in results.values())
+        age = max((result.age for result in results.values()), default=0.0)
+        return by_address, stale, age
+
+    def fetch(self, addresses: List[str], testnet: bool = False) -> SourceUnspents:
+        """Fetches UTXOs of all addresses.
+
+        No change address is chosen for address lists: change goes back to
+        the first address (reusing it) unless the request names another one.
+        """
+
+        addresses = list(dict.fromkeys(addresses))
+        by_address, stale, age = self._lookup_batches(addresses, testnet)
+        return _merge(by_address, stale=stale, age=age)
+
+    def discover(
+        self, xpub: ExtendedPublicKey, testnet: bool = False, gap_limit: int = GAP_LIMIT
+    ) -> SourceUnspents:
+        """Fetches UTXOs of the receiving and change addresses of xpub.
+
+        Addresses of both chains are scanned `gap_limit` at a time until
+        `gap_limit` consecutive addresses without UTXOs (or `max_addresses`
+        in total) are found. As only UTXOs are scanned, addresses that were
+        used but have been spent from completely count as unused here.
+
+        The change address is the first address of the change chain after
+        the last one holding UTXOs that has no transactions at all, so an
+        emptied change address is never reused (see next_unused).
+        """
+
+        chains = [EXTERNAL_CHAIN, INTERNAL_CHAIN]
+        next_index = {chain: 0 for chain in chains}
+        last_used = {chain: -1 for chain in chains}
+        by_address = {}
+        paths = {}
+        stale = False
+        age = 0.0
+
+        active = list(chains)
+        while active and len(paths) < self.max_addresses:
+            window = [
+                (chain, index, derive_address(xpub, chain, index))
+                for chain in active
+                for index in range(next_index[chain], next_index[chain] + gap_limit)
+            ][: self.max_addresses - len(paths)]
+            for chain in active:
+                next_index[chain] += gap_limit
+
+            found, window_stale, window_age = self._lookup_batches(
+                [address for _, _, address in window], testnet
+            )
+            stale = stale or window_stale
+            age = max(age, window_age)
+            for chain, index, address in window:
+                paths[address] = f"m/{chain}/{index}"
+                if found[address]:
+                    by_address[address] = found[address]
+                    last_used[chain] = max(last_used[chain], index)
+
+            active = [
+                chain
+                for chain in active
+                if next_index[chain] - 1 - last_used[chain] < gap_limit
+            ]
+
+        change_index = self.next_unused(
+            xpub, INTERNAL_CHAIN, last_used[INTERNAL_CHAIN] + 1, testnet
+        )
+        return _merge(
+            by_address,
+            paths=paths,
+            change_address=derive_address(xpub, INTERNAL_CHAIN, change_index),
+            stale=stale,
+            age=age,
+        )
+
+    def next_unused(
+        self, xpub: ExtendedPublicKey, chain: int, start: int, testnet: bool = False
+    ) -> int:
+        """Returns the first index from start of an address without transactions.
+
+        Transaction counts are looked up `batch_size` addresses at a time. If
+        there's no `history`, or `max_addresses` addresses in a row have
+        transactions, the index after those checked is returned.
+        """
+
+        index = start
+        if self.history is None:
+            return index
+        while index < start + self.max_addresses:
+            batch = [
+                derive_address(xpub, chain, i)
+                for i in range(index, index + self.batch_size)
+            ]
+            counts = self.history(ADDRESS_SEPARATOR.join(batch), testnet)
+            for address in batch:
+                if not counts.get(address):
+                    return index
+                index += 1
+        return index
+
+
+def _merge(by_address: Dict[str, List[Unspent]], **kwargs) -> SourceUnspents:
+    utxos = []
+    owners = {}
+    for address, address_utxos in by_address.items():
+        utxos.extend(address_utxos)
+        for utxo in address_utxos:
+            owners[(utxo.txid, utxo.txindex)] = address
+    return SourceUnspents(utxos, owners, **kwargs)
@@ -1,8 +1,8 @@
 from __future__ import annotations
 import math
-from typing import List
-from dataclasses import dataclass, astuple
+from typing import List, NamedTuple
 from fractions import Fraction
+from functools import lru_cache
 from bit.transaction import (
     TxIn,
     TxObj,
@@ -14,45 +14,49 @@ from bit.constants import LOCK_TIME, VERSION_2
 from bit.wallet import Unspent
 from bit.utils import hex_to_bytes
 
+from app.wallet.change import ChangeProfile
+
 # empty scriptSig for new unsigned transaction.
 EMPTY_SCRIPT_SIG = b""
 VALUE_SIZE = 8
 VAR_INT_MIN_SIZE = 1
 BYTES_IN_KB = 1024
+OUTPUT_SIZE_CACHE_SIZE = 2**14
+
 
+class Output(NamedTuple):
+    """Class for keeping track of our transaction outputs.
 
-@dataclass
-class Output:
-    """Class for keeping track of our transaction outputs."""
+    A (slotted, immutable) tuple, so unpacking it (e.g. by
+    `bit.transaction.construct_outputs`) doesn't copy anything.
+    """
 
     address: str
     amount: int
 
-    def __iter__(self):
-        """Makes it unpackable."""
-
-        yield from astuple(self)
 
+class TxContext(NamedTuple):
+    """Class representing context for the transaction.
 
-@dataclass(frozen=True)
-class TxContext:
-    """Class representing context for the transaction."""
+    `seed` (optional) seeds the random strategies, making their selection
+    reproducible. With a `change_profile` (optional) change is split into
+    outputs of the denominations the UTXO pool is short of.
+    """
 
     address: str
     inputs: List[Unspent]
     outputs: List[Output]
     fee_kb: int
     change_address: str
+    seed: int = None
+    change_profile: ChangeProfile = None
 
     def copy(
         self, *, inputs: List[Unspent] = None, outputs: List[Output] = None
     ) -> TxContext:
-        return TxContext(
-            self.address,
-            inputs if inputs is not None else self.inputs,
-            outputs if outputs is not None else self.outputs,
-            self.fee_kb,
-            self.change_address,
+        return self._replace(
+            inputs=inputs if inputs is not None else self.inputs,
+            outputs=outputs if outputs is not None else self.outputs,
         )
 
 
@@ -90,12 +94,25 @@ def serialize_amount(amount: int) -> bytes:
     return amount.to_bytes(8, byteorder="little")
 
 
+@lru_cache(maxsize=OUTPUT_SIZE_CACHE_SIZE)
 def address_to_output_size(address: str) -> int:
     """Calculates total size (in bytes) of TxOut for address"""
 
     return VALUE_SIZE + VAR_INT_MIN_SIZE + len(address_to_scriptpubkey(address))
 
 
+def estimate_tx_size(in_size, n_in, out_size, n_out) -> int:
+    """Estimates transaction size in bytes"""
+
+    return estimate_tx_fee(in_size, n_in, out_size, n_out, 1)
+
+
+def input_fee(vsize: int, fee_kb: int) -> int:
+    """Returns the fee of spending an input of vsize bytes at fee_kb"""
+
+    return -(-vsize * fee_kb // BYTES_IN_KB)
+
+
 def estimate_tx_fee_kb(in_size, n_in, out_size, n_out, fee_kb) -> int:
     """Estimates transaction fee using satoshis per kilobyte"""
 
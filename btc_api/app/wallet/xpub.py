@@ -0,0 +1,98 @@
+import hashlib
+import hmac
+from dataclasses import dataclass
+
+from bit.base58 import b58decode_check, b58encode_check
+from bit.format import public_key_to_address, ripemd160_sha256
+from coincurve import PublicKey
+
+# version bytes of serialized P2PKH extended public keys (xpub/tpub)
+XPUB_VERSIONS = {
+    bytes.fromhex("0488b21e"): "main",
+    bytes.fromhex("043587cf"): "test",
+}
+NETWORK_VERSIONS = {network: version for version, network in XPUB_VERSIONS.items()}
+XPUB_SIZE = 78
+HARDENED_INDEX = 2**31
+
+# BIP44 chains: receiving (external) and change (internal) addresses
+EXTERNAL_CHAIN = 0
+INTERNAL_CHAIN = 1
+
+
+@dataclass(frozen=True)
+class ExtendedPublicKey:
+    """Class representing a BIP32 extended public key (xpub/tpub).
+
+    Only non-hardened (public) derivation is possible.
+    """
+
+    key: bytes
+    chain_code: bytes
+    network: str
+    depth: int = 0
+    parent_fingerprint: bytes = b"\0\0\0\0"
+    child_number: int = 0
+
+    @classmethod
+    def from_string(cls, xpub: str) -> "ExtendedPublicKey":
+        """Parses a base58 serialized xpub (or tpub).
+
+        Raises ValueError if xpub is not a valid P2PKH extended public key.
+        """
+
+        data = b58decode_check(xpub)
+        if len(data) != XPUB_SIZE:
+            raise ValueError("Invalid extended public key length.")
+
+        network = XPUB_VERSIONS.get(data[:4])
+        if network is None:
+            raise ValueError("Only xpub/tpub extended public keys are supported.")
+
+        key = data[45:]
+        PublicKey(key)  # validates the point
+        return cls(
+            key=key,
+            chain_code=data[13:45],
+            network=network,
+            depth=data[4],
+            parent_fingerprint=data[5:9],
+            child_number=int.from_bytes(data[9:13], "big"),
+        )
+
+    def to_string(self) -> str:
+        """Returns the base58 serialization of the key."""
+
+        return b58encode_check(
+            NETWORK_VERSIONS[self.network]
+            + bytes([self.depth])
+            + self.parent_fingerprint
+            + self.child_number.to_bytes(4, "big")
+            + self.chain_code
+            + self.key
+        )
+
+    def child(self, index: int) -> "ExtendedPublicKey":
+        """Derives the (non-hardened) child key at index (CKDpub)."""
+
+        if not 0 <= index < HARDENED_INDEX:
+            raise ValueError("Hardened keys can't be derived from public keys.")
+
+        digest = hmac.new(
+            self.chain_code, self.key + index.to_bytes(4, "big"), hashlib.sha512
+        ).digest()
+        # coincurve raises ValueError for the (improbable) invalid tweaks
+        key = PublicKey(self.key).add(digest[:32]).format(compressed=True)
+        return ExtendedPublicKey(
+            key=key,
+            chain_code=digest[32:],
+            network=self.network,
+            depth=self.depth + 1,
+            parent_fingerprint=ripemd160_sha256(self.key)[:4],
+            child_number=index,
+        )
+
+    def address(self) -> str:
+        """Returns the P2PKH address of the key."""
+
+        return public_key_to_address(self.key, version=self.network)
@@ -0,0 +1 @@
+"""Offline benchmarks for the coin selection and transaction hot path."""
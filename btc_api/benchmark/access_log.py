@@ -0,0 +1,101 @@
+"""Measures the per-request overhead of the access log.
+
+Times logging a /payment_transactions request (with the counts and stage
+timings of a typical request) when the access log is disabled, enabled but
+not sampled, and sampled, where the record is queued for the background
+thread, against formatting and writing the record on the request's thread
+through a plain logging handler. Records are written to os.devnull.
+
+Usage (from the btc_api directory):
+
+    $ python -m benchmark.access_log
+"""
+import argparse
+import logging
+import os
+import sys
+
+from app.access_log import AccessLog, JsonFormatter
+from app.stats import RequestStats
+from benchmark.coin_select import measure
+
+STAGES = [
+    "validate",
+    "admit",
+    "fetch",
+    "filter",
+    "economical",
+    "select",
+    "serialize",
+    "encode",
+]
+
+
+def request_stats() -> RequestStats:
+    stats = RequestStats()
+    stats.count("utxos_fetched", 120)
+    stats.count("utxos_confirmed", 100)
+    stats.count("inputs_selected", 3)
+    stats.info["fee_kb"] = 1024
+    stats.info["offload"] = "inline"
+    for n, stage in enumerate(STAGES, 1):
+        stats.timings[stage] = n / 1000
+    return stats
+
+
+def operations(stream):
+    """Yields (name, callable, access log) of the benchmarked ways to log."""
+
+    stats = request_stats()
+    fields = {"strategy": "greedy_max_secure", "network": "main"}
+
+    for name, enabled, sample_rate in [
+        ("disabled", False, 1.0),
+        ("not_sampled", True, 0.0),
+        ("queued", True, 1.0),
+    ]:
+        # unbounded queue, so no record is dropped
+        access_log = AccessLog(enabled, sample_rate, 0, logging.StreamHandler(stream))
+
+        def op(access_log=access_log):
+            access_log.log_request("payment_transactions", 0.1, stats, **fields)
+
+        yield name, op, access_log
+
+    inline = AccessLog(True, 1.0, 0, logging.StreamHandler(stream))
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(JsonFormatter())
+    # formats and writes on the request's thread instead of queueing
+    inline._logger.addHandler(handler)
+    inline._pid = os.getpid()
+
+    def op():
+        inline.log_request("payment_transactions", 0.1, stats, **fields)
+
+    yield "inline", op, inline
+
+
+def run() -> dict:
+    """Returns {name: seconds per request} of every way to log."""
+
+    results = {}
+    with open(os.devnull, "w") as stream:
+        for name, op, access_log in operations(stream):
+            results[name] = measure(op)[0]
+            access_log.stop()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.parse_args(argv)
+
+    results = run()
+    print(f"{'access log':<12} {'per request':>12}")
+    for name, seconds in results.items():
+        print(f"{name:<12} {seconds * 1e6:>9.2f} us")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,294 @@
+"""Benchmarks coin selection, fee estimation and serialization.
+
+Builds synthetic wallets of 10 to 100k UTXOs paying 1 to 1000 outputs, times
+every strategy in `coin_select_strategies`, `estimate_tx_fee_kb` and
+`create_unsigned().to_hex()`, and records throughput and peak memory.
+
+Timings (the median of several repeats) are normalized by a fixed
+calibration workload so results are comparable across machines, and compared
+against the stored baseline: the run fails (exit code 1) if any operation got
+slower than the tolerance, widened by how much the calibration itself varied
+during the run, or if its peak memory grew more than the memory tolerance.
+
+Usage (from the btc_api directory):
+
+    $ python -m benchmark.coin_select [--quick] [--only OP] [--update-baseline]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from fractions import Fraction
+from functools import partial
+
+from app.strategies import coin_select_strategies, DEFAULT_STRATEGY, reseed
+from app.wallet.transaction import (
+    address_to_output_size,
+    create_unsigned,
+    estimate_tx_fee_kb,
+)
+from benchmark.synthetic import synthetic_context
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+WALLET_SIZES = [10, 100, 1000, 10000, 100000]
+OUTPUT_COUNTS = [1, 10, 100, 1000]
+QUICK_WALLET_SIZES = [10, 1000]
+QUICK_OUTPUT_COUNTS = [1, 100]
+
+# timing budget (in seconds) and number of repeats of a single operation
+TIME_BUDGET_SEC = 0.5
+MIN_REPEATS = 5
+MAX_REPEATS = 1000
+# fast operations are called in batches taking at least this long (in seconds)
+MIN_BATCH_SEC = 0.001
+
+DEFAULT_TOLERANCE = 0.5
+DEFAULT_MEMORY_TOLERANCE = 0.2
+# peak memory changes smaller than this (in bytes) are never regressions
+MIN_MEMORY_DELTA = 4096
+# slowdowns smaller than this (in seconds per call) are never regressions,
+# timings of microsecond operations are dominated by jitter
+MIN_TIME_DELTA = 0.0005
+RANDOM_SEED = 1234
+
+
+def calibration_workload():
+    """A fixed pure-Python workload similar to the selection hot path."""
+
+    total = Fraction(0)
+    for i in range(1, 500):
+        total += Fraction(i, 1024)
+    return sorted(range(5000, 0, -1))
+
+
+def calibrate() -> float:
+    """Returns the median seconds per call of the calibration workload."""
+
+    return measure(calibration_workload)[0]
+
+
+def spread(timings) -> float:
+    """Returns the interquartile range of timings relative to their median."""
+
+    timings = sorted(timings)
+    n = len(timings)
+    q1, q3 = timings[n // 4], timings[(3 * n) // 4]
+    return (q3 - q1) / statistics.median(timings)
+
+
+def calibration_noise(calibrations) -> float:
+    """Returns the relative spread of calibrations made during a run."""
+
+    return max(calibrations) / min(calibrations) - 1
+
+
+def measure(op):
+    """Returns median seconds per call, their spread and number of calls made."""
+
+    def batch(number):
+        started = time.perf_counter()
+        for _ in range(number):
+            op()
+        return time.perf_counter() - started
+
+    number = 1
+    while batch(number) < MIN_BATCH_SEC:
+        number *= 2
+
+    timings = []
+    deadline = time.perf_counter() + TIME_BUDGET_SEC
+    while len(timings) < MIN_REPEATS or (
+        len(timings) < MAX_REPEATS and time.perf_counter() < deadline
+    ):
+        timings.append(batch(number) / number)
+    return statistics.median(timings), spread(timings), len(timings) * number
+
+
+def peak_memory(op) -> int:
+    """Returns peak memory (in bytes) allocated during a single call."""
+
+    tracemalloc.start()
+    try:
+        op()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def operations(context):
+    """Yields (name, callable) of all benchmarked operations for context."""
+
+    for name, strategy in coin_select_strategies.items():
+        yield f"select:{name}", partial(strategy.select, context)
+
+    reseed(RANDOM_SEED)
+    coins = coin_select_strategies[DEFAULT_STRATEGY].select(context)
+    in_size = sum(utxo.vsize for utxo in coins.inputs)
+    out_size = sum(address_to_output_size(out.address) for out in coins.outputs)
+
+    def estimate():
+        return estimate_tx_fee_kb(
+            in_size, len(coins.inputs), out_size, len(coins.outputs), context.fee_kb
+        )
+
+    def serialize():
+        return create_unsigned(coins.inputs, coins.outputs).to_hex()
+
+    yield "estimate_tx_fee_kb", estimate
+    yield "serialize", serialize
+
+
+def run(wallet_sizes, output_counts, calibration: float, only: str = None):
+    """Runs all benchmarks, returns results keyed by case and operation.
+
+    If given, only operations whose name starts with `only` are run.
+    """
+
+    results = {}
+    for n_utxos in wallet_sizes:
+        for n_outputs in output_counts:
+            context = synthetic_context(n_utxos, n_outputs)
+            if context is None:
+                continue
+
+            for name, op in operations(context):
+                if only and not name.startswith(only):
+                    continue
+                key = f"{name}[utxos={n_utxos},outputs={n_outputs}]"
+                # reseeded once per operation, outside of the timed calls
+                reseed(RANDOM_SEED)
+                seconds, time_spread, calls = measure(op)
+                results[key] = {
+                    "seconds": seconds,
+                    "spread": time_spread,
+                    "normalized": seconds / calibration,
+                    "ops_per_sec": 1 / seconds,
+                    "peak_memory_bytes": peak_memory(op),
+                    "calls": calls,
+                }
+                print(
+                    f"{key:<60} {seconds * 1000:>10.3f} ms {1 / seconds:>12.1f} ops/s "
+                    f"{results[key]['peak_memory_bytes'] / 1024:>10.1f} KiB",
+                    file=sys.stderr,
+                )
+    return results
+
+
+def compare(
+    results,
+    baseline,
+    tolerance: float,
+    memory_tolerance: float = DEFAULT_MEMORY_TOLERANCE,
+    noise: float = 0.0,
+):
+    """Returns (key, metric, ratio) of operations slower or bigger than baseline.
+
+    The allowed slowdown is `tolerance` plus the calibration `noise` and
+    twice the larger spread (relative interquartile range of the repeats) of
+    the operation in either run, so runs on a machine whose speed varied are
+    judged more loosely. Slowdowns of less than MIN_TIME_DELTA per call are
+    ignored.
+    """
+
+    regressions = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        ratio = result["normalized"] / base["normalized"]
+        jitter = 2 * max(result.get("spread", 0.0), base.get("spread", 0.0))
+        slowdown = (ratio - 1) * base["seconds"]
+        if ratio > 1 + tolerance + noise + jitter and slowdown > MIN_TIME_DELTA:
+            regressions.append((key, "time", ratio))
+
+        memory, base_memory = result["peak_memory_bytes"], base["peak_memory_bytes"]
+        if memory - base_memory > MIN_MEMORY_DELTA and memory > base_memory * (
+            1 + memory_tolerance
+        ):
+            regressions.append((key, "memory", memory / base_memory))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--quick", action="store_true", help="run a small subset")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline file")
+    parser.add_argument(
+        "--only", help="only run operations starting with this (e.g. select:best_fit)"
+    )
+    parser.add_argument(
+        "--update-baseline", action="store_true", help="store results as baseline"
+    )
+    parser.add_argument("--output", help="write results (JSON) to this file")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help="allowed slowdown vs. baseline (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--memory-tolerance",
+        type=float,
+        default=DEFAULT_MEMORY_TOLERANCE,
+        help="allowed peak memory growth vs. baseline (default: %(default)s)",
+    )
+    args = parser.parse_args(argv)
+
+    calibration = calibrate()
+    print(f"calibration: {calibration * 1000:.3f} ms", file=sys.stderr)
+
+    if args.quick:
+        results = run(QUICK_WALLET_SIZES, QUICK_OUTPUT_COUNTS, calibration, args.only)
+    else:
+        results = run(WALLET_SIZES, OUTPUT_COUNTS, calibration, args.only)
+
+    # the machine may have been busy while calibrating, keep the fastest run
+    # and widen the tolerance by how much the calibrations differ
+    calibrations = [calibration, calibrate()]
+    noise = calibration_noise(calibrations)
+    print(f"calibration noise: {noise:.1%}", file=sys.stderr)
+    if calibrations[1] < calibration:
+        for result in results.values():
+            result["normalized"] = result["seconds"] / calibrations[1]
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"baseline updated: {args.baseline}", file=sys.stderr)
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"no baseline found at {args.baseline}", file=sys.stderr)
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+
+    regressions = compare(
+        results, baseline, args.tolerance, args.memory_tolerance, noise
+    )
+    for key, metric, ratio in regressions:
+        change = "slower" if metric == "time" else "more peak memory"
+        print(f"REGRESSION {key}: {ratio:.2f}x {change} than baseline", file=sys.stderr)
+    if regressions:
+        return 1
+
+    print("no regressions against baseline", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
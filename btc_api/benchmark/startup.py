@@ -0,0 +1,191 @@
+"""Measures worker startup: import times and the time to the first request.
+
+Reports the modules that take the longest to import (`python -X importtime`)
+and the time a worker needs to serve its first /payment_transactions request
+(against a local fake UTXO provider), both when the worker imports the app
+itself (cold, as Gunicorn workers do by default) and when it's forked from a
+master that already imported it (preloaded, as with `preload_app = True` in
+gunicorn.conf.py).
+
+Usage (from the btc_api directory):
+
+    $ python -m benchmark.startup [--module app.wsgi] [--top 15] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+DEFAULT_MODULE = "app.wsgi"
+DEFAULT_TOP = 15
+DEFAULT_REPEAT = 5
+RANDOM_SEED = 1234
+
+COLD = "cold"
+PRELOAD = "preload"
+
+
+def import_times(module: str):
+    """Returns (name, self_us, cumulative_us) of every module imported by module."""
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:") :].split("|")
+        if not fields[0].strip().isdigit():
+            continue  # header
+        entries.append((fields[2].strip(), int(fields[0]), int(fields[1])))
+    return entries
+
+
+def package_times(entries):
+    """Returns total self import time (us) by top-level package, slowest first."""
+
+    totals = defaultdict(int)
+    for name, self_us, _ in entries:
+        totals[name.split(".")[0]] += self_us
+    return sorted(totals.items(), key=lambda item: -item[1])
+
+
+def first_request(payload: dict):
+    """Serves the first request in a fresh worker, returns the timings (in sec)."""
+
+    mode = payload.pop("mode")
+    started = time.perf_counter()
+    from app.wsgi import app
+
+    imported = time.perf_counter()
+    if mode == PRELOAD:
+        # the master imported the app, time the forked worker only
+        r, w = os.pipe()
+        pid = os.fork()
+        if pid:
+            os.close(w)
+            with os.fdopen(r) as f:
+                timings = json.load(f)
+            os.waitpid(pid, 0)
+            return timings
+        os.close(r)
+        started = imported = time.perf_counter()
+
+    client = app.test_client()
+    response = client.post("/payment_transactions", json=payload)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    served = time.perf_counter()
+    client.post("/payment_transactions", json=payload)
+    timings = {
+        "import": imported - started,
+        "first_request": served - imported,
+        "second_request": time.perf_counter() - served,
+    }
+    if mode == PRELOAD:
+        with os.fdopen(w, "w") as f:
+            json.dump(timings, f)
+        os._exit(0)
+    return timings
+
+
+def measure_first_request(mode: str, provider_url: str, payload: dict):
+    """Runs `first_request` in a new interpreter, returns the timings."""
+
+    env = dict(
+        os.environ,
+        BTC_API_UNSPENT_URLS_MAINNET=provider_url,
+        BTC_API_UNSPENT_URLS_TESTNET=provider_url,
+    )
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "benchmark.startup",
+            "--worker",
+            json.dumps(dict(payload, mode=mode)),
+        ],
+        env=env,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    return json.loads(result.stdout)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--module", default=DEFAULT_MODULE, help="module to import")
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=DEFAULT_TOP,
+        help="number of packages and modules to list (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=DEFAULT_REPEAT,
+        help="number of measurements, the median is reported (default: %(default)s)",
+    )
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(first_request(json.loads(args.worker))))
+        return 0
+
+    runs = [import_times(args.module) for _ in range(args.repeat)]
+    entries = min(runs, key=lambda run: run[-1][2])
+    print(f"import {args.module}: {entries[-1][2] / 1000:.1f} ms (fastest run)")
+    print(f"\nslowest packages (self time):")
+    for name, self_us in package_times(entries)[: args.top]:
+        print(f"  {name:<30} {self_us / 1000:8.1f} ms")
+    print(f"\nslowest modules (cumulative time):")
+    for name, _, cumulative_us in sorted(entries, key=lambda e: -e[2])[: args.top]:
+        print(f"  {name:<30} {cumulative_us / 1000:8.1f} ms")
+
+    # imported here, so that the import times above aren't affected
+    from benchmark.synthetic import random_address, random_outputs
+    from loadtest.fake_provider import FakeProvider, ProviderConfig
+
+    rng = random.Random(RANDOM_SEED)
+    payload = {
+        "source_address": random_address(rng),
+        "outputs": {out.address: out.amount for out in random_outputs(rng, 2, 50000)},
+        "fee_kb": 1024,
+        "strategy": "greedy_max_secure",
+    }
+    provider = FakeProvider(ProviderConfig(latency_ms=0, jitter_ms=0)).start()
+    try:
+        print(f"\ntime to first request (median of {args.repeat}):")
+        for mode in [COLD, PRELOAD]:
+            runs = [
+                measure_first_request(mode, provider.url, payload)
+                for _ in range(args.repeat)
+            ]
+            timings = {
+                key: statistics.median(run[key] for run in runs) for key in runs[0]
+            }
+            print(
+                f"  {mode:<8} import {timings['import'] * 1000:7.1f} ms"
+                f"  first request {timings['first_request'] * 1000:6.1f} ms"
+                f"  total {(timings['import'] + timings['first_request']) * 1000:7.1f} ms"
+                f"  (next request {timings['second_request'] * 1000:.1f} ms)"
+            )
+    finally:
+        provider.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
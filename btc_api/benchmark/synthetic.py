@@ -0,0 +1,102 @@
+"""Synthetic, reproducible wallets and payouts for benchmarks and load tests."""
+import math
+import random
+from typing import List
+
+from bit.base58 import b58encode_check
+from bit.format import (
+    MAIN_PUBKEY_HASH,
+    MAIN_SCRIPT_HASH,
+    TEST_PUBKEY_HASH,
+    TEST_SCRIPT_HASH,
+)
+from bit.transaction import address_to_scriptpubkey
+from bit.wallet import Unspent
+
+from app.wallet.coin_select import DUST_THRESHOLD
+from app.wallet.transaction import TxContext, Output
+
+SOURCE_ADDRESS = "1Po1oWkD2LmodfkBYiAktwh76vkF93LKnh"
+
+# UTXO amounts follow a log-normal distribution with a median of ~0.001 BTC
+UTXO_AMOUNT_MU = math.log(100000)
+UTXO_AMOUNT_SIGMA = 2.0
+# payout amounts follow a log-normal distribution with a median of ~0.0005 BTC
+OUTPUT_AMOUNT_MU = math.log(50000)
+OUTPUT_AMOUNT_SIGMA = 1.5
+# share of P2SH destinations among payouts
+P2SH_OUTPUT_RATIO = 0.3
+# share of the wallet balance a payout run spends at most
+MAX_SPEND_RATIO = 0.5
+
+
+def random_address(rng: random.Random, version: bytes = MAIN_PUBKEY_HASH) -> str:
+    """Generates a random (but valid) base58 address."""
+
+    return b58encode_check(version + rng.getrandbits(160).to_bytes(20, "big"))
+
+
+def random_unspents(
+    rng: random.Random, n: int, address: str = SOURCE_ADDRESS
+) -> List[Unspent]:
+    """Generates `n` UTXOs of `address` with realistic amounts and ages."""
+
+    script = address_to_scriptpubkey(address).hex()
+    return [
+        Unspent(
+            amount=max(
+                DUST_THRESHOLD,
+                int(rng.lognormvariate(UTXO_AMOUNT_MU, UTXO_AMOUNT_SIGMA)),
+            ),
+            confirmations=int(rng.expovariate(1 / 500)),
+            script=script,
+            txid="%064x" % rng.getrandbits(256),
+            txindex=rng.randrange(8),
+        )
+        for _ in range(n)
+    ]
+
+
+def random_outputs(
+    rng: random.Random, n: int, budget: int, testnet: bool = False
+) -> List[Output]:
+    """Generates `n` payouts (P2PKH and P2SH) worth at most `budget` in total."""
+
+    amounts = [
+        max(
+            DUST_THRESHOLD,
+            int(rng.lognormvariate(OUTPUT_AMOUNT_MU, OUTPUT_AMOUNT_SIGMA)),
+        )
+        for _ in range(n)
+    ]
+    total = sum(amounts)
+    if total > budget:
+        amounts = [max(DUST_THRESHOLD, a * budget // total) for a in amounts]
+
+    versions = (
+        (TEST_PUBKEY_HASH, TEST_SCRIPT_HASH)
+        if testnet
+        else (MAIN_PUBKEY_HASH, MAIN_SCRIPT_HASH)
+    )
+    return [
+        Output(random_address(rng, versions[rng.random() < P2SH_OUTPUT_RATIO]), amount)
+        for amount in amounts
+    ]
+
+
+def synthetic_context(
+    n_utxos: int, n_outputs: int, fee_kb: int = 1024, seed: int = 0
+) -> TxContext:
+    """Builds a reproducible transaction context for a synthetic wallet.
+
+    Returns None if the wallet can't fund `n_outputs` non-dust payouts.
+    """
+
+    rng = random.Random(f"{seed}-{n_utxos}-{n_outputs}")
+    inputs = random_unspents(rng, n_utxos)
+    budget = int(sum(utxo.amount for utxo in inputs) * MAX_SPEND_RATIO)
+    if budget < n_outputs * DUST_THRESHOLD:
+        return None
+
+    outputs = random_outputs(rng, n_outputs, budget)
+    return TxContext(SOURCE_ADDRESS, inputs, outputs, fee_kb, SOURCE_ADDRESS)
@@ -0,0 +1,105 @@
+"""Compares the hot-path value types with the dataclasses they replaced.
+
+Outputs used to be dataclasses unpacked through `dataclasses.astuple`, which
+deep-copies every field, and every strategy copied the TxContext and its
+outputs. For a synthetic 1000-output payout this times (and records the peak
+memory of) unpacking the outputs the way `bit.transaction.construct_outputs`
+does, the default strategy, serializing the transaction and the whole select
+and serialize path, once with the previous dataclass outputs and once with
+`Output`.
+
+Usage (from the btc_api directory):
+
+    $ python -m benchmark.value_types [--outputs 1000] [--utxos 1000]
+"""
+import argparse
+import sys
+from dataclasses import astuple, dataclass
+
+from app.strategies import coin_select_strategies, DEFAULT_STRATEGY
+from app.wallet.transaction import create_unsigned
+from benchmark.coin_select import measure, peak_memory
+from benchmark.synthetic import synthetic_context
+
+DEFAULT_OUTPUTS = 1000
+DEFAULT_UTXOS = 1000
+
+
+@dataclass
+class DataclassOutput:
+    """Output as it was before it became a NamedTuple."""
+
+    address: str
+    amount: int
+
+    def __iter__(self):
+        yield from astuple(self)
+
+
+def operations(context):
+    """Yields (name, callable) of the operations benchmarked for context."""
+
+    strategy = coin_select_strategies[DEFAULT_STRATEGY]
+    outputs = context.outputs
+    coins = strategy.select(context)
+
+    def unpack():
+        for address, amount in outputs:
+            pass
+
+    def select():
+        return strategy.select(context)
+
+    def serialize():
+        return create_unsigned(coins.inputs, coins.outputs).to_hex()
+
+    def payout():
+        selected = strategy.select(context)
+        return create_unsigned(selected.inputs, selected.outputs).to_hex()
+
+    yield "unpack", unpack
+    yield "select", select
+    yield "serialize", serialize
+    yield "select_and_serialize", payout
+
+
+def run(n_utxos: int, n_outputs: int):
+    """Returns {operation: {type: (seconds, peak memory)}} for both output types."""
+
+    context = synthetic_context(n_utxos, n_outputs)
+    if context is None:
+        raise SystemExit(f"{n_utxos} UTXOs can't fund {n_outputs} outputs")
+    legacy = context.copy(
+        outputs=[DataclassOutput(out.address, out.amount) for out in context.outputs]
+    )
+
+    results = {}
+    for label, ctx in [("dataclass", legacy), ("namedtuple", context)]:
+        for name, op in operations(ctx):
+            results.setdefault(name, {})[label] = (measure(op)[0], peak_memory(op))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--outputs", type=int, default=DEFAULT_OUTPUTS)
+    parser.add_argument("--utxos", type=int, default=DEFAULT_UTXOS)
+    args = parser.parse_args(argv)
+
+    results = run(args.utxos, args.outputs)
+    print(
+        f"{'operation':<22} {'dataclass':>12} {'namedtuple':>12} {'speedup':>8} "
+        f"{'peak (dataclass)':>17} {'peak (namedtuple)':>18}"
+    )
+    for name, result in results.items():
+        (old, old_peak), (new, new_peak) = result["dataclass"], result["namedtuple"]
+        print(
+            f"{name:<22} {old * 1000:>9.3f} ms {new * 1000:>9.3f} ms "
+            f"{old / new:>7.1f}x {old_peak / 1024:>13.1f} KiB "
+            f"{new_peak / 1024:>14.1f} KiB"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,62 @@
+"""Gunicorn settings of the btc_api service.
+
+The app is imported once by the master (`preload_app`) and the workers are
+forked from it, so a (re)started worker doesn't import Flask, bit and
+requests again before serving its first request. Run
+`python -m benchmark.startup` to measure the difference.
+"""
+import gc
+
+from app import config
+
+bind = ":8000"
+workers = 1
+preload_app = True
+# the app admits (or sheds) requests itself, so every request admitted or
+# waiting for admission needs a thread instead of queueing in the backlog
+threads = config.ADMISSION_MAX_IN_FLIGHT + config.ADMISSION_MAX_QUEUE
+
+
+def when_ready(server):
+    # objects created while importing the app are never collected, keep the
+    # collector from touching (and copying) the pages shared with the workers
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    from app.strategies import reseed, RANDOM_SEED
+
+    # workers inherit the state of the master's generator, give each its own
+    reseed(RANDOM_SEED + worker.age)
+
+    from app.payment import fee_oracles, unspent_snapshots
+
+    unspent_snapshots.start()
+    # have estimates ready before the first "auto" fee request
+    for oracle in fee_oracles.values():
+        oracle.start()
+
+    from app.app import access_log
+
+    if access_log.enabled:
+        access_log.start()
+
+
+def worker_exit(server, worker):
+    from app.payment import unspent_snapshots
+
+    # keep the UTXO sets of the worker for the next one (e.g. after a deploy)
+    if unspent_snapshots.enabled:
+        unspent_snapshots.save()
+
+    from app.app import access_log
+
+    # write the records still queued
+    access_log.stop()
+
+
+def child_exit(server, worker):
+    if config.PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid, config.PROMETHEUS_MULTIPROC_DIR)
@@ -0,0 +1 @@
+"""End-to-end load tests of the app against a local fake UTXO provider."""
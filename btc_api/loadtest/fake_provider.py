@@ -0,0 +1,119 @@
+"""Local stand-in for the blockchain.info `/unspent` API."""
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from benchmark.synthetic import random_unspents
+
+
+@dataclass
+class ProviderConfig:
+    """Class representing behaviour of the fake UTXO provider."""
+
+    latency_ms: float = 50.0
+    jitter_ms: float = 20.0
+    error_rate: float = 0.0
+    utxo_count: int = 100
+
+    def describe(self) -> str:
+        return (
+            f"latency={self.latency_ms:g}ms jitter={self.jitter_ms:g}ms "
+            f"errors={self.error_rate:.0%} utxos={self.utxo_count}"
+        )
+
+
+class FakeProvider:
+    """Serves synthetic UTXO sets (one per address) after a simulated delay.
+
+    Every address gets a reproducible set of `utxo_count` UTXOs. Responses
+    are delayed by `latency_ms` plus a uniformly distributed `jitter_ms`, and
+    fail with HTTP 500 with probability `error_rate`.
+    """
+
+    def __init__(self, provider_config: ProviderConfig, host="127.0.0.1", port=0):
+        self.config = provider_config
+        self._random = random.Random()
+        self._responses = {}
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def response_for(self, addresses) -> bytes:
+        """Returns (cached) encoded `/unspent` response for addresses."""
+
+        key = tuple(addresses)
+        with self._lock:
+            body = self._responses.get(key)
+        if body is not None:
+            return body
+
+        unspent_outputs = []
+        for address in addresses:
+            rng = random.Random(address)
+            unspent_outputs += [
+                {
+                    "tx_hash_big_endian": utxo.txid,
+                    "tx_output_n": utxo.txindex,
+                    "script": utxo.script,
+                    "value": utxo.amount,
+                    "confirmations": utxo.confirmations + 6,
+                }
+                for utxo in random_unspents(rng, self.config.utxo_count, address)
+            ]
+        body = json.dumps({"unspent_outputs": unspent_outputs}).encode()
+        with self._lock:
+            self._responses[key] = body
+        return body
+
+    def delay(self) -> float:
+        """Returns simulated response delay (in seconds)."""
+
+        jitter = self._random.uniform(0, self.config.jitter_ms)
+        return (self.config.latency_ms + jitter) / 1000
+
+    def _handler_class(self):
+        provider = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                active = parse_qs(url.query).get("active", [""])[0]
+                if url.path != "/unspent" or not active:
+                    self.send_error(404)
+                    return
+
+                time.sleep(provider.delay())
+                if provider._random.random() < provider.config.error_rate:
+                    self.send_error(500, "Simulated provider error")
+                    return
+
+                body = provider.response_for(active.split("|"))
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,248 @@
+"""Drives /payment_transactions with a request mix against a fake UTXO provider.
+
+For every server configuration (a combination of provider latency, jitter,
+error rate and UTXO set size) the harness starts a fake `/unspent` provider,
+starts the app pointed at it, replays a request mix (strategies, output
+counts, testnet/mainnet) at the given concurrency and reports latency
+percentiles (of successful requests), throughput and the share of requests
+rejected by admission control.
+
+Usage (from the btc_api directory):
+
+    $ python -m loadtest.run --latency-ms 20,200 --utxos 100,10000 --concurrency 16
+"""
+import argparse
+import itertools
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from bit.format import MAIN_PUBKEY_HASH, TEST_PUBKEY_HASH
+
+from app.payment import coin_select_strategies
+from benchmark.synthetic import random_address, random_outputs
+from loadtest.fake_provider import FakeProvider, ProviderConfig
+
+# request mix: share of testnet requests, output counts (weighted) and the
+# number of distinct source addresses
+TESTNET_RATIO = 0.2
+OUTPUT_COUNTS = {1: 70, 10: 25, 100: 5}
+SOURCE_ADDRESSES = 50
+# max total amount paid by a single request
+PAYOUT_BUDGET = 500000
+
+STARTUP_TIMEOUT_SEC = 30
+
+# statuses of requests shed by admission control
+REJECTED_STATUSES = (429, 503)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(sorted_values, p: float) -> float:
+    if not sorted_values:
+        return float("nan")
+    k = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+class RequestMix:
+    """Generates a reproducible stream of /payment_transactions payloads."""
+
+    def __init__(self, seed: int, strategies):
+        self.rng = random.Random(seed)
+        self.strategies = list(strategies)
+        self.sources = {
+            testnet: [
+                random_address(self.rng, version) for _ in range(SOURCE_ADDRESSES)
+            ]
+            for testnet, version in [
+                (False, MAIN_PUBKEY_HASH),
+                (True, TEST_PUBKEY_HASH),
+            ]
+        }
+        self._lock = threading.Lock()
+
+    def next(self) -> dict:
+        with self._lock:
+            rng = self.rng
+            testnet = rng.random() < TESTNET_RATIO
+            [n_outputs] = rng.choices(list(OUTPUT_COUNTS), list(OUTPUT_COUNTS.values()))
+            outputs = random_outputs(rng, n_outputs, PAYOUT_BUDGET, testnet)
+            return {
+                "source_address": rng.choice(self.sources[testnet]),
+                "outputs": {out.address: out.amount for out in outputs},
+                "fee_kb": 1024,
+                "strategy": rng.choice(self.strategies),
+                "min_confirmations": 6,
+                "testnet": testnet,
+            }
+
+
+def start_app(
+    server: str, port: int, provider_url: str, workers: int, verbose: bool = False
+):
+    """Starts the app in a subprocess and waits until it's ready."""
+
+    # every request comes from the same client (and many from the same
+    # source address), so only the overall admission limits apply
+    env = dict(
+        os.environ,
+        BTC_API_UNSPENT_URLS_MAINNET=provider_url,
+        BTC_API_UNSPENT_URLS_TESTNET=provider_url,
+        BTC_API_ADMISSION_MAX_PER_CLIENT="0",
+        BTC_API_ADMISSION_MAX_PER_SOURCE="0",
+    )
+    if server == "gunicorn":
+        cmd = [
+            sys.executable,
+            "-m",
+            "gunicorn",
+            "--config",
+            "gunicorn.conf.py",
+            "--workers",
+            str(workers),
+            "--bind",
+            f"127.0.0.1:{port}",
+            "app.wsgi:app",
+        ]
+    else:
+        cmd = [sys.executable, "-m", "loadtest.serve", str(port)]
+
+    process = subprocess.Popen(
+        cmd,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=None if verbose else subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + STARTUP_TIMEOUT_SEC
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"http://127.0.0.1:{port}/", timeout=1)
+            return process
+        except requests.ConnectionError:
+            if process.poll() is not None:
+                break
+            time.sleep(0.1)
+
+    process.kill()
+    raise RuntimeError(f"App server ({server}) failed to start")
+
+
+def run_load(url: str, mix: RequestMix, concurrency: int, duration: float):
+    """Sends requests for `duration` seconds, returns latencies and statuses.
+
+    Latencies are those of successful (200) requests only.
+    """
+
+    latencies = []
+    statuses = Counter()
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def client():
+        session = requests.Session()
+        while time.monotonic() < stop_at:
+            payload = mix.next()
+            started = time.perf_counter()
+            try:
+                status = session.post(url, json=payload, timeout=30).status_code
+            except requests.RequestException as e:
+                status = e.__class__.__name__
+            elapsed = time.perf_counter() - started
+            with lock:
+                if status == 200:
+                    latencies.append(elapsed)
+                statuses[status] += 1
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(concurrency):
+            executor.submit(client)
+    return sorted(latencies), statuses, time.monotonic() - started
+
+
+def report(provider_config: ProviderConfig, latencies, statuses, elapsed: float):
+    """Prints results of a single server configuration."""
+
+    ms = 1000
+    total = sum(statuses.values())
+    rejected = sum(statuses[status] for status in REJECTED_STATUSES)
+    print(
+        f"{provider_config.describe():<52} "
+        f"n={total:<6} ok_rps={len(latencies) / elapsed:>8.1f} "
+        f"rejected={rejected / total if total else 0:>6.1%} "
+        f"p50={percentile(latencies, 50) * ms:>8.1f}ms "
+        f"p90={percentile(latencies, 90) * ms:>8.1f}ms "
+        f"p99={percentile(latencies, 99) * ms:>8.1f}ms "
+        f"status={dict(statuses)}"
+    )
+
+
+def parse_list(cast):
+    return lambda value: [cast(v) for v in value.split(",")]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--latency-ms", type=parse_list(float), default=[50.0])
+    parser.add_argument("--jitter-ms", type=parse_list(float), default=[20.0])
+    parser.add_argument("--error-rate", type=parse_list(float), default=[0.0])
+    parser.add_argument("--utxos", type=parse_list(int), default=[100])
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument(
+        "--strategies",
+        type=parse_list(str),
+        default=list(coin_select_strategies),
+        help="strategies in the request mix (comma separated)",
+    )
+    parser.add_argument(
+        "--server", choices=["werkzeug", "gunicorn"], default="werkzeug"
+    )
+    parser.add_argument("--workers", type=int, default=1, help="Gunicorn workers")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--verbose", action="store_true", help="show app logs")
+    args = parser.parse_args(argv)
+
+    configs = [
+        ProviderConfig(latency, jitter, error_rate, utxos)
+        for latency, jitter, error_rate, utxos in itertools.product(
+            args.latency_ms, args.jitter_ms, args.error_rate, args.utxos
+        )
+    ]
+
+    for provider_config in configs:
+        provider = FakeProvider(provider_config).start()
+        port = free_port()
+        app_process = start_app(
+            args.server, port, provider.url, args.workers, args.verbose
+        )
+        try:
+            mix = RequestMix(args.seed, args.strategies)
+            latencies, statuses, elapsed = run_load(
+                f"http://127.0.0.1:{port}/payment_transactions",
+                mix,
+                args.concurrency,
+                args.duration,
+            )
+            report(provider_config, latencies, statuses, elapsed)
+        finally:
+            app_process.terminate()
+            app_process.wait()
+            provider.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+"""Serves the app using the threaded Werkzeug server (when Gunicorn isn't used)."""
+import logging
+import signal
+import sys
+
+from werkzeug.serving import run_simple
+
+from app.app import app
+
+if __name__ == "__main__":
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    # exit cleanly when stopped by the harness, so the selection pool shuts down
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    run_simple("127.0.0.1", int(sys.argv[1]), app, threaded=True)
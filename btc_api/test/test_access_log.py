@@ -0,0 +1,101 @@
+import unittest
+import io
+import json
+import logging
+import threading
+
+from app.access_log import AccessLog
+from app.stats import RequestStats
+
+
+class BlockingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.entered = threading.Event()
+        self.unblocked = threading.Event()
+        self.records = []
+
+    def emit(self, record):
+        self.entered.set()
+        self.unblocked.wait(5)
+        self.records.append(self.format(record))
+
+
+class TestAccessLog(unittest.TestCase):
+    def setUp(self):
+        self.stream = io.StringIO()
+
+    def access_log(self, enabled=True, sample_rate=1.0, max_queue=100, handler=None):
+        access_log = AccessLog(
+            enabled,
+            sample_rate,
+            max_queue,
+            handler or logging.StreamHandler(self.stream),
+        )
+        self.addCleanup(access_log.stop)
+        return access_log
+
+    def records(self):
+        return [json.loads(line) for line in self.stream.getvalue().splitlines()]
+
+    def test_should_log(self):
+        cases = [
+            (self.access_log(False, 1.0), None, False),
+            (self.access_log(False, 1.0), "InsufficientFunds", False),
+            (self.access_log(True, 0.0), None, False),
+            (self.access_log(True, 0.0), "InsufficientFunds", True),
+            (self.access_log(True, 1.0), None, True),
+        ]
+
+        for n, (access_log, error, expected) in enumerate(cases, 1):
+            with self.subTest(n=n):
+                self.assertEqual(access_log.should_log(error), expected)
+
+    def test_log_request(self):
+        access_log = self.access_log()
+        stats = RequestStats()
+        stats.count("utxos_fetched", 42)
+        stats.count("inputs_selected", 3)
+        stats.info["fee_kb"] = 1024
+        with stats.stage("select"):
+            pass
+
+        access_log.log_request(
+            "payment_transactions", 0.25, stats, strategy="best_fit", network="main"
+        )
+        access_log.log_request("payment_transactions", 0.01, RequestStats(), "Foo")
+        access_log.stop()
+
+        ok, failed = self.records()
+        self.assertEqual(ok["endpoint"], "payment_transactions")
+        self.assertEqual(ok["strategy"], "best_fit")
+        self.assertEqual(ok["network"], "main")
+        self.assertEqual(ok["utxos_fetched"], 42)
+        self.assertIsNone(ok["utxos_confirmed"])
+        self.assertEqual(ok["inputs_selected"], 3)
+        self.assertEqual(ok["fee_kb"], 1024)
+        self.assertEqual(ok["duration"], 0.25)
+        self.assertEqual(list(ok["timings"]), ["select"])
+        self.assertIsNone(ok["error"])
+        self.assertIn("ts", ok)
+        self.assertEqual(failed["error"], "Foo")
+        self.assertEqual(access_log.logged, 2)
+
+    def test_dropped(self):
+        handler = BlockingHandler()
+        access_log = self.access_log(max_queue=1, handler=handler)
+        access_log.log_request("payment_transactions", 0.1, RequestStats())
+        # the listener is writing the first record, the second is queued
+        self.assertTrue(handler.entered.wait(5))
+        for _ in range(3):
+            access_log.log_request("payment_transactions", 0.1, RequestStats())
+        self.assertEqual(access_log.dropped, 2)
+
+        handler.unblocked.set()
+        access_log.stop()
+        self.assertEqual(len(handler.records), 2)
+        self.assertEqual(access_log.logged, 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+import threading
+import time
+import unittest
+
+from app.admission import (
+    AdmissionController,
+    QUEUE_FULL,
+    QUEUE_TIMEOUT,
+    CLIENT,
+    SOURCE_ADDRESS,
+)
+from app.payment_errors import ServerOverloaded, TooManyConcurrentRequests
+
+
+class TestAdmissionController(unittest.TestCase):
+    def setUp(self):
+        self.admission = AdmissionController(
+            max_in_flight=1,
+            max_queue=1,
+            max_queue_wait=5,
+            max_per_client=2,
+            max_per_source=1,
+        )
+
+    def acquire_in_thread(self, client, source_address):
+        result = {}
+
+        def run():
+            try:
+                result["ticket"] = self.admission.acquire(client, source_address)
+            except Exception as e:
+                result["error"] = e
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        while self.admission.queued == 0 and thread.is_alive():
+            time.sleep(0.001)
+        return thread, result
+
+    def test_queue(self):
+        ticket = self.admission.acquire("a", "1A")
+        thread, result = self.acquire_in_thread("b", "1B")
+        self.assertEqual(self.admission.queued, 1)
+
+        with self.assertRaises(ServerOverloaded) as cm:
+            self.admission.acquire("c", "1C")
+        self.assertEqual(cm.exception.payload["reason"], QUEUE_FULL)
+        self.assertGreaterEqual(cm.exception.retry_after, 1)
+
+        self.admission.release(ticket)
+        thread.join(1)
+        self.assertIn("ticket", result)
+        self.assertEqual(self.admission.in_flight, 1)
+        self.assertEqual(self.admission.queued, 0)
+
+        self.admission.release(result["ticket"])
+        self.assertEqual(self.admission.in_flight, 0)
+        self.assertEqual(self.admission.admitted, 2)
+        self.assertEqual(self.admission.rejected, {QUEUE_FULL: 1})
+
+    def test_queue_timeout(self):
+        self.admission.max_queue_wait = 0.01
+        self.admission.acquire("a", "1A")
+
+        with self.assertRaises(ServerOverloaded) as cm:
+            self.admission.acquire("b", "1B")
+        self.assertEqual(cm.exception.payload["reason"], QUEUE_TIMEOUT)
+
+        # the deadline of the request bounds the wait too
+        self.admission.max_queue_wait = 5
+        started = time.monotonic()
+        with self.assertRaises(ServerOverloaded):
+            self.admission.acquire("b", "1B", deadline=started + 0.01)
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(self.admission.queued, 0)
+
+        # the rejected requests don't count against their client
+        self.admission.max_in_flight = 0
+        for i in range(2):
+            self.admission.acquire("b", f"1B{i}")
+
+    def test_per_key_limits(self):
+        self.admission.max_in_flight = 0
+        tickets = [self.admission.acquire("a", "1A"), self.admission.acquire("a", "1B")]
+
+        with self.assertRaises(TooManyConcurrentRequests) as cm:
+            self.admission.acquire("a", "1C")
+        self.assertEqual(cm.exception.payload["scope"], CLIENT)
+
+        with self.assertRaises(TooManyConcurrentRequests) as cm:
+            self.admission.acquire("b", "1A")
+        self.assertEqual(cm.exception.payload["scope"], SOURCE_ADDRESS)
+
+        self.admission.release(tickets[0])
+        self.admission.acquire("b", "1A")
+        self.assertEqual(self.admission.rejected, {CLIENT: 1, SOURCE_ADDRESS: 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,559 @@
+import unittest
+import glob
+import io
+import json
+import logging
+import os
+import tempfile
+from unittest import mock
+
+from bit.transaction import deserialize
+from bit.wallet import Unspent
+
+from app import config, payment
+from app.access_log import AccessLog
+from app.admission import AdmissionController
+from app.app import app, client_address
+from app.idempotency import IdempotencyStore, IDEMPOTENCY_HEADER, REPLAYED_HEADER
+from app.memo import SelectionMemo
+from app.memory import ADMIN_HEADER
+from app.profiling import RequestProfiler, PROFILE_HEADER
+from app.routing import SOURCE_ADDRESS_HEADER
+from app.stats import RequestStats
+from app.wallet.breaker import CircuitBreaker
+from app.wallet.cache import StaleUnspentCache
+from test.wallet.test_coin_select import TEST_TX_CONTEXT
+
+SOURCE_ADDRESS = TEST_TX_CONTEXT.address
+PAYMENT_REQUEST = {
+    "source_address": SOURCE_ADDRESS,
+    "outputs": {"17VZNX1SN5NtKa8UQFxwQbFeFc3iqRYhem": 20000},
+    "fee_kb": 1024,
+    "strategy": "greedy_max_secure",
+    "min_confirmations": 6,
+}
+
+
+def fake_get_unspent(address, testnet=False):
+    return list(TEST_TX_CONTEXT.inputs)
+
+
+class AppTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = app.test_client()
+        patcher = mock.patch.object(
+            payment.unspent_fetcher, "get_unspent", side_effect=fake_get_unspent
+        )
+        self.get_unspent = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.use_selection_memo(SelectionMemo(max_entries=0))
+
+    def use_selection_memo(self, memo):
+        patcher = mock.patch.object(payment, "selection_memo", memo)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class TestPaymentTransactions(AppTestCase):
+    def test_payment_transaction(self):
+        r = self.client.post("/payment_transactions", json=PAYMENT_REQUEST)
+        self.assertEqual(r.status_code, 200)
+        data = r.get_json()
+        self.assertTrue(data["raw"])
+        self.assertEqual(len(data["inputs"]), 2)
+        self.assertEqual(data["change_address"], SOURCE_ADDRESS)
+        self.get_unspent.assert_called_once_with(SOURCE_ADDRESS, False)
+
+    def test_auto_fee(self):
+        oracle = mock.Mock()
+        oracle.fee_kb.return_value = 4321
+        data = dict(PAYMENT_REQUEST, fee_kb="auto", conf_target=2)
+
+        with mock.patch.dict(payment.fee_oracles, {False: oracle}):
+            r = self.client.post("/payment_transactions", json=data)
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.get_json()["fee_kb"], 4321)
+        oracle.fee_kb.assert_called_once_with(2)
+
+    def test_source_addresses(self):
+        other = "1BoatSLRHtKNngkdXEeobR76b53LETtpyT"
+        data = dict(PAYMENT_REQUEST, change_address=other)
+        data["source_addresses"] = [SOURCE_ADDRESS, other]
+        del data["source_address"]
+
+        r = self.client.post("/payment_transactions", json=data)
+        self.assertEqual(r.status_code, 200)
+        data = r.get_json()
+        self.assertEqual(data["change_address"], other)
+        self.assertEqual(
+            [i["address"] for i in data["inputs"]], [SOURCE_ADDRESS, SOURCE_ADDRESS]
+        )
+        # fetched in one query, but cached per address
+        self.get_unspent.assert_called_once_with(f"{SOURCE_ADDRESS}|{other}", False)
+        cache = payment.unspent_source
+        self.assertIsNone(cache.age(f"{SOURCE_ADDRESS}|{other}"))
+        self.assertIsNotNone(cache.age(other))
+        self.assertEqual(
+            len(cache._get((False, SOURCE_ADDRESS)).utxos), len(TEST_TX_CONTEXT.inputs)
+        )
+
+    def test_invalid_request(self):
+        r = self.client.post("/payment_transactions", json={"outputs": {}})
+        self.assertEqual(r.status_code, 400)
+        self.assertEqual(r.get_json()["name"], "EmptySourceAddress")
+
+    def test_insufficient_funds(self):
+        data = dict(PAYMENT_REQUEST, outputs={SOURCE_ADDRESS: 100000000})
+        r = self.client.post("/payment_transactions", json=data)
+        self.assertEqual(r.status_code, 400)
+        self.assertEqual(r.get_json()["name"], "InsufficientFunds")
+
+    def test_uneconomical_utxos(self):
+        # the oldest UTXO is worth less than the fee of spending it
+        dust = Unspent(100, 100, TEST_TX_CONTEXT.inputs[0].script, "00" * 32, 0)
+        self.get_unspent.side_effect = lambda *args: [dust] + fake_get_unspent(*args)
+        stats = RequestStats()
+        request = payment.parse_payment_tx_request(PAYMENT_REQUEST)
+
+        response = payment.process_payment_tx_request(request, stats=stats)
+        self.assertNotIn(dust, response.inputs)
+        self.assertEqual(len(response.inputs), 2)
+        self.assertEqual(stats.counts["utxos_uneconomical"], 1)
+        self.assertEqual(stats.counts["uneconomical_amount"], 100)
+
+        self.get_unspent.side_effect = lambda *args: [dust]
+        r = self.client.post("/payment_transactions", json=PAYMENT_REQUEST)
+        self.assertEqual(r.status_code, 400)
+        data = r.get_json()
+        self.assertEqual(data["name"], "NoEconomicalTransactionsFound")
+        self.assertEqual(data["details"]["balance"], 100)
+
+
+class TestPaymentQuotes(AppTestCase):
+    def test_quotes(self):
+        data = dict(PAYMENT_REQUEST, strategies=["greedy_max_secure", "best_fit"])
+        with mock.patch("app.offload.create_unsigned") as create_unsigned:
+            r = self.client.post("/payment_quotes", json=data)
+        self.assertEqual(r.status_code, 200)
+        create_unsigned.assert_not_called()
+        self.get_unspent.assert_called_once_with(SOURCE_ADDRESS, False)
+
+        data = r.get_json()
+        self.assertEqual(
+            [quote["strategy"] for quote in data["quotes"]],
+            ["greedy_max_secure", "best_fit"],
+        )
+        self.assertEqual([quote["n_inputs"] for quote in data["quotes"]], [2, 1])
+        self.assertEqual(data["change_address"], SOURCE_ADDRESS)
+
+        # the quote matches the transaction
+        best_fit = data["quotes"][1]
+        r = self.client.post(
+            "/payment_transactions", json=dict(PAYMENT_REQUEST, strategy="best_fit")
+        )
+        tx = r.get_json()
+        in_amount = sum(utxo["amount"] for utxo in tx["inputs"])
+        out_amount = sum(PAYMENT_REQUEST["outputs"].values())
+        self.assertEqual(
+            in_amount - out_amount - best_fit["change_amount"], best_fit["fee"]
+        )
+        # fee_kb of 1024 is 1 SAT per (signed) byte
+        self.assertEqual(best_fit["vsize"], best_fit["fee"])
+
+    def test_invalid_strategies(self):
+        data = dict(PAYMENT_REQUEST, strategies=["greedy_max_secure", "aaa"])
+        r = self.client.post("/payment_quotes", json=data)
+        self.assertEqual(r.status_code, 400)
+        self.assertEqual(r.get_json()["name"], "InvalidStrategy")
+        self.get_unspent.assert_not_called()
+
+
+class TestConsolidations(AppTestCase):
+    def test_consolidation(self):
+        data = dict(PAYMENT_REQUEST, max_inputs=2)
+        del data["outputs"], data["strategy"]
+        r = self.client.post("/consolidations", json=data)
+        self.assertEqual(r.status_code, 200)
+        self.get_unspent.assert_called_once_with(SOURCE_ADDRESS, False)
+
+        data = r.get_json()
+        n_utxos = len(TEST_TX_CONTEXT.inputs)
+        self.assertEqual(data["utxos"], n_utxos)
+        self.assertEqual(data["destination"], SOURCE_ADDRESS)
+        for sweep in data["sweeps"]:
+            self.assertEqual(len(sweep["inputs"]), 2)
+            self.assertTrue(sweep["raw"])
+            [output] = sweep["outputs"]
+            in_amount = sum(utxo["amount"] for utxo in sweep["inputs"])
+            self.assertEqual(in_amount - output["amount"], sweep["fee"])
+        self.assertEqual(data["utxos_after"], n_utxos - len(data["sweeps"]))
+
+        body = self.client.get("/metrics").get_data(as_text=True)
+        self.assertIn('btc_api_consolidated_inputs_total{network="main"}', body)
+        self.assertIn(
+            'btc_api_consolidation_duration_seconds_count{network="main"}', body
+        )
+
+    def test_invalid_max_inputs(self):
+        data = dict(PAYMENT_REQUEST, max_inputs=1)
+        r = self.client.post("/consolidations", json=data)
+        self.assertEqual(r.status_code, 400)
+        self.assertEqual(r.get_json()["name"], "InvalidMaxInputs")
+        self.get_unspent.assert_not_called()
+
+
+class TestRouting(AppTestCase):
+    def test_routing_header(self):
+        headers = {SOURCE_ADDRESS_HEADER: SOURCE_ADDRESS}
+        for url, data in [
+            ("/payment_transactions", PAYMENT_REQUEST),
+            ("/payment_quotes", PAYMENT_REQUEST),
+            ("/consolidations", dict(PAYMENT_REQUEST, outputs=None)),
+        ]:
+            with self.subTest(url=url):
+                r = self.client.post(url, json=data, headers=headers)
+                self.assertEqual(r.status_code, 200)
+                self.assertEqual(r.headers[SOURCE_ADDRESS_HEADER], SOURCE_ADDRESS)
+
+                # without the header (e.g. not routed by NGINX)
+                r = self.client.post(url, json=data)
+                self.assertEqual(r.status_code, 200)
+                self.assertEqual(r.headers[SOURCE_ADDRESS_HEADER], SOURCE_ADDRESS)
+
+    def test_routing_header_mismatch(self):
+        headers = {SOURCE_ADDRESS_HEADER: "1BoatSLRHtKNngkdXEeobR76b53LETtpyT"}
+        r = self.client.post(
+            "/payment_transactions", json=PAYMENT_REQUEST, headers=headers
+        )
+        self.assertEqual(r.status_code, 400)
+        self.assertEqual(r.get_json()["name"], "SourceAddressHeaderMismatch")
+        self.get_unspent.assert_not_called()
+
+
+class TestUnavailableProviders(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        breaker = CircuitBreaker("unspent", failure_threshold=1, reset_timeout=60)
+        cache = StaleUnspentCache(payment.unspent_fetcher, breaker)
+        patcher = mock.patch.object(payment.unspent_fanout, "source", cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fail_upstream(self):
+        self.get_unspent.side_effect = ConnectionError()
+        r = self.client.post("/payment_transactions", json=PAYMENT_REQUEST)
+        self.assertEqual(r.status_code, 500)
+
+    def test_fail_fast(self):
+        self.fail_upstream()
+        self.get_unspent.reset_mock()
+
+        r = self.client.post("/payment_transactions", json=PAYMENT_REQUEST)
+        self.assertEqual(r.status_code, 503)
+        self.assertEqual(r.get_json()["name"], "UnspentSourceUnavailable")
+        self.assertEqual(r.headers["Retry-After"], "60")
+        self.get_unspent.assert_not_called()
+
+    def test_stale(self):
+        r = self.client.post("/payment_transactions", json=PAYMENT_REQUEST)
+        self.assertFalse(r.get_json()["stale"])
+
+        # the failed request opens the breaker, but is served from the cache
+        self.get_unspent.side_effect = ConnectionError()
+        for _ in range(2):
+            r = self.client.post("/payment_transactions", json=PAYMENT_REQUEST)
+            self.assertEqual(r.status_code, 200)
+            data = r.get_json()
+            self.assertTrue(data["stale"])
+            self.assertIn("utxo_age", data)
+        self.assertEqual(payment.unspent_fanout.source.breaker.state, "open")
+        self.assertEqual(self.get_unspent.call_count, 2)
+
+
+class TestIdempotency(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch("app.app.idempotency_store", IdempotencyStore())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, data, key="retry-1"):
+        return self.client.post(
+            "/payment_transactions", json=data, headers={IDEMPOTENCY_HEADER: key}
+        )
+
+    def test_replay(self):
+        data = dict(PAYMENT_REQUEST, strategy="greedy_random")
+        first = self.post(data)
+        self.assertEqual(first.status_code, 200)
+        self.assertNotIn(REPLAYED_HEADER, first.headers)
+
+        retry = self.post(data)
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.headers[REPLAYED_HEADER], "true")
+        self.assertEqual(retry.get_json(), first.get_json())
+        self.get_unspent.assert_called_once()
+
+    def test_replay_routing_header(self):
+        self.post(PAYMENT_REQUEST)
+        retry = self.post(PAYMENT_REQUEST)
+        self.assertEqual(retry.headers[REPLAYED_HEADER], "true")
+        self.assertEqual(retry.headers[SOURCE_ADDRESS_HEADER], SOURCE_ADDRESS)
+
+    def test_other_body(self):
+        self.post(PAYMENT_REQUEST)
+        r = self.post(dict(PAYMENT_REQUEST, fee_kb=2048))
+        self.assertEqual(r.status_code, 422)
+        self.assertEqual(r.get_json()["name"], "IdempotencyKeyMismatch")
+
+    def test_errors_not_stored(self):
+        data = dict(PAYMENT_REQUEST, outputs={SOURCE_ADDRESS: 100000000})
+        self.assertEqual(self.post(data).status_code, 400)
+        self.assertEqual(self.post(data).status_code, 400)
+        self.assertEqual(self.get_unspent.call_count, 2)
+
+    def test_invalid_key(self):
+        r = self.post(PAYMENT_REQUEST, key="x" * 256)
+        self.assertEqual(r.status_code, 400)
+        self.assertEqual(r.get_json()["name"], "InvalidIdempotencyKey")
+
+
+class TestAdmission(AppTestCase):
+    def use_admission(self, **limits):
+        admission = AdmissionController(**limits)
+        patcher = mock.patch("app.app.admission", admission)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return admission
+
+    def test_overloaded(self):
+        admission = self.use_admission(max_in_flight=1, max_queue=0)
+        ticket = admission.acquire("other client", "1Other")
+
+        r = self.client.post("/payment_transactions", json=PAYMENT_REQUEST)
+        self.assertEqual(r.status_code, 503)
+        self.assertEqual(r.get_json()["name"], "ServerOverloaded")
+        self.assertEqual(r.headers["Retry-After"], "1")
+        self.get_unspent.assert_not_called()
+
+        admission.release(ticket)
+        r = self.client.post("/payment_transactions", json=PAYMENT_REQUEST)
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(admission.in_flight, 0)
+
+    def test_client_address(self):
+        real_ip = {"X-Real-IP": "198.51.100.1"}
+        cases = [
+            # proxied by NGINX (a trusted proxy)
+            ("172.18.0.3", real_ip, "198.51.100.1"),
+            ("127.0.0.1", {}, "127.0.0.1"),
+            # anyone else can't pick the address admission limits it by
+            ("203.0.113.7", real_ip, "203.0.113.7"),
+        ]
+
+        for remote_addr, headers, expected in cases:
+            with self.subTest(remote_addr=remote_addr), app.test_request_context(
+                headers=headers, environ_base={"REMOTE_ADDR": remote_addr}
+            ):
+                self.assertEqual(client_address(), expected)
+
+    def test_source_address_limit(self):
+        admission = self.use_admission(max_per_source=1)
+        admission.acquire("other client", SOURCE_ADDRESS)
+
+        r = self.client.post("/payment_transactions", json=PAYMENT_REQUEST)
+        self.assertEqual(r.status_code, 429)
+        self.assertEqual(r.get_json()["details"]["scope"], "source_address")
+        self.assertIn("Retry-After", r.headers)
+
+    def test_released_on_error(self):
+        admission = self.use_admission(max_in_flight=1)
+        data = dict(PAYMENT_REQUEST, outputs={SOURCE_ADDRESS: 10**9})
+
+        r = self.client.post("/payment_transactions", json=data)
+        self.assertEqual(r.status_code, 400)
+        self.assertEqual(admission.in_flight, 0)
+
+
+class TestSelectionMemo(AppTestCase):
+    def test_memo(self):
+        memo = SelectionMemo()
+        self.use_selection_memo(memo)
+
+        first = self.client.post("/payment_transactions", json=PAYMENT_REQUEST)
+        second = self.client.post("/payment_transactions", json=PAYMENT_REQUEST)
+        self.assertEqual(second.get_json(), first.get_json())
+        self.assertEqual((memo.hits, memo.misses), (1, 1))
+
+        # non-deterministic strategies aren't memoized
+        data = dict(PAYMENT_REQUEST, strategy="greedy_random")
+        self.client.post("/payment_transactions", json=data)
+        self.assertEqual((memo.hits, memo.misses), (1, 1))
+
+        # unless they're seeded
+        data["seed"] = 42
+        first = self.client.post("/payment_transactions", json=data)
+        second = self.client.post("/payment_transactions", json=data)
+        self.assertEqual(second.get_json(), first.get_json())
+        self.assertEqual((memo.hits, memo.misses), (2, 2))
+
+        r = self.client.get("/metrics")
+        self.assertIn(
+            'btc_api_selection_runs_total{mode="memo",network="main",strategy="greedy_max_secure"}',
+            r.get_data(as_text=True),
+        )
+
+
+class TestMetrics(AppTestCase):
+    def test_metrics(self):
+        self.client.post("/payment_transactions", json=PAYMENT_REQUEST)
+        self.client.post("/payment_transactions", json={"outputs": {}})
+
+        r = self.client.get("/metrics")
+        self.assertEqual(r.status_code, 200)
+        body = r.get_data(as_text=True)
+        stages = [
+            "validate",
+            "fetch",
+            "filter",
+            "economical",
+            "select",
+            "serialize",
+            "encode",
+        ]
+        for stage in stages:
+            with self.subTest(stage=stage):
+                self.assertIn(
+                    f'btc_api_stage_duration_seconds_count{{network="main",stage="{stage}",strategy="greedy_max_secure"}}',
+                    body,
+                )
+        self.assertIn(
+            'btc_api_inputs_selected_total{network="main",strategy="greedy_max_secure"}',
+            body,
+        )
+        self.assertIn('btc_api_errors_total{name="EmptySourceAddress"}', body)
+
+    def test_multiprocess(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+
+        with mock.patch.object(config, "PROMETHEUS_MULTIPROC_DIR", tmp.name):
+            r = self.client.get("/metrics")
+        self.assertEqual(r.status_code, 200)
+        # gauges of the worker's state are exported next to aggregated metrics
+        body = r.get_data(as_text=True)
+        self.assertIn("btc_api_unspent_breaker_state", body)
+        self.assertIn("btc_api_admission_in_flight", body)
+
+
+class TestProfiling(AppTestCase):
+    def test_profile_token_header(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        profiler = RequestProfiler(False, 0.0, tmp.name, "s3cr3t")
+
+        with mock.patch("app.app.request_profiler", profiler):
+            self.client.post("/payment_transactions", json=PAYMENT_REQUEST)
+            self.assertEqual(os.listdir(tmp.name), [])
+
+            r = self.client.post(
+                "/payment_transactions",
+                json=PAYMENT_REQUEST,
+                headers={PROFILE_HEADER: "s3cr3t"},
+            )
+            self.assertEqual(r.status_code, 200)
+
+        [path] = glob.glob(os.path.join(tmp.name, "*greedy_max_secure.json"))
+        with open(path) as f:
+            metadata = json.load(f)
+        self.assertEqual(metadata["source_address"], SOURCE_ADDRESS)
+        self.assertEqual(metadata["counts"]["utxos_fetched"], 2)
+        self.assertIn("select", metadata["timings"])
+
+
+class TestAccessLog(AppTestCase):
+    def test_access_log(self):
+        stream = io.StringIO()
+        access_log = AccessLog(True, 0.0, 100, logging.StreamHandler(stream))
+        self.addCleanup(access_log.stop)
+
+        with mock.patch("app.app.access_log", access_log):
+            self.client.post("/payment_transactions", json=PAYMENT_REQUEST)
+            self.client.post("/payment_transactions", json={"outputs": {}})
+            self.client.post("/payment_quotes", json={"outputs": {}})
+            self.client.post("/consolidations", json={})
+        access_log.stop()
+
+        # successful requests aren't sampled, failed ones are always logged
+        records = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual(
+            [(r["endpoint"], r["error"]) for r in records],
+            [
+                ("payment_transactions", "EmptySourceAddress"),
+                ("payment_quotes", "EmptySourceAddress"),
+                ("consolidations", "EmptySourceAddress"),
+            ],
+        )
+        self.assertIn("validate", records[0]["timings"])
+
+    def test_access_log_fee(self):
+        stream = io.StringIO()
+        access_log = AccessLog(True, 1.0, 100, logging.StreamHandler(stream))
+        self.addCleanup(access_log.stop)
+
+        with mock.patch("app.app.access_log", access_log):
+            r = self.client.post("/payment_transactions", json=PAYMENT_REQUEST)
+        access_log.stop()
+
+        (record,) = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertIsNone(record["error"])
+        data = r.get_json()
+        tx = deserialize(data["raw"])
+        in_amount = sum(utxo["amount"] for utxo in data["inputs"])
+        out_amount = sum(int.from_bytes(out.amount, "little") for out in tx.TxOut)
+        self.assertEqual(record["fee"], in_amount - out_amount)
+
+
+class TestAdminMemory(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch("app.config.ADMIN_TOKEN", "s3cr3t")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_admin_token(self):
+        for headers in [{}, {ADMIN_HEADER: "guess"}]:
+            with self.subTest(headers=headers):
+                r = self.client.get("/admin/memory", headers=headers)
+                self.assertEqual(r.status_code, 404)
+
+        with mock.patch("app.config.ADMIN_TOKEN", ""):
+            r = self.client.get("/admin/memory", headers={ADMIN_HEADER: ""})
+            self.assertEqual(r.status_code, 404)
+
+    def test_memory(self):
+        headers = {ADMIN_HEADER: "s3cr3t"}
+        r = self.client.get("/admin/memory", headers=headers)
+        self.assertEqual(r.status_code, 200)
+        data = r.get_json()
+        self.assertGreater(data["peak_rss"], 0)
+        self.assertEqual(
+            set(data["structures"]),
+            {"selection_memo", "idempotency_store", "unspent_cache"},
+        )
+        self.assertFalse(data["tracemalloc"]["tracing"])
+
+        r = self.client.post("/admin/memory/snapshot", headers=headers)
+        self.addCleanup(self.client.delete, "/admin/memory/snapshot", headers=headers)
+        self.assertEqual(r.get_json(), {"tracing": True})
+        r = self.client.get("/admin/memory?top=3", headers=headers)
+        report = r.get_json()["tracemalloc"]
+        self.assertLessEqual(len(report["top"]), 3)
+        self.assertIn("diff", report)
+
+        r = self.client.delete("/admin/memory/snapshot", headers=headers)
+        self.assertEqual(r.get_json(), {"tracing": False})
+
+
+if __name__ == "__main__":
+    unittest.main()
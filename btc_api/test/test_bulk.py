@@ -0,0 +1,164 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from bit.transaction import address_to_scriptpubkey
+
+from app.bulk import run, main, SnapshotUnspents
+from app.wallet.sources import UnspentFanout
+from test.wallet.test_coin_select import TEST_TX_CONTEXT
+
+SOURCE_ADDRESS = TEST_TX_CONTEXT.address
+OTHER_SOURCE_ADDRESS = "1KFHE7w8BhaENAswwryaoccDb6qcT6DbYY"
+PAYOUT_ADDRESS = "17VZNX1SN5NtKa8UQFxwQbFeFc3iqRYhem"
+
+
+def snapshot_utxos(address, n, amount=100000):
+    script = address_to_scriptpubkey(address).hex()
+    return [
+        {
+            "amount": amount,
+            "confirmations": 10,
+            "script": script,
+            "txid": f"{i:064x}",
+            "txindex": 0,
+        }
+        for i in range(n)
+    ]
+
+
+class TestBulk(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        self.snapshot = self.write(
+            "utxos.json",
+            json.dumps(
+                {
+                    SOURCE_ADDRESS: snapshot_utxos(SOURCE_ADDRESS, 10),
+                    OTHER_SOURCE_ADDRESS: [],
+                }
+            ),
+        )
+        self.fanout = UnspentFanout(SnapshotUnspents.load(self.snapshot))
+
+    def write(self, name, content):
+        path = os.path.join(self.dir, name)
+        with open(path, "w") as f:
+            f.write(content)
+        return path
+
+    def run_bulk(self, path, workers=0):
+        output = io.StringIO()
+        counts = run(path, output, self.fanout, workers=workers, progress=io.StringIO())
+        results = [json.loads(line) for line in output.getvalue().splitlines()]
+        return counts, {result["id"]: result for result in results}
+
+    def payouts(self, n, amount=50000, **fields):
+        return "\n".join(
+            json.dumps(
+                dict(
+                    id=f"payout-{i}",
+                    source_address=SOURCE_ADDRESS,
+                    outputs={PAYOUT_ADDRESS: amount},
+                    fee_kb=1024,
+                    strategy="greedy_max_secure",
+                    **fields,
+                )
+            )
+            for i in range(n)
+        )
+
+    def test_no_double_spend(self):
+        path = self.write("payouts.jsonl", self.payouts(12))
+        counts, results = self.run_bulk(path)
+
+        self.assertEqual(counts, {"requests": 12, "built": 10, "failed": 2})
+        spent = [
+            (utxo["txid"], utxo["vout"])
+            for result in results.values()
+            if "error" not in result
+            for utxo in result["inputs"]
+        ]
+        self.assertEqual(len(spent), 10)
+        self.assertEqual(len(set(spent)), 10)
+        # payouts are built in input order, the last ones find no coins left
+        for i in [10, 11]:
+            self.assertEqual(
+                results[f"payout-{i}"]["error"]["name"], "InsufficientFunds"
+            )
+
+    def test_pool(self):
+        path = self.write("payouts.jsonl", self.payouts(3))
+        counts, results = self.run_bulk(path, workers=1)
+
+        self.assertEqual(counts, {"requests": 3, "built": 3, "failed": 0})
+        result = results["payout-0"]
+        self.assertTrue(result["raw"])
+        self.assertEqual(result["inputs"][0]["address"], SOURCE_ADDRESS)
+        self.assertEqual(result["change_address"], SOURCE_ADDRESS)
+
+    def test_errors(self):
+        lines = [
+            "not json",
+            json.dumps({"source_address": "invalid", "outputs": {}}),
+            json.dumps(
+                {
+                    "source_address": OTHER_SOURCE_ADDRESS,
+                    "outputs": {PAYOUT_ADDRESS: 20000},
+                }
+            ),
+            self.payouts(1, min_confirmations=11),
+            # spending any of the UTXOs costs more than it's worth
+            json.dumps(
+                {
+                    "source_address": SOURCE_ADDRESS,
+                    "outputs": {PAYOUT_ADDRESS: 20000},
+                    "fee_kb": 1000000,
+                }
+            ),
+        ]
+        path = self.write("payouts.jsonl", "\n".join(lines))
+        counts, results = self.run_bulk(path)
+
+        self.assertEqual(counts["failed"], 5)
+        self.assertEqual(
+            [result["error"]["name"] for result in results.values()],
+            [
+                "InvalidUsage",
+                "InvalidSourceAddress",
+                "EmptyUnspentTransactionOutputSet",
+                "NoConfirmedTransactionsFound",
+                "NoEconomicalTransactionsFound",
+            ],
+        )
+
+    def test_csv(self):
+        path = self.write(
+            "payouts.csv",
+            "id,source_address,address,amount,fee_kb,min_confirmations\n"
+            f"a,{SOURCE_ADDRESS},{PAYOUT_ADDRESS},20000,2048,6\n"
+            f"a,{SOURCE_ADDRESS},{OTHER_SOURCE_ADDRESS},30000,2048,6\n"
+            f",{SOURCE_ADDRESS},{PAYOUT_ADDRESS},40000,,\n",
+        )
+        counts, results = self.run_bulk(path)
+
+        self.assertEqual(counts, {"requests": 2, "built": 2, "failed": 0})
+        self.assertEqual(results["a"]["fee_kb"], 2048)
+        self.assertEqual(results["4"]["fee_kb"], 1000)
+
+    def test_main(self):
+        path = self.write("payouts.jsonl", self.payouts(11))
+        output = os.path.join(self.dir, "transactions.jsonl")
+
+        status = main([path, "--output", output, "--snapshot", self.snapshot])
+        self.assertEqual(status, 1)
+        with open(output) as f:
+            self.assertEqual(len(f.readlines()), 11)
+
+
+if __name__ == "__main__":
+    unittest.main()
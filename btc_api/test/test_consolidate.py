@@ -0,0 +1,59 @@
+import argparse
+import io
+import unittest
+from unittest import mock
+
+from app.consolidate import consolidation_body, fee_kb_arg, is_xpub, main
+from test.wallet.test_coin_select import TEST_TX_CONTEXT
+from test.wallet.test_xpub import XPUB_0H
+
+ARGS = argparse.Namespace(
+    fee_kb=1024,
+    min_confirmations=6,
+    max_inputs=500,
+    n_outputs=1,
+    testnet=False,
+    max_amount=None,
+    change_address=None,
+)
+
+
+class TestConsolidationBody(unittest.TestCase):
+    def test_source(self):
+        cases = [
+            (TEST_TX_CONTEXT.address, "source_address"),
+            ("bc1qar0srrr7xfkvy5l643lydnw9re59gtzzwf5mdq", "source_address"),
+            (XPUB_0H, "xpub"),
+            # an invalid xpub is rejected as an address
+            (XPUB_0H[:-1], "source_address"),
+        ]
+
+        for source, field in cases:
+            with self.subTest(source=source):
+                body = consolidation_body(source, ARGS)
+                self.assertEqual(body[field], source)
+                self.assertEqual(is_xpub(source), field == "xpub")
+
+
+class TestFeeKbArg(unittest.TestCase):
+    def test_valid(self):
+        self.assertEqual(fee_kb_arg("auto"), "auto")
+        self.assertEqual(fee_kb_arg("0"), 0)
+        self.assertEqual(fee_kb_arg("2048"), 2048)
+
+    def test_invalid(self):
+        for value in ["fast", "-1", "1.5", ""]:
+            with self.subTest(value=value):
+                with self.assertRaises(argparse.ArgumentTypeError):
+                    fee_kb_arg(value)
+
+    def test_usage_error(self):
+        with mock.patch("sys.stderr", io.StringIO()) as stderr:
+            with self.assertRaises(SystemExit) as cm:
+                main([TEST_TX_CONTEXT.address, "--fee-kb", "fast"])
+        self.assertEqual(cm.exception.code, 2)
+        self.assertIn("--fee-kb", stderr.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+import json
+import os
+import tempfile
+from unittest import mock
+
+from app.fees import FeeOracle, EsploraFeeSource, FileFeeSource, fee_source
+from app.payment_errors import FeeEstimateUnavailable
+
+RATES = {1: 20000, 6: 5000, 144: 500}
+
+
+class TestFeeSources(unittest.TestCase):
+    def test_file(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, "fees.json")
+        with open(path, "w") as f:
+            json.dump({"1": 20000, "6": 5000}, f)
+
+        source = fee_source(f"file://{path}")
+        self.assertIsInstance(source, FileFeeSource)
+        self.assertEqual(source.get_fee_rates(), {1: 20000, 6: 5000})
+
+    def test_esplora(self):
+        source = fee_source("http://localhost:3000/api/")
+        self.assertIsInstance(source, EsploraFeeSource)
+        response = mock.Mock()
+        response.json.return_value = {"1": 20.5, "6": 5.0, "144": 1.0001}
+
+        with mock.patch.object(source.session, "get", return_value=response) as get:
+            self.assertEqual(source.get_fee_rates(), {1: 20992, 6: 5120, 144: 1025})
+        get.assert_called_once_with(
+            "http://localhost:3000/api/fee-estimates", timeout=source.timeout
+        )
+
+
+class TestFeeOracle(unittest.TestCase):
+    def setUp(self):
+        self.source = mock.Mock()
+        self.source.name = "test"
+        self.source.get_fee_rates.return_value = RATES
+        self.oracle = FeeOracle(self.source, refresh_interval=60, min_fee=1000)
+        self.addCleanup(self.oracle.stop)
+
+    def test_conf_target(self):
+        self.assertTrue(self.oracle.refresh())
+        cases = [(1, 20000), (2, 20000), (6, 5000), (100, 5000), (1008, 1000)]
+        for conf_target, fee_kb in cases:
+            with self.subTest(conf_target=conf_target):
+                self.assertEqual(self.oracle.fee_kb(conf_target), fee_kb)
+
+    def test_cold_start(self):
+        # the first estimate is fetched by the background thread
+        self.assertEqual(self.oracle.fee_kb(6), 5000)
+        self.source.get_fee_rates.assert_called_once_with()
+
+    def test_keeps_estimates_on_error(self):
+        self.oracle.refresh()
+        self.source.get_fee_rates.side_effect = ConnectionError()
+
+        self.assertFalse(self.oracle.refresh())
+        self.assertEqual(self.oracle.errors, 1)
+        self.assertEqual(self.oracle.fee_kb(1), 20000)
+
+    def test_unavailable(self):
+        self.source.get_fee_rates.side_effect = ConnectionError()
+        self.oracle.cold_start_timeout = 0.1
+
+        with self.assertRaises(FeeEstimateUnavailable) as cm:
+            self.oracle.fee_kb(6)
+        self.assertEqual(cm.exception.status_code, 503)
+
+    def test_max_age(self):
+        self.oracle.refresh()
+        self.oracle.max_age = 0
+
+        with self.assertRaises(FeeEstimateUnavailable):
+            self.oracle.fee_kb(6)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+
+from app.idempotency import IdempotencyStore, body_fingerprint
+from app.payment_errors import IdempotencyKeyMismatch, IdempotencyKeyInUse
+
+BODY = body_fingerprint(b'{"a": 1}')
+OTHER_BODY = body_fingerprint(b'{"a": 2}')
+
+
+class TestIdempotencyStore(unittest.TestCase):
+    def setUp(self):
+        self.store = IdempotencyStore(max_entries=10, ttl=60)
+
+    def test_replay(self):
+        self.assertIsNone(self.store.begin("key", BODY))
+        self.store.complete("key", "response")
+
+        self.assertEqual(self.store.begin("key", BODY), "response")
+        self.assertEqual(self.store.replays, 1)
+
+    def test_mismatch(self):
+        self.store.begin("key", BODY)
+        self.store.complete("key", "response")
+
+        with self.assertRaises(IdempotencyKeyMismatch):
+            self.store.begin("key", OTHER_BODY)
+
+    def test_in_use(self):
+        self.store.begin("key", BODY)
+        with self.assertRaises(IdempotencyKeyInUse):
+            self.store.begin("key", BODY)
+
+    def test_abort(self):
+        self.store.begin("key", BODY)
+        self.store.abort("key")
+        self.assertIsNone(self.store.begin("key", OTHER_BODY))
+
+
+if __name__ == "__main__":
+    unittest.main()
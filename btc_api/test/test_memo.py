@@ -0,0 +1,68 @@
+import unittest
+
+from app.memo import SelectionMemo, utxo_fingerprint
+from app.ttl_cache import TTLCache
+from app.wallet.transaction import Output
+from test.wallet.test_breaker import FakeClock
+from test.wallet.test_coin_select import TEST_TX_CONTEXT
+
+
+class TestTTLCache(unittest.TestCase):
+    def test_expiry(self):
+        clock = FakeClock()
+        cache = TTLCache(10, ttl=5, clock=clock)
+        cache.put("a", 1)
+        clock.now = 4.9
+        self.assertEqual(cache.get("a"), 1)
+        clock.now = 5
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+
+    def test_lru(self):
+        cache = TTLCache(2, ttl=60)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.pop("c"), 3)
+
+    def test_disabled(self):
+        cache = TTLCache(0, ttl=60)
+        cache.put("a", 1)
+        self.assertIsNone(cache.get("a"))
+
+
+class TestSelectionMemo(unittest.TestCase):
+    def test_fingerprint(self):
+        utxos = list(TEST_TX_CONTEXT.inputs)
+        self.assertEqual(utxo_fingerprint(utxos), utxo_fingerprint(list(utxos)))
+        self.assertNotEqual(utxo_fingerprint(utxos), utxo_fingerprint(utxos[:1]))
+        self.assertNotEqual(utxo_fingerprint(utxos), utxo_fingerprint(utxos[::-1]))
+
+    def test_key(self):
+        ctx = TEST_TX_CONTEXT
+        key = SelectionMemo.key("greedy_max_secure", ctx)
+        self.assertEqual(key, SelectionMemo.key("greedy_max_secure", ctx.copy()))
+
+        other_outputs = [Output(out.address, out.amount + 1) for out in ctx.outputs]
+        for other in [
+            SelectionMemo.key("greedy_min_coins", ctx),
+            SelectionMemo.key("greedy_max_secure", ctx.copy(outputs=other_outputs)),
+            SelectionMemo.key("greedy_max_secure", ctx.copy(inputs=ctx.inputs[:1])),
+            SelectionMemo.key("greedy_max_secure", ctx._replace(seed=1)),
+        ]:
+            self.assertNotEqual(key, other)
+
+    def test_get_put(self):
+        memo = SelectionMemo()
+        key = SelectionMemo.key("greedy_max_secure", TEST_TX_CONTEXT)
+        self.assertIsNone(memo.get(key))
+        memo.put(key, "coins", "raw")
+        self.assertEqual(memo.get(key), ("coins", "raw"))
+        self.assertEqual((memo.hits, memo.misses), (1, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import unittest
+import sys
+import tracemalloc
+from unittest import mock
+
+from bit.wallet import Unspent
+
+from app.memory import (
+    MemoryTracer,
+    deep_sizeof,
+    process_memory,
+    structure_usage,
+    unspent_cache_usage,
+)
+from app.ttl_cache import TTLCache
+from app.wallet.cache import StaleUnspentCache
+from test.wallet.test_coin_select import TEST_TX_CONTEXT
+
+SCRIPT = TEST_TX_CONTEXT.inputs[0].script
+
+
+def unspents(n):
+    return [Unspent(1000, 6, SCRIPT, "%064x" % i, i) for i in range(n)]
+
+
+class TestDeepSizeof(unittest.TestCase):
+    def test_deep_sizeof(self):
+        text = "x" * 1000
+        self.assertEqual(
+            deep_sizeof([text, text]), sys.getsizeof([text, text]) + sys.getsizeof(text)
+        )
+
+        # slots are followed, the script shared by the UTXOs is counted once
+        one, two = deep_sizeof(unspents(1)), deep_sizeof(unspents(2))
+        self.assertGreater(one, sys.getsizeof(SCRIPT))
+        self.assertLess(two - one, one - sys.getsizeof([]))
+
+        seen = set()
+        deep_sizeof(text, seen)
+        self.assertEqual(deep_sizeof([text], seen), sys.getsizeof([text]))
+
+
+class TestStructureUsage(unittest.TestCase):
+    def test_structure_usage(self):
+        cache = TTLCache(10, 60)
+        for i in range(5):
+            cache.put(i, "x" * 1000 + str(i))
+
+        usage = structure_usage(cache, 2)
+        self.assertEqual((usage.entries, usage.sampled), (5, 2))
+        self.assertGreater(usage.bytes_per_entry, 1000)
+        self.assertEqual(usage.bytes, usage.bytes_per_entry * 5)
+        self.assertEqual([key for key, _ in cache.sample(2)], [4, 3])
+
+    def test_unspent_cache_usage(self):
+        sets = {"a": unspents(10), "b": unspents(30)}
+        source = mock.Mock()
+        source.get_unspent.side_effect = lambda address, testnet: sets[address]
+        cache = StaleUnspentCache(source)
+        for address in sets:
+            cache.get_unspent(address)
+
+        usage = unspent_cache_usage(cache)
+        self.assertEqual((usage["entries"], usage["sampled"]), (2, 2))
+        self.assertEqual((usage["utxos"], usage["largest_set"]), (40, 30))
+        self.assertGreater(usage["bytes_per_utxo"], 0)
+        self.assertEqual(unspent_cache_usage(StaleUnspentCache(source))["bytes"], 0)
+
+
+class TestMemoryTracer(unittest.TestCase):
+    def setUp(self):
+        if tracemalloc.is_tracing():
+            self.skipTest("tracemalloc is already tracing")
+
+    def test_report(self):
+        tracer = MemoryTracer()
+        self.assertEqual(tracer.report(), {"tracing": False})
+
+        tracer.take_baseline()
+        self.addCleanup(tracer.stop)
+        allocated = [bytearray(100000) for _ in range(10)]
+        report = tracer.report(5)
+        self.assertTrue(report["tracing"])
+        self.assertGreaterEqual(report["current"], 1000000)
+        self.assertLessEqual(len(report["top"]), 5)
+        # the biggest change since the baseline comes first
+        grown = report["diff"][0]
+        self.assertIn("test_memory.py", grown["location"])
+        self.assertGreaterEqual(grown["size_diff"], 1000000)
+        del allocated
+
+        tracer.stop()
+        self.assertFalse(tracer.tracing)
+
+
+class TestProcessMemory(unittest.TestCase):
+    def test_process_memory(self):
+        usage = process_memory()
+        self.assertGreater(usage["peak_rss"], 0)
+        if usage["rss"] is not None:
+            self.assertLessEqual(usage["rss"], usage["peak_rss"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import os
+import unittest
+import time
+from concurrent.futures import Future
+from unittest import mock
+
+from app import offload
+from app.offload import SelectionOffloader, select_and_serialize
+from app.payment import coin_select_strategies
+from app.strategies import RANDOM_SEED
+from app.wallet.change import ChangeProfile
+from app.wallet.exceptions import InsufficientFunds
+from test.wallet.test_coin_select import TEST_TX_CONTEXT
+
+
+class TestSelectionOffloader(unittest.TestCase):
+    def test_inline_under_threshold(self):
+        offloader = SelectionOffloader(coin_select_strategies, utxo_threshold=10)
+        strategy = coin_select_strategies["greedy_max_secure"]
+        expected_coins, expected_raw = select_and_serialize(strategy, TEST_TX_CONTEXT)
+
+        coins, raw = offloader.run("greedy_max_secure", TEST_TX_CONTEXT)
+        self.assertEqual(raw, expected_raw)
+        self.assertEqual(coins, expected_coins)
+        self.assertIsNone(offloader._pool)
+
+    def test_pool(self):
+        offloader = SelectionOffloader(
+            coin_select_strategies, max_workers=1, utxo_threshold=0
+        )
+        self.addCleanup(offloader.shutdown)
+
+        split = TEST_TX_CONTEXT._replace(change_profile=ChangeProfile(((5500, 1),)))
+        for name in ["greedy_max_secure", "greedy_max_coins", "greedy_min_coins"]:
+            for ctx in [TEST_TX_CONTEXT, split]:
+                with self.subTest(strategy=name, split=ctx is split):
+                    strategy = coin_select_strategies[name]
+                    expected_coins, expected_raw = select_and_serialize(strategy, ctx)
+
+                    coins, raw = offloader.run(name, ctx, time.monotonic() + 60)
+                    self.assertEqual(raw, expected_raw)
+                    self.assertEqual(coins, expected_coins)
+                    for utxo in coins.inputs:
+                        self.assertTrue(any(utxo is u for u in ctx.inputs))
+
+        # change of the split context is split in the pool too
+        coins, _ = offloader.run("greedy_max_secure", split, time.monotonic() + 60)
+        self.assertEqual(len(coins.outputs), len(split.outputs) + 2)
+
+    def test_init_worker(self):
+        with mock.patch.object(offload, "reseed") as reseed, mock.patch.object(
+            offload, "_exit_with_parent"
+        ) as exit_with_parent:
+            offload._init_worker(1)
+        # pool workers don't share the seed their import set
+        reseed.assert_called_once_with(RANDOM_SEED + os.getpid())
+        exit_with_parent.assert_called_once_with(1)
+
+    def test_pool_error(self):
+        offloader = SelectionOffloader(
+            coin_select_strategies, max_workers=1, utxo_threshold=0
+        )
+        self.addCleanup(offloader.shutdown)
+        ctx = TEST_TX_CONTEXT.copy(inputs=[TEST_TX_CONTEXT.inputs[1]])
+
+        with self.assertRaises(InsufficientFunds) as cm:
+            offloader.run("greedy_max_secure", ctx)
+        self.assertEqual(cm.exception.address, ctx.address)
+
+    def test_deadline_fallback(self):
+        offloader = SelectionOffloader(
+            coin_select_strategies,
+            max_workers=1,
+            utxo_threshold=0,
+            fallback_strategy="greedy_min_coins",
+        )
+        strategy = coin_select_strategies["greedy_min_coins"]
+        expected_coins, expected_raw = select_and_serialize(strategy, TEST_TX_CONTEXT)
+
+        coins, raw = offloader.run(
+            "greedy_max_coins", TEST_TX_CONTEXT, time.monotonic()
+        )
+        self.assertEqual(raw, expected_raw)
+        self.assertEqual(coins, expected_coins)
+        self.assertIsNone(offloader._pool)
+
+    def test_timeout_keeps_slot(self):
+        offloader = SelectionOffloader(
+            coin_select_strategies, max_workers=1, max_pending=1, utxo_threshold=0
+        )
+        future = Future()
+        # the task is running, so it can't be cancelled
+        future.set_running_or_notify_cancel()
+        pool = mock.Mock()
+        pool.submit.return_value = future
+
+        with mock.patch.object(offloader, "_get_pool", return_value=pool):
+            offloader.run("greedy_max_secure", TEST_TX_CONTEXT, time.monotonic() + 0.01)
+            self.assertFalse(future.cancelled())
+            # the slot is still taken by the running task
+            offloader.run("greedy_max_secure", TEST_TX_CONTEXT, time.monotonic() + 60)
+            self.assertEqual(pool.submit.call_count, 1)
+
+            future.set_result(None)
+            self.assertTrue(offloader._slots.acquire(blocking=False))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -4,10 +4,14 @@ from app.errors import InvalidUsage
 from app.payment import (
     coin_select_strategies,
     PaymentTxRequest,
+    PaymentQuoteRequest,
     RANDOM_SEED,
     MIN_RELAY_FEE,
     DEFAULT_STRATEGY,
     MIN_CONFIRMATIONS,
+    AUTO_FEE,
+    DEFAULT_CONF_TARGET,
+    split_change_profile,
 )
 from app.payment_errors import (
     EmptySourceAddress,
@@ -20,10 +24,19 @@ from app.payment_errors import (
     NotSupportedOutputAddress,
     NetworkMismatchOutputAddress,
     InvalidStrategy,
+    InvalidSeed,
     InvalidFee,
+    InvalidConfTarget,
     InvalidMinConfirmations,
+    ConflictingSourceAddresses,
+    TooManySourceAddresses,
+    InvalidXpub,
+    InvalidGapLimit,
+    InvalidChangeAddress,
+    InvalidChangePolicy,
 )
 from app.wallet.coin_select import DUST_THRESHOLD
+from test.wallet.test_xpub import XPUB_0H
 
 MAINNET_P2PKH = "1Po1oWkD2LmodfkBYiAktwh76vkF93LKnh"
 MAINNET_P2SH = "3EktnHQD7RiAE6uzMj2ZifT9YgRrkSgzQX"
@@ -113,6 +126,74 @@ class TestPaymentTxRequest(unittest.TestCase):
         with self.assertRaises(InvalidOutputAmount):
             PaymentTxRequest(MAINNET_P2PKH, {MAINNET_P2PKH: val - 10}, 0)
 
+    # test source_addresses and xpub validation
+
+    def test_source_addresses(self):
+        addresses = [MAINNET_P2PKH, "1BoatSLRHtKNngkdXEeobR76b53LETtpyT"]
+        r = PaymentTxRequest("", {MAINNET_P2PKH: val}, source_addresses=addresses)
+        self.assertEqual(r.source_address, MAINNET_P2PKH)
+        self.assertEqual(r.source_addresses, addresses)
+
+    def test_single_source_address(self):
+        r = PaymentTxRequest(MAINNET_P2PKH, {MAINNET_P2PKH: val})
+        self.assertEqual(r.source_addresses, [MAINNET_P2PKH])
+
+    def test_source_addresses_invalid(self):
+        cases = [
+            ([], EmptySourceAddress),
+            (MAINNET_P2PKH, EmptySourceAddress),
+            ([MAINNET_P2PKH, TESTNET_P2PKH], NetworkMismatchSourceAddress),
+            ([MAINNET_P2PKH, MAINNET_P2SH], NotSupportedSourceAddress),
+            ([MAINNET_P2PKH] * 1001, TooManySourceAddresses),
+        ]
+        for n, (addresses, error) in enumerate(cases):
+            with self.subTest(n=n):
+                with self.assertRaises(error):
+                    PaymentTxRequest(
+                        "", {MAINNET_P2PKH: val}, source_addresses=addresses
+                    )
+
+    def test_conflicting_sources(self):
+        with self.assertRaises(ConflictingSourceAddresses):
+            PaymentTxRequest(
+                MAINNET_P2PKH, {MAINNET_P2PKH: val}, source_addresses=[MAINNET_P2PKH]
+            )
+        with self.assertRaises(ConflictingSourceAddresses):
+            PaymentTxRequest(MAINNET_P2PKH, {MAINNET_P2PKH: val}, xpub=XPUB_0H)
+
+    def test_xpub(self):
+        r = PaymentTxRequest("", {MAINNET_P2PKH: val}, xpub=XPUB_0H, gap_limit="5")
+        self.assertEqual(r.source_address, XPUB_0H)
+        self.assertEqual(r.xpub_key.to_string(), XPUB_0H)
+        self.assertEqual(r.gap_limit, 5)
+
+    def test_xpub_invalid(self):
+        with self.assertRaises(InvalidXpub):
+            PaymentTxRequest("", {MAINNET_P2PKH: val}, xpub=XPUB_0H[:-1])
+        with self.assertRaises(NetworkMismatchSourceAddress):
+            PaymentTxRequest("", {TESTNET_P2PKH: val}, testnet=True, xpub=XPUB_0H)
+        for gap_limit in [0, 101, "a"]:
+            with self.subTest(gap_limit=gap_limit):
+                with self.assertRaises(InvalidGapLimit):
+                    PaymentTxRequest(
+                        "", {MAINNET_P2PKH: val}, xpub=XPUB_0H, gap_limit=gap_limit
+                    )
+
+    def test_change_address(self):
+        r = PaymentTxRequest(
+            MAINNET_P2PKH, {MAINNET_P2PKH: val}, change_address=MAINNET_P2SH
+        )
+        self.assertEqual(r.change_address, MAINNET_P2SH)
+
+        for change_address in ["", "abc", TESTNET_P2PKH, MAINNET_BECH32]:
+            with self.subTest(change_address=change_address):
+                with self.assertRaises(InvalidChangeAddress):
+                    PaymentTxRequest(
+                        MAINNET_P2PKH,
+                        {MAINNET_P2PKH: val},
+                        change_address=change_address,
+                    )
+
     # test fee_kb validation
 
     def test_fee_kb_invalid(self):
@@ -131,6 +212,30 @@ class TestPaymentTxRequest(unittest.TestCase):
         with self.assertRaises(InvalidFee):
             PaymentTxRequest(MAINNET_P2PKH, {MAINNET_P2PKH: val}, 50)
 
+    # test conf_target validation
+
+    def test_fee_kb_auto(self):
+        r = PaymentTxRequest(MAINNET_P2PKH, {MAINNET_P2PKH: val}, AUTO_FEE)
+        self.assertEqual(r.fee_kb, AUTO_FEE)
+        self.assertEqual(r.conf_target, DEFAULT_CONF_TARGET)
+
+    def test_conf_target_implies_auto(self):
+        r = PaymentTxRequest(MAINNET_P2PKH, {MAINNET_P2PKH: val}, conf_target="2")
+        self.assertEqual(r.fee_kb, AUTO_FEE)
+        self.assertEqual(r.conf_target, 2)
+
+    def test_conf_target_invalid(self):
+        for conf_target in [0, "a", 2000]:
+            with self.subTest(conf_target=conf_target):
+                with self.assertRaises(InvalidConfTarget):
+                    PaymentTxRequest(
+                        MAINNET_P2PKH, {MAINNET_P2PKH: val}, conf_target=conf_target
+                    )
+
+    def test_conf_target_with_fee_kb(self):
+        with self.assertRaises(InvalidConfTarget):
+            PaymentTxRequest(MAINNET_P2PKH, {MAINNET_P2PKH: val}, 1000, conf_target=2)
+
     # test strategy validation
 
     def test_strategy_invalid(self):
@@ -143,6 +248,52 @@ class TestPaymentTxRequest(unittest.TestCase):
                 MAINNET_P2PKH, {MAINNET_P2PKH: val}, "1000", strategy="greedy"
             )
 
+    def test_seed(self):
+        r = PaymentTxRequest(MAINNET_P2PKH, {MAINNET_P2PKH: val}, 1000, seed="42")
+        self.assertEqual(r.seed, 42)
+        for seed in [-1, 2**64, "a", True]:
+            with self.subTest(seed=seed), self.assertRaises(InvalidSeed):
+                PaymentTxRequest(MAINNET_P2PKH, {MAINNET_P2PKH: val}, 1000, seed=seed)
+
+    def test_change_policy(self):
+        r = PaymentTxRequest(MAINNET_P2PKH, {MAINNET_P2PKH: val}, 1000)
+        self.assertEqual(r.change_policy, "single")
+        self.assertIsNone(r.change_profile)
+
+        r = PaymentTxRequest(
+            MAINNET_P2PKH, {MAINNET_P2PKH: val}, 1000, change_policy="split"
+        )
+        self.assertEqual(r.change_profile, split_change_profile)
+
+        for change_policy in ["", "many", 2]:
+            with self.subTest(change_policy=change_policy):
+                with self.assertRaises(InvalidChangePolicy):
+                    PaymentTxRequest(
+                        MAINNET_P2PKH,
+                        {MAINNET_P2PKH: val},
+                        1000,
+                        change_policy=change_policy,
+                    )
+
+    def test_quote_strategies(self):
+        r = PaymentQuoteRequest(
+            MAINNET_P2PKH,
+            {MAINNET_P2PKH: val},
+            strategies=["best_fit", "greedy_min_coins", "best_fit"],
+        )
+        self.assertEqual(r.strategies, ["best_fit", "greedy_min_coins"])
+        self.assertEqual(r.strategy, "best_fit")
+
+        r = PaymentQuoteRequest(MAINNET_P2PKH, {MAINNET_P2PKH: val})
+        self.assertEqual(r.strategies, [DEFAULT_STRATEGY])
+
+        for strategies in [[], "best_fit", ["best_fit", "greedy"], [["best_fit"]]]:
+            with self.subTest(strategies=strategies):
+                with self.assertRaises(InvalidStrategy):
+                    PaymentQuoteRequest(
+                        MAINNET_P2PKH, {MAINNET_P2PKH: val}, strategies=strategies
+                    )
+
     # test min_confirmation validation
 
     def test_min_confirmation_invalid(self):
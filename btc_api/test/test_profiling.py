@@ -0,0 +1,84 @@
+import unittest
+import glob
+import json
+import os
+import pstats
+import tempfile
+
+from app.profiling import RequestProfiler
+from app.stats import RequestStats
+
+
+def work(n):
+    return sum(range(n))
+
+
+class TestRequestProfiler(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.output_dir = tmp.name
+
+    def test_should_profile(self):
+        cases = [
+            (RequestProfiler(False, 1.0, self.output_dir, ""), None, False),
+            (RequestProfiler(True, 0.0, self.output_dir, ""), None, False),
+            (RequestProfiler(True, 1.0, self.output_dir, ""), None, True),
+            (RequestProfiler(False, 1.0, self.output_dir, "s3cr3t"), "s3cr3t", True),
+            (RequestProfiler(False, 1.0, self.output_dir, "s3cr3t"), "guess", False),
+            (RequestProfiler(False, 1.0, self.output_dir, ""), "", False),
+        ]
+
+        for n, (profiler, header, expected) in enumerate(cases, 1):
+            with self.subTest(n=n):
+                self.assertEqual(profiler.should_profile(header), expected)
+
+    def test_run(self):
+        profiler = RequestProfiler(True, 1.0, self.output_dir, "")
+        stats = RequestStats()
+        stats.count("utxos_fetched", 42)
+
+        result = profiler.run({"strategy": "greedy_random"}, stats, work, 10)
+        self.assertEqual(result, 45)
+
+        [path] = glob.glob(os.path.join(self.output_dir, "*greedy_random.pstats"))
+        stats = pstats.Stats(path)
+        self.assertTrue(any(f[2] == "work" for f in stats.stats))
+
+        with open(path.replace(".pstats", ".json")) as f:
+            metadata = json.load(f)
+        self.assertEqual(metadata["strategy"], "greedy_random")
+        self.assertEqual(metadata["counts"], {"utxos_fetched": 42})
+        self.assertIsNone(metadata["error"])
+
+    def test_run_error(self):
+        profiler = RequestProfiler(True, 1.0, self.output_dir, "")
+
+        with self.assertRaises(TypeError):
+            profiler.run({}, RequestStats(), work, "a")
+
+        [path] = glob.glob(os.path.join(self.output_dir, "*.json"))
+        with open(path) as f:
+            self.assertEqual(json.load(f)["error"], "TypeError")
+
+    def test_run_dump_error(self):
+        # the output directory can't be created under a file
+        output_dir = os.path.join(self.output_dir, "file")
+        open(output_dir, "w").close()
+        profiler = RequestProfiler(True, 1.0, os.path.join(output_dir, "x"), "")
+
+        with self.assertLogs("app.profiling", "ERROR"):
+            result = profiler.run({}, RequestStats(), work, 10)
+        self.assertEqual(result, 45)
+        self.assertEqual(profiler.dump_errors, 1)
+
+    def test_dump_names(self):
+        profiler = RequestProfiler(True, 1.0, self.output_dir, "")
+        for _ in range(3):
+            profiler.run({"strategy": "best_fit"}, RequestStats(), work, 10)
+        paths = glob.glob(os.path.join(self.output_dir, "*best_fit.pstats"))
+        self.assertEqual(len(paths), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
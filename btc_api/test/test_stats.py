@@ -0,0 +1,37 @@
+import unittest
+
+from app.stats import RequestStats
+
+
+class TestRequestStats(unittest.TestCase):
+    def test_stage(self):
+        stats = RequestStats()
+        with stats.stage("fetch"):
+            pass
+        with stats.stage("fetch"):
+            pass
+        self.assertEqual(list(stats.timings), ["fetch"])
+        self.assertGreaterEqual(stats.timings["fetch"], 0)
+
+    def test_stage_error(self):
+        stats = RequestStats()
+        with self.assertRaises(ValueError):
+            with stats.stage("select"):
+                raise ValueError()
+        self.assertIn("select", stats.timings)
+
+    def test_count(self):
+        stats = RequestStats()
+        stats.count("utxos_fetched", 3)
+        stats.count("utxos_fetched", 2)
+        self.assertEqual(stats.counts, {"utxos_fetched": 5})
+
+    def test_merge_timings(self):
+        stats = RequestStats()
+        stats.timings["select"] = 1.0
+        stats.merge_timings({"select": 0.5, "serialize": 0.25})
+        self.assertEqual(stats.timings, {"select": 1.5, "serialize": 0.25})
+
+
+if __name__ == "__main__":
+    unittest.main()
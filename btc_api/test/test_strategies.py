@@ -0,0 +1,80 @@
+import random
+import threading
+import unittest
+
+from bit.wallet import Unspent
+
+from app import payment
+from app.strategies import coin_select_strategies, reseed, strategy_random, RANDOM_SEED
+from test.wallet.test_coin_select import TEST_TX_CONTEXT
+
+
+class TestStrategies(unittest.TestCase):
+    def tearDown(self):
+        reseed()
+
+    def select_random(self, context=TEST_TX_CONTEXT):
+        inputs = coin_select_strategies["greedy_random"].select(context).inputs
+        return [(utxo.txid, utxo.txindex) for utxo in inputs]
+
+    def in_thread(self, target):
+        result = []
+        thread = threading.Thread(target=lambda: result.append(target()))
+        thread.start()
+        thread.join()
+        return result[0]
+
+    def test_reseed(self):
+        reseed(RANDOM_SEED)
+        expected = [self.select_random() for _ in range(5)]
+
+        reseed(RANDOM_SEED)
+        self.assertEqual([self.select_random() for _ in range(5)], expected)
+
+    def test_independent_of_global_random(self):
+        reseed(RANDOM_SEED)
+        random.seed(1)
+        expected = [self.select_random() for _ in range(5)]
+
+        reseed(RANDOM_SEED)
+        random.seed(2)
+        self.assertEqual([self.select_random() for _ in range(5)], expected)
+
+    def test_per_thread(self):
+        reseed(RANDOM_SEED)
+        generator = strategy_random.get()
+        self.assertIsNot(self.in_thread(strategy_random.get), generator)
+        self.assertIs(strategy_random.get(), generator)
+
+        # draws of other threads don't change the selections of this one
+        expected = [self.select_random() for _ in range(5)]
+        reseed(RANDOM_SEED)
+        selections = []
+        for _ in range(5):
+            self.in_thread(self.select_random)
+            selections.append(self.select_random())
+        self.assertEqual(selections, expected)
+
+    def test_seed(self):
+        utxo = TEST_TX_CONTEXT.inputs[0]
+        inputs = [
+            Unspent(10000, 6, utxo.script, utxo.txid, txindex) for txindex in range(20)
+        ]
+        context = TEST_TX_CONTEXT._replace(inputs=inputs, seed=7)
+        expected = self.select_random(context)
+        other = self.select_random(context._replace(seed=8))
+        self.assertNotEqual(other, expected)
+        for seed in range(5):
+            reseed(seed)
+            self.assertEqual(self.select_random(context), expected)
+            self.assertEqual(
+                self.in_thread(lambda: self.select_random(context)), expected
+            )
+
+    def test_payment_exports(self):
+        self.assertIs(payment.coin_select_strategies, coin_select_strategies)
+        self.assertEqual(payment.RANDOM_SEED, RANDOM_SEED)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+from unittest import mock
+
+from app.wallet.breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+from app.wallet.exceptions import UnspentSourceUnavailable
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def fail():
+    raise ConnectionError()
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(
+            "test", failure_threshold=2, reset_timeout=10, clock=self.clock
+        )
+
+    def trip(self):
+        for _ in range(2):
+            with self.assertRaises(ConnectionError):
+                self.breaker.call(fail)
+
+    def test_opens_after_consecutive_failures(self):
+        with self.assertRaises(ConnectionError):
+            self.breaker.call(fail)
+        self.assertEqual(self.breaker.call(lambda: 1), 1)
+        with self.assertRaises(ConnectionError):
+            self.breaker.call(fail)
+        self.assertEqual(self.breaker.state, CLOSED)
+
+        with self.assertRaises(ConnectionError):
+            self.breaker.call(fail)
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertEqual(self.breaker.trips, 1)
+
+    def test_fails_fast_when_open(self):
+        self.trip()
+        self.clock.now = 4
+
+        func = mock.Mock()
+        with self.assertRaises(UnspentSourceUnavailable) as cm:
+            self.breaker.call(func)
+        func.assert_not_called()
+        self.assertEqual(cm.exception.retry_after, 6)
+        self.assertEqual(self.breaker.rejected, 1)
+
+    def test_half_open_success(self):
+        self.trip()
+        self.clock.now = 10
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+
+        # a single trial call is let through
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record_success()
+
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertEqual(self.breaker.retry_after(), 0)
+
+    def test_half_open_failure(self):
+        self.trip()
+        self.clock.now = 10
+
+        with self.assertRaises(ConnectionError):
+            self.breaker.call(fail)
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertEqual(self.breaker.retry_after(), 10)
+        self.assertEqual(self.breaker.trips, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
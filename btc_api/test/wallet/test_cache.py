@@ -0,0 +1,147 @@
+import unittest
+from unittest import mock
+
+from app.wallet.breaker import CircuitBreaker, OPEN
+from app.wallet.cache import StaleUnspentCache
+from app.wallet.exceptions import UnspentSourceUnavailable
+from test.wallet.test_breaker import FakeClock
+from test.wallet.test_coin_select import TEST_TX_CONTEXT
+
+ADDRESS = TEST_TX_CONTEXT.address
+UTXOS = list(TEST_TX_CONTEXT.inputs)
+
+
+class TestStaleUnspentCache(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.source = mock.Mock()
+        self.source.get_unspent.return_value = UTXOS
+        self.breaker = CircuitBreaker(
+            "test", failure_threshold=1, reset_timeout=10, clock=self.clock
+        )
+        self.cache = StaleUnspentCache(
+            self.source, self.breaker, max_stale=60, clock=self.clock
+        )
+
+    def test_fresh(self):
+        cached = self.cache.lookup(ADDRESS)
+        self.assertEqual(cached.utxos, UTXOS)
+        self.assertFalse(cached.stale)
+
+        # without a fresh TTL every lookup asks the source
+        self.cache.lookup(ADDRESS)
+        self.assertEqual(self.source.get_unspent.call_count, 2)
+
+    def test_fresh_ttl(self):
+        self.cache.fresh_ttl = 5
+        self.cache.lookup(ADDRESS)
+        self.clock.now = 4
+        cached = self.cache.lookup(ADDRESS)
+
+        self.assertEqual(cached.utxos, UTXOS)
+        self.assertEqual(cached.age, 4)
+        self.assertFalse(cached.stale)
+        self.assertEqual(self.cache.hits, 1)
+        self.source.get_unspent.assert_called_once_with(ADDRESS, False)
+
+    def test_stale_on_error(self):
+        self.cache.lookup(ADDRESS)
+        self.clock.now = 30
+        self.source.get_unspent.side_effect = ConnectionError()
+
+        cached = self.cache.lookup(ADDRESS)
+        self.assertTrue(cached.stale)
+        self.assertEqual(cached.age, 30)
+        self.assertEqual(cached.utxos, UTXOS)
+        self.assertEqual(self.breaker.state, OPEN)
+
+    def test_stale_while_open(self):
+        self.cache.lookup(ADDRESS)
+        self.breaker.record_failure()
+
+        with mock.patch.object(self.cache, "refresh") as refresh:
+            cached = self.cache.lookup(ADDRESS)
+        self.assertTrue(cached.stale)
+        refresh.assert_called_once_with(ADDRESS, False)
+        self.assertEqual(self.source.get_unspent.call_count, 1)
+        self.assertEqual(self.cache.stale_served, 1)
+
+    def test_stale_bound(self):
+        self.cache.max_stale = 5
+        self.cache.lookup(ADDRESS)
+        self.breaker.record_failure()
+        self.clock.now = 6
+
+        with self.assertRaises(UnspentSourceUnavailable):
+            self.cache.lookup(ADDRESS)
+
+    def test_networks(self):
+        self.cache.lookup(ADDRESS)
+        self.breaker.record_failure()
+
+        with self.assertRaises(UnspentSourceUnavailable):
+            self.cache.lookup(ADDRESS, testnet=True)
+
+    def test_refresh(self):
+        self.cache.lookup(ADDRESS)
+        self.clock.now = 20
+        fresh = UTXOS[:1]
+        self.source.get_unspent.return_value = fresh
+
+        self.cache.refresh(ADDRESS).result()
+        self.assertEqual(self.cache.refreshes, 1)
+
+        self.breaker.record_failure()
+        cached = self.cache.lookup(ADDRESS)
+        self.assertEqual(cached.utxos, fresh)
+        self.assertEqual(cached.age, 0)
+
+    def test_refresh_while_open(self):
+        self.cache.lookup(ADDRESS)
+        self.breaker.record_failure()
+
+        self.cache.refresh(ADDRESS).result()
+        self.assertEqual(self.cache.refresh_errors, 1)
+        self.assertEqual(self.source.get_unspent.call_count, 1)
+
+    def test_lookup_many(self):
+        other = "1BoatSLRHtKNngkdXEeobR76b53LETtpyT"
+        self.cache.fresh_ttl = 5
+        results = self.cache.lookup_many([ADDRESS, other])
+        self.assertEqual(results[ADDRESS].utxos, UTXOS)
+        self.assertEqual(results[other].utxos, [])
+        self.source.get_unspent.assert_called_once_with(f"{ADDRESS}|{other}", False)
+        self.assertEqual(len(self.cache), 2)
+
+        # overlapping sets of addresses share the cached sets
+        third = "17VZNX1SN5NtKa8UQFxwQbFeFc3iqRYhem"
+        self.assertEqual(set(self.cache.cached([other, third])), {other})
+        results = self.cache.lookup_many([third, other, ADDRESS])
+        self.assertEqual(results[ADDRESS].utxos, UTXOS)
+        self.source.get_unspent.assert_called_with(third, False)
+        self.assertEqual(self.cache.hits, 3)
+
+    def test_lookup_many_stale(self):
+        other = "1BoatSLRHtKNngkdXEeobR76b53LETtpyT"
+        self.cache.lookup(ADDRESS)
+        self.source.get_unspent.side_effect = ConnectionError()
+
+        # a set without a stale copy fails the whole lookup
+        with self.assertRaises(ConnectionError):
+            self.cache.lookup_many([ADDRESS, other])
+        self.assertEqual(self.cache.stale_served, 0)
+
+    def test_max_entries(self):
+        self.cache.max_entries = 1
+        self.cache.lookup(ADDRESS)
+        self.cache.lookup(ADDRESS, testnet=True)
+        self.assertEqual(len(self.cache), 1)
+
+    def test_disabled(self):
+        cache = StaleUnspentCache(self.source, self.breaker, max_stale=0)
+        cache.lookup(ADDRESS)
+        self.assertEqual(len(cache), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,27 @@
+import unittest
+
+from app.wallet.change import ChangeProfile, parse_change_profile, pool_deficits
+
+
+class TestChangeProfile(unittest.TestCase):
+    def test_parse_change_profile(self):
+        profile = parse_change_profile("100000:8, 10000000:4,1000000:2,", 3)
+        self.assertEqual(
+            profile, ChangeProfile(((10000000, 4), (1000000, 2), (100000, 8)), 3)
+        )
+        self.assertEqual(parse_change_profile("").targets, ())
+
+        for value, max_outputs in [("a:1", 5), ("1000", 5), ("0:1", 5), ("1000:1", 0)]:
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                parse_change_profile(value, max_outputs)
+
+    def test_pool_deficits(self):
+        profile = ChangeProfile(((1000000, 2), (100000, 3)))
+        # a UTXO counts towards the largest denomination it can pay
+        amounts = [5000000, 150000, 999999, 10000]
+        self.assertEqual(pool_deficits(profile, amounts), [(1000000, 1), (100000, 1)])
+        self.assertEqual(pool_deficits(profile, amounts + [2000000, 100000]), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,9 +3,16 @@ import random
 from functools import partial
 
 from bit.wallet import Unspent
+from app.wallet.change import ChangeProfile
 from app.wallet.exceptions import InsufficientFunds
-from app.wallet.transaction import TxContext, Output
+from app.wallet.transaction import (
+    TxContext,
+    Output,
+    address_to_output_size,
+    estimate_tx_fee_kb,
+)
 from app.wallet.coin_select import (
+    BestFit,
     Greedy,
     GreedyMaxSecure,
     GreedyMaxCoins,
@@ -68,6 +75,7 @@ class TestUnspentCoinSelector(unittest.TestCase):
             GreedyMaxCoins(),
             GreedyMinCoins(),
             GreedyRandom(random),
+            BestFit(),
         ]
 
         for n, strategy in enumerate(cases, 1):
@@ -84,6 +92,7 @@ class TestUnspentCoinSelector(unittest.TestCase):
             (GreedyMinCoins(), 1),
             (GreedyRandom(random), 1),
             (GreedyRandom(random), 2),
+            (BestFit(), 1),
         ]
 
         for n, data in enumerate(cases, 1):
@@ -103,6 +112,7 @@ class TestUnspentCoinSelector(unittest.TestCase):
             GreedyMaxCoins(),
             GreedyMinCoins(),
             GreedyRandom(random),
+            BestFit(),
         ]
 
         for n, strategy in enumerate(cases, 1):
@@ -179,6 +189,104 @@ class TestUnspentCoinSelector(unittest.TestCase):
             change_amount=DUST_THRESHOLD + 1337,
         )
 
+    def test_best_fit(self):
+        inputs = [
+            Unspent(amount, 6, TEST_TX_CONTEXT.inputs[0].script, "%064x" % i, 0)
+            for i, amount in enumerate([90000, 12000, 40000, 31000, 20000])
+        ]
+        address = TEST_TX_CONTEXT.outputs[0].address
+        cases = [
+            (30000, [31000]),
+            (35000, [40000]),
+            (100000, [90000, 12000]),
+            (120000, [90000, 31000]),
+        ]
+
+        for n, (out_amount, amounts) in enumerate(cases, 1):
+            with self.subTest(n=n):
+                ctx = TEST_TX_CONTEXT.copy(
+                    inputs=inputs, outputs=[Output(address, out_amount)]
+                )
+                coins = BestFit().select(ctx)
+                self.assertEqual([utxo.amount for utxo in coins.inputs], amounts)
+
+        with self.assertRaises(InsufficientFunds):
+            BestFit().select(
+                TEST_TX_CONTEXT.copy(inputs=inputs, outputs=[Output(address, 200000)])
+            )
+
+    def test_min_coins_single_input(self):
+        # the largest coin covering the outputs is selected without sorting
+        ctx = TEST_TX_CONTEXT.copy(inputs=TEST_TX_CONTEXT.inputs[::-1])
+        coins = GreedyMinCoins().select(ctx)
+        expected = Greedy().select(ctx.copy(inputs=ctx.inputs[1:]))
+        self.assertEqual(coins, expected)
+
+    def test_outputs_not_copied(self):
+        address = TEST_TX_CONTEXT.outputs[0].address
+        ctx = TEST_TX_CONTEXT.copy(outputs=[Output(address, TEST_TX_NO_CHANGE_AMOUNT)])
+        coins = GreedyMaxSecure().select(ctx)
+        self.assertIs(coins.outputs, ctx.outputs)
+
+        # the change output is added to a new list
+        outputs = list(TEST_TX_CONTEXT.outputs)
+        coins = GreedyMaxSecure().select(TEST_TX_CONTEXT)
+        self.assertEqual(TEST_TX_CONTEXT.outputs, outputs)
+        self.assertEqual(coins.outputs[:-1], outputs)
+        address, amount = coins.outputs[-1]
+        self.assertEqual((address, amount), (ctx.change_address, coins.change_amount))
+
+    def test_split_change(self):
+        [utxo] = TEST_TX_CONTEXT.inputs[:1]
+        big = Unspent(10000000, 6, utxo.script, utxo.txid, 1)
+        pool = [Unspent(1000000, 6, utxo.script, utxo.txid, 2)]
+        ctx = TEST_TX_CONTEXT.copy(inputs=[big] + pool)._replace(
+            change_profile=ChangeProfile(((2000000, 2), (1000000, 3)), 4)
+        )
+
+        coins = GreedyMinCoins().select(ctx)
+        self.assertEqual(coins.inputs, [big])
+        change = coins.outputs[len(ctx.outputs) :]
+        self.assertTrue(all(out.address == ctx.change_address for out in change))
+        # two 2M outputs, two 1M ones to top up the pool (the max), the rest
+        amounts = [out.amount for out in change]
+        self.assertEqual(amounts[:3], [2000000, 2000000, 1000000])
+        self.assertEqual(coins.change_amount, sum(amounts))
+        out_size = sum(address_to_output_size(out.address) for out in coins.outputs)
+        self.assertEqual(len(coins.outputs), 6)
+        self.assertEqual(
+            coins.fee_amount,
+            estimate_tx_fee_kb(big.vsize, 1, out_size, 6, ctx.fee_kb),
+        )
+        self.assertEqual(
+            big.amount, coins.out_amount + coins.fee_amount + coins.change_amount
+        )
+
+        # the next payout is paid by a single split output
+        spent = coins.inputs
+        next_ctx = ctx.copy(
+            inputs=[u for u in ctx.inputs if u not in spent]
+            + [
+                Unspent(amount, 0, utxo.script, "%064x" % 1, i)
+                for i, amount in enumerate(amounts)
+            ],
+            outputs=[Output(ctx.outputs[0].address, 1500000)],
+        )
+        self.assertEqual(len(BestFit().select(next_ctx).inputs), 1)
+
+        # no split while the pool is healthy, nor if the rest would be dust
+        healthy = ctx.copy(
+            inputs=[big]
+            + [Unspent(1000000, 6, utxo.script, utxo.txid, i) for i in range(2, 5)]
+            + [Unspent(big.amount, 6, utxo.script, utxo.txid, i) for i in (5, 6)]
+        )
+        self.assertEqual(len(GreedyMinCoins().select(healthy).outputs), 3)
+        small = ctx.copy(inputs=[Unspent(2040000, 6, utxo.script, utxo.txid, 1)])
+        amounts = [out.amount for out in GreedyMinCoins().select(small).outputs[2:]]
+        self.assertEqual(amounts[0], 2000000)
+        self.assertGreaterEqual(amounts[-1], DUST_THRESHOLD)
+        self.assertEqual(len(amounts), 2)
+
 
 if __name__ == "__main__":
     unittest.main()
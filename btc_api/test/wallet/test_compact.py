@@ -0,0 +1,51 @@
+import unittest
+import pickle
+
+from bit.wallet import Unspent
+
+from app.wallet.compact import CompactUnspents
+from test.wallet.test_coin_select import TEST_TX_CONTEXT
+
+
+class TestCompactUnspents(unittest.TestCase):
+    def test_round_trip(self):
+        utxos = CompactUnspents.from_unspents(TEST_TX_CONTEXT.inputs)
+        self.assertEqual(len(utxos), len(TEST_TX_CONTEXT.inputs))
+        self.assertEqual(utxos.to_unspents(), TEST_TX_CONTEXT.inputs)
+        self.assertEqual(
+            [u.confirmations for u in utxos.to_unspents()],
+            [u.confirmations for u in TEST_TX_CONTEXT.inputs],
+        )
+
+    def test_scripts_are_shared(self):
+        utxos = CompactUnspents.from_unspents(TEST_TX_CONTEXT.inputs)
+        self.assertIs(utxos.scripts[0], utxos.scripts[1])
+
+    def test_pickle(self):
+        utxos = CompactUnspents.from_unspents(TEST_TX_CONTEXT.inputs)
+        restored = pickle.loads(pickle.dumps(utxos))
+        self.assertEqual(restored.to_unspents(), TEST_TX_CONTEXT.inputs)
+
+    def test_take(self):
+        utxos = CompactUnspents.from_unspents(TEST_TX_CONTEXT.inputs)
+        taken = utxos.take([1])
+        self.assertEqual(taken.to_unspents(), [TEST_TX_CONTEXT.inputs[1]])
+        self.assertEqual(utxos.to_unspents([1]), [TEST_TX_CONTEXT.inputs[1]])
+
+    def test_effective_values(self):
+        inputs = TEST_TX_CONTEXT.inputs
+        segwit = Unspent(100, 6, inputs[0].script, inputs[0].txid, 1, vsize=68)
+        utxos = CompactUnspents.from_unspents(inputs + [segwit])
+        self.assertEqual(utxos.to_unspents()[2].vsize, 68)
+
+        fee_kb = 2048
+        self.assertEqual(
+            list(utxos.effective_values(fee_kb)),
+            [utxo.amount - 2 * utxo.vsize for utxo in inputs] + [100 - 136],
+        )
+        self.assertEqual(utxos.economical(fee_kb), [0, 1])
+        self.assertEqual(utxos.economical(1024), [0, 1, 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+
+from bit.wallet import Unspent
+from app.wallet.coin_select import DUST_THRESHOLD
+from app.wallet.consolidate import plan_consolidation
+from app.wallet.transaction import input_fee
+from test.wallet.test_coin_select import TEST_TX_CONTEXT
+
+ADDRESS = TEST_TX_CONTEXT.address
+SCRIPT = TEST_TX_CONTEXT.inputs[0].script
+
+
+def unspents(amounts):
+    return [
+        Unspent(amount, 6, SCRIPT, "%064x" % i, i) for i, amount in enumerate(amounts)
+    ]
+
+
+class TestPlanConsolidation(unittest.TestCase):
+    def test_plan(self):
+        utxos = unspents([100, 50000, 20000, 30000, 10000, 1000000])
+        plan = plan_consolidation(utxos, ADDRESS, 1024, max_amount=100000)
+
+        self.assertEqual((plan.utxos, plan.eligible, plan.uneconomical), (6, 5, 1))
+        [sweep] = plan.sweeps
+        self.assertEqual(
+            [utxo.amount for utxo in sweep.inputs], [10000, 20000, 30000, 50000]
+        )
+        [output] = sweep.outputs
+        self.assertEqual(output.address, ADDRESS)
+        self.assertEqual(output.amount + sweep.fee, 110000)
+        # 1 SAT per byte
+        self.assertEqual(sweep.fee, sweep.vsize)
+        self.assertEqual(plan.utxos_after, 3)
+
+    def test_uneconomical(self):
+        fee_kb = 10240
+        fee = input_fee(unspents([0])[0].vsize, fee_kb)
+        plan = plan_consolidation(unspents([fee, fee + 1]), ADDRESS, fee_kb)
+        self.assertEqual(plan.uneconomical, 1)
+        # a single input sweep doesn't consolidate anything
+        self.assertEqual(plan.sweeps, [])
+
+    def test_split(self):
+        utxos = unspents([10000] * 25)
+        plan = plan_consolidation(utxos, ADDRESS, 1024, max_inputs=10)
+        self.assertEqual([len(sweep.inputs) for sweep in plan.sweeps], [10, 10, 5])
+        self.assertEqual(plan.swept, 25)
+
+        plan = plan_consolidation(utxos, ADDRESS, 1024, max_tx_size=1500)
+        for sweep in plan.sweeps:
+            self.assertLessEqual(sweep.vsize, 1500)
+        self.assertEqual(plan.swept, 25)
+
+    def test_outputs(self):
+        plan = plan_consolidation(unspents([10000] * 10), ADDRESS, 1024, n_outputs=3)
+        [sweep] = plan.sweeps
+        amounts = [out.amount for out in sweep.outputs]
+        self.assertEqual(len(amounts), 3)
+        self.assertLessEqual(max(amounts) - min(amounts), 2)
+        self.assertEqual(sum(amounts) + sweep.fee, 100000)
+
+        # outputs are never dust
+        plan = plan_consolidation(unspents([6000] * 3), ADDRESS, 1024, n_outputs=2)
+        [sweep] = plan.sweeps
+        self.assertEqual(len(sweep.outputs), 2)
+        self.assertTrue(all(out.amount >= DUST_THRESHOLD for out in sweep.outputs))
+
+        plan = plan_consolidation(unspents([3000] * 3), ADDRESS, 1024, n_outputs=2)
+        self.assertEqual([len(sweep.outputs) for sweep in plan.sweeps], [1])
+
+
+if __name__ == "__main__":
+    unittest.main()
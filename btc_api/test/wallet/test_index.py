@@ -0,0 +1,46 @@
+import unittest
+
+from bit.wallet import Unspent
+from app.wallet.index import AmountIndex
+
+SCRIPT = "76a914fa0692278afe508514b5ffee8fe5e97732ce066988ac"
+
+
+def unspents(amounts):
+    return [
+        Unspent(amount, 6, SCRIPT, "%064x" % i, 0) for i, amount in enumerate(amounts)
+    ]
+
+
+class TestAmountIndex(unittest.TestCase):
+    def test_queries(self):
+        index = AmountIndex(unspents([500, 100, 300, 300, 900]))
+        self.assertEqual(index.amounts, [100, 300, 300, 500, 900])
+
+        self.assertEqual(index.covering(300), 1)
+        self.assertEqual(index.covering(301), 3)
+        self.assertEqual(index.covering(1), 0)
+        self.assertIsNone(index.covering(901))
+
+        self.assertEqual(index.largest_below(300), 0)
+        self.assertEqual(index.largest_below(301), 2)
+        self.assertEqual(index.largest_below(10000), 4)
+        self.assertIsNone(index.largest_below(100))
+
+    def test_hi(self):
+        index = AmountIndex(unspents([500, 100, 300, 900]))
+
+        self.assertIsNone(index.covering(600, hi=3))
+        self.assertEqual(index.covering(400, hi=3), 2)
+        self.assertEqual(index.largest_below(10000, hi=3), 2)
+        self.assertIsNone(index.largest_below(10000, hi=0))
+
+    def test_ties_keep_input_order(self):
+        utxos = unspents([300, 300, 300])
+        index = AmountIndex(utxos)
+        self.assertEqual(index.utxos, utxos)
+        self.assertEqual(index.max_vsize, utxos[0].vsize)
+
+
+if __name__ == "__main__":
+    unittest.main()
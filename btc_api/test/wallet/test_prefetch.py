@@ -0,0 +1,130 @@
+import unittest
+from unittest import mock
+
+from app.wallet.breaker import CircuitBreaker
+from app.wallet.cache import StaleUnspentCache
+from app.wallet.prefetch import RefreshAheadPrefetcher, SpaceSaving
+from test.wallet.test_breaker import FakeClock
+from test.wallet.test_coin_select import TEST_TX_CONTEXT
+
+ADDRESS = TEST_TX_CONTEXT.address
+OTHER_ADDRESS = TEST_TX_CONTEXT.outputs[0].address
+UTXOS = list(TEST_TX_CONTEXT.inputs)
+
+
+class TestSpaceSaving(unittest.TestCase):
+    def test_top(self):
+        counter = SpaceSaving(3)
+        stream = ["a"] * 50 + ["b"] * 30 + [f"x{i}" for i in range(100)] + ["a"] * 5
+        for key in stream:
+            counter.offer(key)
+
+        self.assertEqual(len(counter), 3)
+        [(first, count)] = counter.top(1)
+        self.assertEqual(first, "a")
+        self.assertGreaterEqual(count, 55)
+
+    def test_decay(self):
+        counter = SpaceSaving(3)
+        for key in ["a", "a", "a", "a", "b"]:
+            counter.offer(key)
+
+        counter.decay(0.5)
+        self.assertEqual(counter.top(3), [("a", 2.0)])
+
+
+class TestRefreshAheadPrefetcher(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.source = mock.Mock()
+        self.source.get_unspent.return_value = UTXOS
+        self.cache = StaleUnspentCache(
+            self.source,
+            CircuitBreaker("test", failure_threshold=1, clock=self.clock),
+            fresh_ttl=30,
+            clock=self.clock,
+        )
+        self.prefetcher = RefreshAheadPrefetcher(
+            self.cache,
+            top_k=1,
+            sample_rate=1,
+            refresh_ahead=5,
+            budget=1,
+            clock=self.clock,
+        )
+        self.prefetcher.start = mock.Mock()  # prefetch is run by the tests
+
+    def prefetch(self):
+        futures = self.prefetcher.prefetch()
+        for future in futures:
+            future.result()
+        return len(futures)
+
+    def test_refresh_ahead(self):
+        for _ in range(3):
+            self.prefetcher.lookup(ADDRESS)
+        self.prefetcher.lookup(OTHER_ADDRESS)
+        self.assertEqual(self.source.get_unspent.call_count, 1 + 1)
+
+        # fresh for another 10s: nothing to do yet
+        self.clock.now = 20
+        self.assertEqual(self.prefetch(), 0)
+
+        # expires within refresh_ahead: only the hot address is refreshed
+        self.clock.now = 26
+        self.assertEqual(self.prefetch(), 1)
+        self.source.get_unspent.assert_called_with(ADDRESS, False)
+        self.assertEqual(self.prefetcher.prefetches, 1)
+
+        # ... and is still fresh when the TTL of the first fetch is over
+        self.clock.now = 31
+        cached = self.prefetcher.lookup(ADDRESS)
+        self.assertEqual(cached.age, 5)
+        self.assertEqual(self.source.get_unspent.call_count, 3)
+
+    def test_budget(self):
+        self.prefetcher.top_k = 2
+        for _ in range(3):
+            self.prefetcher.lookup(ADDRESS)
+            self.prefetcher.lookup(OTHER_ADDRESS)
+        self.clock.now = 26
+
+        # budget of 1 request per second (1 token per interval)
+        self.assertEqual(self.prefetch(), 1)
+        self.assertEqual(self.prefetcher.over_budget, 1)
+
+        self.clock.now = 27
+        self.assertEqual(self.prefetch(), 1)
+        self.assertEqual(self.source.get_unspent.call_count, 4)
+        self.source.get_unspent.assert_called_with(OTHER_ADDRESS, False)
+
+    def test_moderate_rate(self):
+        # looked up every 10s, i.e. less than once per (1s) prefetch interval
+        for second in range(300):
+            self.clock.now = second
+            if second % 10 == 0:
+                self.prefetcher.lookup(ADDRESS)
+            self.prefetch()
+            self.assertEqual(self.prefetcher._counter.top(1)[0][0], (False, ADDRESS))
+
+        # kept refreshed ahead of expiry, so lookups after the first are hits
+        self.assertGreater(self.prefetcher.prefetches, 0)
+        self.assertEqual(self.cache.hits, 29)
+
+    def test_breaker_open(self):
+        self.prefetcher.lookup(ADDRESS)
+        self.cache.breaker.record_failure()
+        self.clock.now = 26
+
+        self.assertEqual(self.prefetch(), 0)
+
+    def test_disabled(self):
+        self.cache.fresh_ttl = 0
+        self.prefetcher.lookup(ADDRESS)
+
+        self.assertEqual(len(self.prefetcher), 0)
+        self.assertEqual(self.prefetch(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
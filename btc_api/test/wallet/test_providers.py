@@ -0,0 +1,179 @@
+import unittest
+import time
+from unittest import mock
+
+from app.wallet.providers import LatencyStats, UnspentProvider, HedgedUnspentFetcher
+from test.wallet.test_coin_select import TEST_TX_CONTEXT
+
+ADDRESS = TEST_TX_CONTEXT.address
+UTXOS = TEST_TX_CONTEXT.inputs
+
+
+class FakeProvider(UnspentProvider):
+    def __init__(self, url_base, delay=0.0, error=None, utxos=UTXOS):
+        super().__init__(url_base)
+        self.delay = delay
+        self.error = error
+        self.utxos = utxos
+
+    def _fetch(self, address, testnet):
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return list(self.utxos)
+
+
+def fetcher(*providers, **kwargs):
+    kwargs.setdefault("hedge_min_delay", 0.01)
+    kwargs.setdefault("hedge_max_delay", 0.05)
+    return HedgedUnspentFetcher(list(providers), [], **kwargs)
+
+
+class TestLatencyStats(unittest.TestCase):
+    def test_quantile(self):
+        stats = LatencyStats(window=100)
+        self.assertIsNone(stats.quantile(0.95))
+        for i in range(1, 101):
+            stats.record(i / 100)
+        self.assertEqual(stats.quantile(0.5), 0.51)
+        self.assertEqual(stats.quantile(0.95), 0.96)
+        self.assertEqual(stats.quantile(1.0), 1.0)
+
+    def test_window(self):
+        stats = LatencyStats(window=2)
+        for latency in [5.0, 1.0, 2.0]:
+            stats.record(latency)
+        self.assertEqual(len(stats), 2)
+        self.assertEqual(stats.quantile(1.0), 2.0)
+
+
+class TestUnspentProvider(unittest.TestCase):
+    def test_stats(self):
+        provider = FakeProvider("https://blockchain.info")
+        self.assertEqual(provider.name, "blockchain.info")
+        self.assertEqual(provider.get_unspent(ADDRESS), UTXOS)
+
+        provider.error = ValueError()
+        with self.assertRaises(ValueError):
+            provider.get_unspent(ADDRESS)
+
+        self.assertEqual(provider.requests, 2)
+        self.assertEqual(provider.errors, 1)
+        self.assertEqual(len(provider.latency), 1)
+
+    def test_session_timeout(self):
+        provider = UnspentProvider("http://localhost:1234", timeout=0.5)
+        response = mock.Mock(status_code=200)
+        response.json.return_value = {"unspent_outputs": []}
+
+        with mock.patch.object(provider.session, "get", return_value=response) as get:
+            self.assertEqual(provider.get_unspent(ADDRESS), [])
+        get.assert_called_once_with(
+            "http://localhost:1234/unspent", params={"active": ADDRESS}, timeout=0.5
+        )
+
+    def test_no_free_outputs(self):
+        provider = UnspentProvider("http://localhost:1234")
+        response = mock.Mock(status_code=500, text="No free outputs to spend")
+
+        with mock.patch.object(provider.session, "get", return_value=response):
+            self.assertEqual(provider.get_unspent(ADDRESS), [])
+
+    def test_tx_counts(self):
+        provider = UnspentProvider("http://localhost:1234", timeout=0.5)
+        response = mock.Mock(status_code=200)
+        response.json.return_value = {"addresses": [{"address": ADDRESS, "n_tx": 3}]}
+
+        with mock.patch.object(provider.session, "get", return_value=response) as get:
+            self.assertEqual(provider.get_tx_counts(ADDRESS), {ADDRESS: 3})
+        get.assert_called_once_with(
+            "http://localhost:1234/multiaddr",
+            params={"active": ADDRESS, "n": 0},
+            timeout=0.5,
+        )
+
+
+class TestHedgedUnspentFetcher(unittest.TestCase):
+    def test_single_provider(self):
+        primary = FakeProvider("primary")
+        self.assertEqual(fetcher(primary).get_unspent(ADDRESS), UTXOS)
+
+    def test_fast_primary(self):
+        primary = FakeProvider("primary")
+        secondary = FakeProvider("secondary", utxos=[])
+        f = fetcher(primary, secondary)
+
+        self.assertEqual(f.get_unspent(ADDRESS), UTXOS)
+        self.assertEqual(secondary.requests, 0)
+        self.assertEqual(f.hedged, 0)
+
+    def test_hedge_slow_primary(self):
+        primary = FakeProvider("primary", delay=0.5, utxos=[])
+        secondary = FakeProvider("secondary")
+        f = fetcher(primary, secondary)
+
+        started = time.monotonic()
+        self.assertEqual(f.get_unspent(ADDRESS), UTXOS)
+        self.assertLess(time.monotonic() - started, 0.4)
+        self.assertEqual(f.hedged, 1)
+
+    def test_hedge_delay(self):
+        provider = FakeProvider("primary")
+        f = fetcher(provider, hedge_min_delay=0.01, hedge_max_delay=0.5)
+        self.assertEqual(f.hedge_delay(provider), 0.5)
+
+        for latency in [0.001] * 10:
+            provider.latency.record(latency)
+        self.assertEqual(f.hedge_delay(provider), 0.01)
+
+        provider.latency.record(1.0)
+        self.assertEqual(f.hedge_delay(provider), 0.5)
+
+        for latency in [0.1] * 100:
+            provider.latency.record(latency)
+        self.assertEqual(f.hedge_delay(provider), 0.1)
+
+    def test_failover(self):
+        primary = FakeProvider("primary", error=ConnectionError())
+        secondary = FakeProvider("secondary")
+        f = fetcher(primary, secondary, hedge_max_delay=10)
+
+        started = time.monotonic()
+        self.assertEqual(f.get_unspent(ADDRESS), UTXOS)
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(f.failovers, 1)
+        self.assertEqual(f.hedged, 0)
+
+    def test_all_fail(self):
+        primary = FakeProvider("primary", error=ConnectionError("primary"))
+        secondary = FakeProvider("secondary", error=ConnectionError("secondary"))
+
+        with self.assertRaises(ConnectionError):
+            fetcher(primary, secondary).get_unspent(ADDRESS)
+        self.assertEqual(primary.errors, 1)
+        self.assertEqual(secondary.errors, 1)
+
+    def test_tx_counts_failover(self):
+        primary = FakeProvider("primary")
+        secondary = FakeProvider("secondary")
+        f = fetcher(primary, secondary)
+
+        with mock.patch.object(
+            primary, "get_tx_counts", side_effect=ConnectionError()
+        ), mock.patch.object(secondary, "get_tx_counts", return_value={ADDRESS: 1}):
+            self.assertEqual(f.get_tx_counts(ADDRESS), {ADDRESS: 1})
+        self.assertEqual(f.failovers, 1)
+
+    def test_networks(self):
+        mainnet = FakeProvider("mainnet", utxos=[])
+        testnet = FakeProvider("testnet")
+        f = HedgedUnspentFetcher([mainnet], [testnet])
+
+        self.assertEqual(f.get_unspent(ADDRESS, testnet=True), UTXOS)
+        self.assertEqual(
+            set(f.provider_stats()), {("main", "mainnet"), ("test", "testnet")}
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
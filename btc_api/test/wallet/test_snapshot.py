@@ -0,0 +1,185 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from bit.wallet import Unspent
+from app.wallet.breaker import CircuitBreaker
+from app.wallet.cache import StaleUnspentCache
+from app.wallet.snapshot import SnapshotWriter, UnspentSnapshot, write_snapshot
+from test.wallet.test_breaker import FakeClock
+from test.wallet.test_coin_select import TEST_TX_CONTEXT
+
+ADDRESS = TEST_TX_CONTEXT.address
+OTHER_ADDRESS = "1BoatSLRHtKNngkdXEeobR76b53LETtpyT"
+UTXOS = list(TEST_TX_CONTEXT.inputs)
+
+
+class SnapshotTestCase(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "utxos.snapshot")
+        self.wall_clock = FakeClock()
+        self.wall_clock.now = 1000.0
+
+    def open(self) -> UnspentSnapshot:
+        snapshot = UnspentSnapshot.open(self.path, self.wall_clock)
+        self.assertIsNotNone(snapshot)
+        self.addCleanup(snapshot.close)
+        return snapshot
+
+
+class TestUnspentSnapshot(SnapshotTestCase):
+    def test_round_trip(self):
+        malformed = Unspent(1, 1, UTXOS[0].script, "not a txid", 0)
+        entries = [
+            (False, ADDRESS, UTXOS, 5.0),
+            (True, ADDRESS, UTXOS[:1], 0.0),
+            (False, OTHER_ADDRESS, [], 1.0),
+            (False, "1Malformed", [malformed], 0.0),
+        ]
+        self.assertEqual(write_snapshot(self.path, entries, written_at=990.0), 3)
+
+        snapshot = self.open()
+        self.assertEqual(len(snapshot), 3)
+        self.assertEqual(snapshot.get((False, ADDRESS)), (UTXOS, 15.0))
+        self.assertEqual(snapshot.get((True, ADDRESS)), (UTXOS[:1], 10.0))
+        self.assertEqual(snapshot.get((False, OTHER_ADDRESS)), ([], 11.0))
+        self.assertIsNone(snapshot.get((False, "1Malformed")))
+
+        utxo = snapshot.get((False, ADDRESS))[0][0]
+        self.assertEqual(
+            (utxo.confirmations, utxo.txindex, utxo.txid),
+            (UTXOS[0].confirmations, UTXOS[0].txindex, UTXOS[0].txid),
+        )
+
+    def test_unreadable(self):
+        self.assertIsNone(UnspentSnapshot.open(self.path))
+
+        write_snapshot(self.path, [(False, ADDRESS, UTXOS, 0.0)])
+        with open(self.path, "rb") as f:
+            data = f.read()
+        for broken in [b"", data[:-1], b"X" + data[1:]]:
+            with self.subTest(size=len(broken)):
+                with open(self.path, "wb") as f:
+                    f.write(broken)
+                self.assertIsNone(UnspentSnapshot.open(self.path))
+
+
+class TestSnapshotWriter(SnapshotTestCase):
+    def setUp(self):
+        super().setUp()
+        self.clock = FakeClock()
+        self.source = mock.Mock()
+        self.source.get_unspent.return_value = UTXOS
+        breaker = CircuitBreaker("test", clock=self.clock)
+        self.cache = StaleUnspentCache(
+            self.source, breaker, max_stale=60, clock=self.clock
+        )
+        self.writer = SnapshotWriter(self.cache, self.path, wall_clock=self.wall_clock)
+
+    def test_restore(self):
+        self.cache.lookup(ADDRESS)
+        self.clock.now = 10
+        self.assertEqual(self.writer.save(), 1)
+
+        # a new process restores the set, serving it while revalidating it
+        cache = StaleUnspentCache(self.source, self.cache.breaker, max_stale=60)
+        writer = SnapshotWriter(cache, self.path, wall_clock=self.wall_clock)
+        self.assertTrue(writer.load())
+        self.addCleanup(cache.snapshot.close)
+        self.wall_clock.now += 5
+
+        with mock.patch.object(cache, "refresh") as refresh:
+            cached = cache.lookup(ADDRESS)
+        self.assertTrue(cached.stale)
+        self.assertEqual(cached.utxos, UTXOS)
+        self.assertAlmostEqual(cached.age, 15, places=1)
+        refresh.assert_called_once_with(ADDRESS, False)
+        self.assertEqual(cache.restored, 1)
+        self.source.get_unspent.assert_called_once()
+
+        # sets are restored once, not cached sets are fetched
+        cache._entries.clear()
+        self.assertFalse(cache.lookup(ADDRESS).stale)
+        self.assertEqual(cache.restored, 1)
+
+    def test_restore_concurrently(self):
+        write_snapshot(self.path, [(False, ADDRESS, UTXOS, 2.0)], self.wall_clock.now)
+        self.writer.load()
+        self.addCleanup(self.cache.snapshot.close)
+        snapshot = self.cache.snapshot
+        contains = type(snapshot).__contains__
+
+        def slow_contains(snapshot, key):
+            time.sleep(0.01)
+            return contains(snapshot, key)
+
+        key = (False, ADDRESS)
+        entries = []
+        with mock.patch.object(type(snapshot), "__contains__", slow_contains):
+            threads = [
+                threading.Thread(
+                    target=lambda: entries.append(self.cache._restore(key))
+                )
+                for _ in range(4)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        # one thread restores the set, the others find it already restored
+        self.assertEqual(self.cache.restored, 1)
+        self.assertEqual(sum(entry is not None for entry in entries), 1)
+
+    def test_restore_fresh_and_expired(self):
+        write_snapshot(
+            self.path,
+            [(False, ADDRESS, UTXOS, 2.0), (True, ADDRESS, UTXOS, 61.0)],
+            self.wall_clock.now,
+        )
+        self.cache.fresh_ttl = 5
+        self.writer.load()
+        self.addCleanup(self.cache.snapshot.close)
+
+        cached = self.cache.lookup(ADDRESS)
+        self.assertFalse(cached.stale)
+        self.assertEqual(self.cache.hits, 1)
+
+        self.cache.lookup(ADDRESS, testnet=True)
+        self.assertEqual(self.cache.restored, 1)
+        self.source.get_unspent.assert_called_once_with(ADDRESS, True)
+
+    def test_merge(self):
+        # sets saved by another worker are kept unless cached or too old
+        write_snapshot(
+            self.path,
+            [
+                (False, ADDRESS, UTXOS[:1], 1.0),
+                (False, OTHER_ADDRESS, UTXOS, 30.0),
+                (True, OTHER_ADDRESS, UTXOS, 61.0),
+            ],
+            self.wall_clock.now,
+        )
+        self.cache.lookup(ADDRESS)
+        self.assertEqual(self.writer.save(), 2)
+
+        snapshot = self.open()
+        self.assertEqual(snapshot.get((False, ADDRESS)), (UTXOS, 0.0))
+        self.assertEqual(snapshot.get((False, OTHER_ADDRESS)), (UTXOS, 30.0))
+        self.assertNotIn((True, OTHER_ADDRESS), snapshot)
+
+    def test_disabled(self):
+        writer = SnapshotWriter(self.cache, "")
+        self.assertFalse(writer.enabled)
+        self.assertFalse(writer.load())
+        writer.start()
+        self.assertIsNone(writer._thread)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,156 @@
+import unittest
+
+from bit.transaction import address_to_scriptpubkey
+from bit.wallet import Unspent
+
+from app.wallet.cache import CachedUnspents
+from app.wallet.query import ADDRESS_SEPARATOR
+from app.wallet.sources import UnspentFanout, derive_address
+from app.wallet.xpub import ExtendedPublicKey, EXTERNAL_CHAIN, INTERNAL_CHAIN
+from test.wallet.test_xpub import XPUB_0H
+
+XPUB = ExtendedPublicKey.from_string(XPUB_0H)
+
+
+def utxo(address, n, amount=10000):
+    script = address_to_scriptpubkey(address).hex()
+    return Unspent(amount, 6, script, f"{n:064x}", 0)
+
+
+class FakeSource:
+    """Answers batched lookups from UTXOs keyed by address."""
+
+    def __init__(self, utxos, stale=(), cached=()):
+        self.utxos = utxos
+        self.stale = stale
+        self.cached_addresses = cached
+        self.batches = []
+
+    def _lookup(self, address):
+        stale = address in self.stale
+        return CachedUnspents(
+            list(self.utxos.get(address, [])), age=10 if stale else 0, stale=stale
+        )
+
+    def cached(self, addresses, testnet=False):
+        return {a: self._lookup(a) for a in addresses if a in self.cached_addresses}
+
+    def lookup_many(self, batch, testnet=False):
+        self.batches.append(ADDRESS_SEPARATOR.join(batch))
+        return {a: self._lookup(a) for a in batch}
+
+
+class TestUnspentFanout(unittest.TestCase):
+    def setUp(self):
+        self.addresses = [derive_address(XPUB, EXTERNAL_CHAIN, i) for i in range(5)]
+
+    def test_fetch_batches(self):
+        utxos = {
+            address: [utxo(address, i)] for i, address in enumerate(self.addresses)
+        }
+        source = FakeSource(utxos)
+        fanout = UnspentFanout(source, batch_size=2)
+
+        unspents = fanout.fetch(self.addresses + self.addresses[:1])
+        self.assertEqual(
+            sorted(source.batches),
+            sorted(
+                ADDRESS_SEPARATOR.join(self.addresses[i : i + 2])
+                for i in range(0, 5, 2)
+            ),
+        )
+        self.assertEqual(len(unspents.utxos), 5)
+        for address in self.addresses:
+            self.assertEqual(unspents.owner(utxos[address][0]), address)
+        self.assertFalse(unspents.stale)
+        self.assertIsNone(unspents.change_address)
+
+    def test_fetch_stale(self):
+        source = FakeSource({}, stale=self.addresses[2:3])
+
+        unspents = UnspentFanout(source, batch_size=2).fetch(self.addresses)
+        self.assertTrue(unspents.stale)
+        self.assertEqual(unspents.age, 10)
+
+    def test_fetch_cached(self):
+        utxos = {address: [utxo(address, 1)] for address in self.addresses}
+        source = FakeSource(utxos, cached=self.addresses[1:3])
+
+        unspents = UnspentFanout(source, batch_size=2).fetch(self.addresses)
+        self.assertEqual(
+            source.batches,
+            [
+                ADDRESS_SEPARATOR.join([self.addresses[0], self.addresses[3]]),
+                self.addresses[4],
+            ],
+        )
+        self.assertEqual(len(unspents.utxos), 5)
+
+    def test_fetch_single_address(self):
+        address = self.addresses[0]
+        source = FakeSource({address: [utxo(address, 1)]})
+
+        unspents = UnspentFanout(source).fetch([address])
+        self.assertEqual(source.batches, [address])
+        self.assertEqual(len(unspents.utxos), 1)
+
+    def test_discover(self):
+        used = [
+            (EXTERNAL_CHAIN, 0),
+            (EXTERNAL_CHAIN, 25),
+            (INTERNAL_CHAIN, 2),
+        ]
+        utxos = {}
+        for n, (chain, index) in enumerate(used):
+            address = derive_address(XPUB, chain, index)
+            utxos[address] = [utxo(address, n)]
+        source = FakeSource(utxos)
+
+        unspents = UnspentFanout(source, batch_size=50).discover(XPUB, gap_limit=20)
+        self.assertEqual(len(unspents.utxos), 3)
+        for chain, index in used:
+            address = derive_address(XPUB, chain, index)
+            self.assertEqual(unspents.path(address), f"m/{chain}/{index}")
+        self.assertEqual(
+            unspents.change_address, derive_address(XPUB, INTERNAL_CHAIN, 3)
+        )
+        # 3 windows of 20 addresses of the external chain, 2 of the internal
+        # chain (both chains are scanned in the same rounds)
+        self.assertEqual(len(source.batches), 3)
+        self.assertEqual(len(unspents.paths), 100)
+
+    def test_discover_history(self):
+        change = [derive_address(XPUB, INTERNAL_CHAIN, i) for i in range(8)]
+        source = FakeSource({change[2]: [utxo(change[2], 1)]})
+        # change addresses 3 to 5 were spent from completely
+        counts = {address: 2 for address in change[:6]}
+        lookups = []
+
+        def history(addresses, testnet=False):
+            lookups.append(addresses)
+            return {a: counts.get(a, 0) for a in addresses.split(ADDRESS_SEPARATOR)}
+
+        fanout = UnspentFanout(source, batch_size=2, history=history)
+        unspents = fanout.discover(XPUB, gap_limit=5)
+        self.assertEqual(unspents.change_address, change[6])
+        self.assertEqual(
+            lookups,
+            [ADDRESS_SEPARATOR.join(change[i : i + 2]) for i in range(3, 7, 2)],
+        )
+
+    def test_next_unused_without_history(self):
+        fanout = UnspentFanout(FakeSource({}))
+        self.assertEqual(fanout.next_unused(XPUB, INTERNAL_CHAIN, 3), 3)
+
+    def test_discover_max_addresses(self):
+        address = derive_address(XPUB, EXTERNAL_CHAIN, 9)
+        source = FakeSource({address: [utxo(address, 1)]})
+
+        fanout = UnspentFanout(source, max_addresses=25)
+        unspents = fanout.discover(XPUB, gap_limit=10)
+        self.assertEqual(len(unspents.paths), 25)
+        self.assertEqual(len(unspents.utxos), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
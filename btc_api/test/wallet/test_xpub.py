@@ -0,0 +1,45 @@
+import unittest
+from dataclasses import replace
+
+from app.wallet.xpub import ExtendedPublicKey, HARDENED_INDEX
+
+# BIP32 test vector 1: m/0H and m/0H/1
+XPUB_0H = "xpub68Gmy5EdvgibQVfPdqkBBCHxA5htiqg55crXYuXoQRKfDBFA1WEjWgP6LHhwBZeNK1VTsfTFUHCdrfp1bgwQ9xv5ski8PX9rL2dZXvgGDnw"
+XPUB_0H_1 = "xpub6ASuArnXKPbfEwhqN6e3mwBcDTgzisQN1wXN9BJcM47sSikHjJf3UFHKkNAWbWMiGj7Wf5uMash7SyYq527Hqck2AxYysAA7xmALppuCkwQ"
+XPRV_0H = "xprv9uHRZZhk6KAJC1avXpDAp4MDc3sQKNxDiPvvkX8Br5ngLNv1TxvUxt4cV1rGL5hj6KCesnDYUhd7oWgT11eZG7XnxHrnYeSvkzY7d2bhkJ7"
+
+
+class TestExtendedPublicKey(unittest.TestCase):
+    def test_parse(self):
+        xpub = ExtendedPublicKey.from_string(XPUB_0H)
+        self.assertEqual(xpub.network, "main")
+        self.assertEqual(xpub.depth, 1)
+        self.assertEqual(xpub.child_number, HARDENED_INDEX)
+        self.assertEqual(xpub.to_string(), XPUB_0H)
+
+    def test_child(self):
+        xpub = ExtendedPublicKey.from_string(XPUB_0H)
+        self.assertEqual(xpub.child(1).to_string(), XPUB_0H_1)
+
+    def test_address(self):
+        xpub = ExtendedPublicKey.from_string(XPUB_0H)
+        self.assertEqual(xpub.address(), "19Q2WoS5hSS6T8GjhK8KZLMgmWaq4neXrh")
+
+        tpub = ExtendedPublicKey.from_string(replace(xpub, network="test").to_string())
+        self.assertEqual(tpub.network, "test")
+        self.assertIn(tpub.address()[0], "mn")
+
+    def test_invalid(self):
+        for xpub in [XPRV_0H, XPUB_0H[:-1] + "x", "abc"]:
+            with self.subTest(xpub=xpub):
+                with self.assertRaises(ValueError):
+                    ExtendedPublicKey.from_string(xpub)
+
+    def test_hardened_child(self):
+        xpub = ExtendedPublicKey.from_string(XPUB_0H)
+        with self.assertRaises(ValueError):
+            xpub.child(HARDENED_INDEX)
+
+
+if __name__ == "__main__":
+    unittest.main()